@@ -0,0 +1,67 @@
+import argparse
+import logging
+import os
+import sys
+
+from core import config
+from core.batch_job import run_batch
+from core.prompt_builder import get_prompt_registry
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Generate OLAT questions for a whole folder of PDF/DOCX/image files. "
+                    "Rerun the same command to resume an interrupted or still running job."
+    )
+    parser.add_argument("input_dir", help="Folder with the course materials (searched recursively).")
+    parser.add_argument("-o", "--output-dir", required=True, help="Folder for the OLAT exports and the job state.")
+    parser.add_argument("-t", "--types", nargs="+", choices=config.MESSAGE_TYPES,
+                        help="Question types to generate (default: all types with a prompt template).")
+    parser.add_argument("--language", default="German", help="Output language (default: German).")
+    parser.add_argument("--learning-goals", default="", help="Learning goals passed with every request.")
+    parser.add_argument("--model", default=config.DEFAULT_MODEL_NAME, help=f"Model name (default: {config.DEFAULT_MODEL_NAME}).")
+    parser.add_argument("--mode", choices=["api", "local"], default="api",
+                        help="'api' uses the OpenAI Batch endpoint, 'local' a local worker pool "
+                             "(e.g. with OPENAI_BASE_URL pointing at a stand-in server).")
+    parser.add_argument("--workers", type=int, default=config.MAX_CONCURRENT_REQUESTS, help="Worker pool size for --mode local.")
+    parser.add_argument("--no-wait", action="store_true", help="Submit the batch and exit instead of waiting for it.")
+    parser.add_argument("--poll-interval", type=int, default=30, help="Seconds between batch status checks.")
+    parser.add_argument("--formats", nargs="+", default=["txt"], choices=config.EXPORT_FORMATS,
+                        help="Export formats: OLAT text, zip with one file per type, QTI 2.1 package (default: txt).")
+    parser.add_argument("--cascade", action="store_true",
+                        help=f"With --mode local: generate on {config.CASCADE_MODEL_NAME} first and use --model only "
+                             "for question types whose output fails validation.")
+    parser.add_argument("--regenerate", action="store_true", help="Ignore cached responses.")
+    parser.add_argument("--api-key", default=os.environ.get("OPENAI_API_KEY"), help="OpenAI API key (default: $OPENAI_API_KEY).")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not args.api_key:
+        logging.error("No API key given. Use --api-key or set OPENAI_API_KEY.")
+        return 2
+
+    exports = run_batch(
+        input_dir=args.input_dir,
+        output_dir=args.output_dir,
+        selected_types=args.types or get_prompt_registry().available(),
+        api_key=args.api_key,
+        learning_goals=args.learning_goals,
+        language=args.language,
+        model_name=args.model,
+        mode=args.mode,
+        wait=not args.no_wait,
+        poll_interval=args.poll_interval,
+        max_workers=args.workers,
+        use_cache=not args.regenerate,
+        export_formats=args.formats,
+        cascade=args.cascade
+    )
+    for path in exports:
+        print(path)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1 @@
+# Benchmark suite; run benchmarks/run_benchmarks.py
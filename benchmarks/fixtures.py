@@ -0,0 +1,163 @@
+"""
+Synthetic, deterministic benchmark inputs.
+
+Fixtures are generated from a fixed seed and written once to FIXTURE_DIR, keyed by their
+parameters, so repeated runs (and runs on other machines) measure identical inputs.
+"""
+import io
+import json
+import os
+import random
+
+from PIL import Image, ImageDraw
+
+FIXTURE_DIR = os.path.join(".cache", "benchmarks")
+
+_WORDS = (
+    "Zelle Membran Energie Prozess Funktion Struktur Umwelt Wirkung Methode Analyse System "
+    "Theorie Beispiel Ursache Entwicklung Vergleich Modell Faktor Ergebnis Begriff Gesellschaft "
+    "Markt Preis Nachfrage Angebot Vertrag Recht Pflicht Kapital Arbeit Wissen Sprache"
+).split()
+
+
+def _sentence(rng, words=12):
+    return " ".join(rng.choice(_WORDS) for _ in range(words)).capitalize() + "."
+
+
+def _fixture_path(name):
+    os.makedirs(FIXTURE_DIR, exist_ok=True)
+    return os.path.join(FIXTURE_DIR, name)
+
+
+def _cached(name, build):
+    """Returns the bytes of fixture 'name', building and storing it on first use."""
+    path = _fixture_path(name)
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            return f.read()
+    data = build()
+    with open(path, "wb") as f:
+        f.write(data)
+    return data
+
+
+def _pdf_escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def build_text_pdf(pages, lines_per_page=50, seed=1):
+    """A PDF with real text content (Helvetica, A4), 'lines_per_page' sentences per page."""
+    rng = random.Random(seed)
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None, # Page tree, filled in once the page object numbers are known
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+    ]
+    page_refs = []
+    for _ in range(pages):
+        lines = [f"({_pdf_escape(_sentence(rng))}) Tj T*" for _ in range(lines_per_page)]
+        stream = ("BT /F1 10 Tf 14 TL 50 800 Td\n" + "\n".join(lines) + "\nET").encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        content_ref = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_ref
+        )
+        page_refs.append(len(objects))
+    kids = " ".join(f"{ref} 0 R" for ref in page_refs).encode("ascii")
+    objects[1] = b"<< /Type /Pages /Kids [" + kids + b"] /Count %d >>" % pages
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+    xref_offset = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    for offset in offsets:
+        out.write(b"%010d 00000 n \n" % offset)
+    out.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref_offset))
+    return out.getvalue()
+
+
+def build_page_image(rng, size=(1240, 1754), lines=45):
+    """A grayscale 'scanned' A4 page (150 DPI) with lines of text and a little noise."""
+    img = Image.new("L", size, 250)
+    draw = ImageDraw.Draw(img)
+    for index in range(lines):
+        draw.text((100, 120 + index * 34), _sentence(rng, 14), fill=20)
+    for _ in range(400):
+        x, y = rng.randrange(size[0]), rng.randrange(size[1])
+        draw.point((x, y), fill=rng.randrange(120, 220))
+    return img
+
+
+def build_scanned_pdf(pages, seed=2):
+    """An image-only PDF, as produced by a scanner: no extractable text."""
+    rng = random.Random(seed)
+    images = [build_page_image(rng) for _ in range(pages)]
+    out = io.BytesIO()
+    images[0].save(out, format="PDF", save_all=True, append_images=images[1:], resolution=150)
+    return out.getvalue()
+
+
+def build_docx(paragraphs, seed=3):
+    """A large DOCX with headings every 20 paragraphs and a table every 50."""
+    import docx
+    rng = random.Random(seed)
+    document = docx.Document()
+    for index in range(paragraphs):
+        if index % 20 == 0:
+            document.add_heading(_sentence(rng, 4), level=1 + (index // 20) % 2)
+        document.add_paragraph(" ".join(_sentence(rng) for _ in range(4)))
+        if index % 50 == 49:
+            table = document.add_table(rows=4, cols=3)
+            for cell in table._cells:
+                cell.text = _sentence(rng, 3)
+    out = io.BytesIO()
+    document.save(out)
+    return out.getvalue()
+
+
+def build_inline_fib_json(items, blanks_per_item=4, seed=4):
+    """An inline_fib response with 'items' questions, as the model returns it (a JSON array)."""
+    rng = random.Random(seed)
+    data = []
+    for _ in range(items):
+        blanks = rng.sample(_WORDS, blanks_per_item)
+        sentences = [_sentence(rng, 8) for _ in range(3)]
+        text = " ".join(sentences) + " " + " ".join(f"Das Stichwort ist {blank}." for blank in blanks)
+        data.append({
+            "text": text,
+            "blanks": blanks,
+            "wrong_substitutes": rng.sample([w for w in _WORDS if w not in blanks], 3),
+        })
+    return json.dumps(data, ensure_ascii=False, indent=2).encode("utf-8")
+
+
+def text_pdf(pages):
+    return _cached(f"text_{pages}p.pdf", lambda: build_text_pdf(pages))
+
+
+def scanned_pdf(pages):
+    return _cached(f"scanned_{pages}p.pdf", lambda: build_scanned_pdf(pages))
+
+
+def large_docx(paragraphs):
+    return _cached(f"document_{paragraphs}par.docx", lambda: build_docx(paragraphs))
+
+
+def inline_fib_json(items):
+    return _cached(f"inline_fib_{items}.json", lambda: build_inline_fib_json(items)).decode("utf-8")
+
+
+def page_images(count, seed=5):
+    """PNG-encoded page images for the image encoding benchmark (not cached on disk; cheap to build)."""
+    rng = random.Random(seed)
+    encoded = []
+    for _ in range(count):
+        out = io.BytesIO()
+        build_page_image(rng).convert("RGB").save(out, format="PNG")
+        encoded.append(out.getvalue())
+    return encoded
@@ -0,0 +1,250 @@
+"""
+Benchmarks for the file-processing and output-formatting hot paths.
+
+Every case runs in a fresh interpreter so its peak RSS is not inflated by earlier cases.
+Results are written as JSON; the run fails (exit code 1) if a case misses the thresholds
+in benchmarks/thresholds.json or, with --baseline, regresses against an earlier result file.
+
+    python benchmarks/run_benchmarks.py --scale quick
+    python benchmarks/run_benchmarks.py --baseline .cache/benchmarks/results-full.json
+"""
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import platform
+import statistics
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from benchmarks import fixtures # noqa: E402
+
+THRESHOLDS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "thresholds.json")
+
+# Fixture sizes per scale: 'full' is what the thresholds are calibrated for, 'quick' is a smoke run
+SCALES = {
+    "quick": {"text_pdf_pages": 30, "scanned_pdf_pages": 4, "docx_paragraphs": 300, "images": 4, "fib_items": 500},
+    "full": {"text_pdf_pages": 300, "scanned_pdf_pages": 20, "docx_paragraphs": 3000, "images": 16, "fib_items": 5000},
+}
+
+
+def _peak_rss_mb():
+    """Peak resident set size of this process in MB, or None where the resource module is missing."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _clear(*cached_functions):
+    for cached_function in cached_functions:
+        cached_function.clear()
+
+
+# --- cases ---------------------------------------------------------------------------
+# Each setup function gets the scale parameters and returns (run, reset, units, unit):
+# run() is timed, reset() (untimed) clears caches so every repeat measures the cold path.
+
+def setup_pdf_text(params):
+    from core import file_processor, pdf_text
+    data = fixtures.text_pdf(params["text_pdf_pages"])
+    run = lambda: file_processor.extract_text_from_pdf(io.BytesIO(data))
+    reset = pdf_text.clear_cache # The worker pool stays up between repeats, as in the app
+    return run, reset, params["text_pdf_pages"], "pages"
+
+
+def setup_pdf_rasterize(params):
+    from core import config, file_processor, image_pipeline
+    config.IMAGE_CACHE_DIR = None # Measure the encoding, not the disk cache
+    data = fixtures.scanned_pdf(params["scanned_pdf_pages"])
+    run = lambda: file_processor.convert_pdf_to_images(data)
+    def reset():
+        _clear(file_processor.convert_pdf_to_images)
+        image_pipeline.clear_cache()
+    return run, reset, params["scanned_pdf_pages"], "pages"
+
+
+def setup_docx_text(params):
+    from core import file_processor
+    data = fixtures.large_docx(params["docx_paragraphs"])
+    run = lambda: file_processor.extract_text_from_docx(io.BytesIO(data))
+    reset = lambda: _clear(file_processor.extract_text_from_docx)
+    return run, reset, params["docx_paragraphs"], "paragraphs"
+
+
+def setup_docx_text_python_docx(params):
+    """The previous python-docx path (full object tree, body paragraphs only), for comparison."""
+    import docx
+    data = fixtures.large_docx(params["docx_paragraphs"])
+    run = lambda: "\n".join(paragraph.text for paragraph in docx.Document(io.BytesIO(data)).paragraphs).strip()
+    return run, lambda: None, params["docx_paragraphs"], "paragraphs"
+
+
+def setup_image_encode(params):
+    from core import config, image_pipeline
+    config.IMAGE_CACHE_DIR = None # Measure the encoding, not the disk cache
+    images = fixtures.page_images(params["images"])
+    run = lambda: [image_pipeline.prepare_image_for_api(image) for image in images]
+    reset = image_pipeline.clear_cache
+    return run, reset, params["images"], "images"
+
+
+def setup_clean_json(params):
+    from core.output_frontmatter import clean_json_string
+    # Typical model slips: a code fence around the array and a trailing comma
+    payload = "```json\n" + fixtures.inline_fib_json(params["fib_items"]).rstrip("]") + ",]\n```"
+    return lambda: clean_json_string(payload), lambda: None, params["fib_items"], "items"
+
+
+def setup_convert_fib(params):
+    from core.output_frontmatter import convert_json_to_text_format
+    payload = fixtures.inline_fib_json(params["fib_items"])
+    return lambda: convert_json_to_text_format(payload), lambda: None, params["fib_items"], "items"
+
+
+CASES = {
+    "extract_text_from_pdf": setup_pdf_text,
+    "convert_pdf_to_images": setup_pdf_rasterize,
+    "extract_text_from_docx": setup_docx_text,
+    "extract_text_from_docx_python_docx": setup_docx_text_python_docx,
+    "prepare_image_for_api": setup_image_encode,
+    "clean_json_string": setup_clean_json,
+    "convert_json_to_text_format": setup_convert_fib,
+}
+
+
+def _run_case(name, params, repeats, results_queue):
+    """Child process entry point: measures one case and puts its result dict on the queue."""
+    try:
+        run, reset, units, unit = CASES[name](params)
+        rss_before = _peak_rss_mb()
+        timings = []
+        for _ in range(repeats):
+            reset()
+            start = time.perf_counter()
+            run()
+            timings.append(time.perf_counter() - start)
+        rss_peak = _peak_rss_mb()
+        median = statistics.median(timings)
+        results_queue.put({
+            "status": "ok",
+            "repeats": repeats,
+            "seconds_median": round(median, 6),
+            "seconds_min": round(min(timings), 6),
+            "units": units,
+            "unit": unit,
+            "throughput": round(units / median, 3) if median else None,
+            "peak_rss_mb": round(rss_peak, 1) if rss_peak is not None else None,
+            "rss_growth_mb": round(rss_peak - rss_before, 1) if rss_peak is not None else None,
+        })
+    except Exception as e:
+        results_queue.put({"status": "error", "error": f"{type(e).__name__}: {e}"})
+
+
+def run_case(name, params, repeats):
+    context = multiprocessing.get_context("spawn") # Fresh interpreter: isolated peak RSS
+    results_queue = context.Queue()
+    process = context.Process(target=_run_case, args=(name, params, repeats, results_queue))
+    process.start()
+    result = results_queue.get()
+    process.join()
+    return result
+
+
+def check_thresholds(results, thresholds):
+    """Returns a list of human-readable threshold violations."""
+    problems = []
+    for name, limits in thresholds.items():
+        result = results.get(name)
+        if not result or result["status"] != "ok":
+            continue
+        if "min_throughput" in limits and result["throughput"] < limits["min_throughput"]:
+            problems.append(f"{name}: {result['throughput']} {result['unit']}/s is below the minimum of {limits['min_throughput']}")
+        if "max_peak_rss_mb" in limits and result["peak_rss_mb"] is not None and result["peak_rss_mb"] > limits["max_peak_rss_mb"]:
+            problems.append(f"{name}: peak RSS {result['peak_rss_mb']} MB exceeds {limits['max_peak_rss_mb']} MB")
+    return problems
+
+
+def compare_baseline(results, baseline, tolerance):
+    """Returns regressions of more than 'tolerance' (a fraction) in throughput or peak RSS against a baseline run."""
+    problems = []
+    for name, previous in baseline.get("results", {}).items():
+        current = results.get(name)
+        if not current or current["status"] != "ok" or previous.get("status") != "ok":
+            continue
+        if previous["throughput"] and current["throughput"] < previous["throughput"] * (1 - tolerance):
+            problems.append(f"{name}: throughput fell from {previous['throughput']} to {current['throughput']} {current['unit']}/s")
+        if previous["peak_rss_mb"] and current["peak_rss_mb"] and current["peak_rss_mb"] > previous["peak_rss_mb"] * (1 + tolerance):
+            problems.append(f"{name}: peak RSS grew from {previous['peak_rss_mb']} to {current['peak_rss_mb']} MB")
+    return problems
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the file-processing and output-formatting hot paths.")
+    parser.add_argument("cases", nargs="*", metavar="case",
+                        help=f"Cases to run (default: all): {', '.join(CASES)}.")
+    parser.add_argument("--scale", choices=list(SCALES), default="full", help="Fixture size (default: full).")
+    parser.add_argument("--repeats", type=int, default=3, help="Timed repetitions per case (the median is reported).")
+    parser.add_argument("-o", "--output", help="Result file (default: .cache/benchmarks/results-<scale>.json).")
+    parser.add_argument("--baseline", help="Earlier result file to compare against.")
+    parser.add_argument("--tolerance", type=float, default=0.15,
+                        help="Allowed relative regression against --baseline (default: 0.15).")
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.cases if name not in CASES]
+    if unknown:
+        parser.error(f"unknown case(s): {', '.join(unknown)}")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    os.chdir(ROOT_DIR) # Fixtures and caches live relative to the project root
+    params = SCALES[args.scale]
+    names = args.cases or list(CASES)
+
+    results = {}
+    for name in names:
+        result = run_case(name, params, args.repeats)
+        results[name] = result
+        if result["status"] == "ok":
+            print(f"{name:<30} {result['seconds_median']:>9.3f}s {result['throughput']:>12.1f} {result['unit']}/s"
+                  f" {result['peak_rss_mb'] or 0:>8.1f} MB peak")
+        else:
+            print(f"{name:<30} ERROR {result['error']}")
+
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "scale": args.scale,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "params": params,
+        "results": results,
+    }
+    output = args.output or os.path.join(fixtures.FIXTURE_DIR, f"results-{args.scale}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+    with open(THRESHOLDS_PATH, "r", encoding="utf-8") as f:
+        problems = check_thresholds(results, json.load(f).get(args.scale, {}))
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            problems += compare_baseline(results, json.load(f), args.tolerance)
+    problems += [f"{name}: {result['error']}" for name, result in results.items() if result["status"] != "ok"]
+    for problem in problems:
+        print(f"FAILED {problem}")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,179 @@
+"""
+Cold-start measurement of the Streamlit app.
+
+Imports the app module (benchmarks/startup_budget.json: 'target') in fresh interpreters and
+reports the median import time, the slowest top-level imports (python -X importtime) and what
+the deferred modules cost on first use. The run fails (exit code 1) if the import exceeds
+'max_import_seconds', if one of the 'deferred_modules' is imported at startup (an import attempt
+counts too, so a module that is not installed here cannot hide an eager import) or, with
+--baseline, if the import time regressed against an earlier result file.
+
+    python benchmarks/startup_time.py
+    python benchmarks/startup_time.py --baseline .cache/benchmarks/startup.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from benchmarks import fixtures # noqa: E402
+
+BUDGET_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "startup_budget.json")
+
+# Runs in the child interpreter: times the imports, lists the loaded top-level packages and
+# records every attempt to import a deferred module, whether or not it is installed
+_IMPORT_SCRIPT = """
+import importlib, importlib.util, json, sys, time
+deferred = set({deferred!r})
+unavailable = sorted(name for name in deferred if importlib.util.find_spec(name) is None)
+attempted = set()
+
+class DeferredImportWatcher:
+    def find_spec(self, name, path=None, target=None):
+        if name.split(".")[0] in deferred:
+            attempted.add(name.split(".")[0])
+        return None # Leave the actual import to the regular finders
+
+sys.meta_path.insert(0, DeferredImportWatcher())
+start = time.perf_counter()
+importlib.import_module({target!r})
+elapsed = time.perf_counter() - start
+attempted_at_startup = sorted(attempted)
+first_use_start = time.perf_counter()
+if {first_use!r}:
+    importlib.import_module({first_use!r})
+print(json.dumps({{
+    "seconds": elapsed,
+    "first_use_seconds": time.perf_counter() - first_use_start,
+    "packages": sorted({{name.split(".")[0] for name in sys.modules}}),
+    "deferred_imported": attempted_at_startup,
+    "deferred_unavailable": unavailable,
+}}))
+"""
+
+
+def _run_child(target, first_use=None, importtime=False, deferred=()):
+    """Imports 'target' (then 'first_use') in a fresh interpreter; returns (result dict, importtime stderr)."""
+    command = [sys.executable]
+    if importtime:
+        command += ["-X", "importtime"]
+    command += ["-c", _IMPORT_SCRIPT.format(target=target, first_use=first_use, deferred=sorted(deferred))]
+    completed = subprocess.run(command, cwd=ROOT_DIR, capture_output=True, text=True)
+    if completed.returncode != 0:
+        error = completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else f"exit code {completed.returncode}"
+        raise RuntimeError(f"importing {target} failed: {error}")
+    return json.loads(completed.stdout.strip().splitlines()[-1]), completed.stderr
+
+
+def parse_importtime(stderr, top=15, max_depth=2):
+    """
+    The 'top' slowest imports from python -X importtime output, as (module, cumulative seconds).
+    Only imports up to 'max_depth' levels deep are listed (1: top level, 2: what those import).
+    """
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, module = line[len("import time:"):].split("|")
+        depth = (len(module) - len(module.lstrip(" ")) + 1) // 2 # importtime indents two spaces per level
+        if depth > max_depth:
+            continue
+        entries.append((module.strip(), int(cumulative) / 1e6))
+    return sorted(entries, key=lambda entry: entry[1], reverse=True)[:top]
+
+
+def measure(budget, repeats):
+    target = budget["target"]
+    deferred = budget.get("deferred_modules", [])
+    timings = []
+    for _ in range(repeats):
+        startup, _ = _run_child(target, deferred=deferred)
+        timings.append(startup["seconds"])
+    _, importtime_output = _run_child(target, importtime=True)
+
+    first_use = {}
+    for name, module in budget.get("first_use", {}).items():
+        try:
+            result, _ = _run_child(target, first_use=module)
+            first_use[name] = round(result["first_use_seconds"], 4)
+        except RuntimeError as e: # e.g. an optional dependency missing here; not a startup problem
+            first_use[name] = str(e)
+
+    return {
+        "target": target,
+        "repeats": repeats,
+        "seconds_median": round(statistics.median(timings), 4),
+        "seconds_min": round(min(timings), 4),
+        "slowest_imports": [{"module": module, "seconds": round(seconds, 4)} for module, seconds in parse_importtime(importtime_output)],
+        "loaded_deferred_modules": startup["deferred_imported"],
+        "unavailable_deferred_modules": startup["deferred_unavailable"], # Not installed here: only import attempts are seen
+        "first_use_seconds": first_use,
+    }
+
+
+def check_budget(result, budget):
+    """Returns a list of human-readable budget violations."""
+    problems = []
+    if result["seconds_median"] > budget["max_import_seconds"]:
+        problems.append(f"importing {result['target']} took {result['seconds_median']}s, budget is {budget['max_import_seconds']}s")
+    for name in result["loaded_deferred_modules"]:
+        not_installed = " (attempted; not installed here)" if name in result.get("unavailable_deferred_modules", []) else ""
+        problems.append(f"{name} is imported at startup{not_installed} but should be deferred until first use")
+    return problems
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Measure the cold-start import time of the app.")
+    parser.add_argument("--repeats", type=int, default=5, help="Fresh interpreters to time (the median is reported).")
+    parser.add_argument("-o", "--output", help="Result file (default: .cache/benchmarks/startup.json).")
+    parser.add_argument("--baseline", help="Earlier result file to compare against.")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Allowed relative regression against --baseline (default: 0.25).")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    os.chdir(ROOT_DIR)
+    with open(BUDGET_PATH, "r", encoding="utf-8") as f:
+        budget = json.load(f)
+
+    try:
+        result = measure(budget, args.repeats)
+    except RuntimeError as e:
+        print(f"FAILED {e}")
+        return 1
+
+    print(f"import {result['target']}: {result['seconds_median']:.3f}s median ({result['seconds_min']:.3f}s min)")
+    for entry in result["slowest_imports"]:
+        print(f"  {entry['module']:<40} {entry['seconds']:>8.3f}s")
+    for name, seconds in result["first_use_seconds"].items():
+        print(f"first use of {name:<28} " + (f"{seconds:>8.3f}s" if isinstance(seconds, float) else seconds))
+
+    report = {"created_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": sys.version.split()[0], **result}
+    output = args.output or os.path.join(fixtures.FIXTURE_DIR, "startup.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+    problems = check_budget(result, budget)
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            previous = json.load(f)
+        if result["seconds_median"] > previous["seconds_median"] * (1 + args.tolerance):
+            problems.append(f"import time grew from {previous['seconds_median']}s to {result['seconds_median']}s")
+    for problem in problems:
+        print(f"FAILED {problem}")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,339 @@
+"""
+Headless batch generation: walks a folder of course materials, builds one request per
+file (or PDF page) and question type, runs them through the OpenAI Batch API or a local
+worker pool, and collects the results into one OLAT text export per source file.
+
+All progress lives in '<output_dir>/batch_state.json', so an interrupted job can be
+resumed by running the same command again.
+"""
+import io
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from . import config, tracing
+from .file_processor import extract_text_from_docx, process_uploaded_pdf
+from .image_pipeline import prepare_image_for_api
+from .prompt_builder import get_prompt_registry, build_user_prompt
+from .output_frontmatter import process_response, merge_chunk_responses
+from .chunker import split_text_into_chunks
+from .exporter import ExportWriter, EXPORT_FILE_SUFFIXES
+from .llm_service import generate_via_llm, build_llm_settings
+from .cascade import generate_with_cascade, get_cascade_stats
+from .response_cache import get_response_cache, make_cache_key
+
+SUPPORTED_EXTENSIONS = {".pdf", ".docx", ".jpg", ".jpeg", ".png"}
+STATE_FILENAME = "batch_state.json"
+BATCH_INPUT_FILENAME = "batch_input.jsonl"
+
+
+def discover_files(input_dir):
+    """Returns all supported course-material files below input_dir, in a stable order."""
+    found = []
+    for root, dirs, files in os.walk(input_dir):
+        dirs.sort()
+        for name in sorted(files):
+            if os.path.splitext(name)[1].lower() in SUPPORTED_EXTENSIONS:
+                found.append(os.path.join(root, name))
+    return found
+
+
+def load_file_inputs(path):
+    """
+    Extracts the generation inputs of one file, mirroring the upload handling of the UI.
+    Returns a list of (page_number, text, images_base64_list); page_number is None
+    unless a PDF had to be rasterized, in which case there is one entry per page.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    with open(path, "rb") as f:
+        file_bytes = f.read()
+
+    if extension == ".pdf":
+        text_content, images = process_uploaded_pdf(io.BytesIO(file_bytes))
+        if text_content:
+            # Mixed PDFs carry their scanned pages along as images
+            return [(None, text_content, [prepare_image_for_api(image) for image in images or []] or None)]
+        return [(idx + 1, "", [prepare_image_for_api(image)]) for idx, image in enumerate(images or [])]
+    if extension == ".docx":
+        return [(None, extract_text_from_docx(io.BytesIO(file_bytes)), None)]
+    return [(None, "", [prepare_image_for_api(file_bytes)])]
+
+
+def build_jobs(input_dir, selected_types, learning_goals, language, model_name):
+    """
+    Builds the request list (file x page x question type) for every file in input_dir.
+    Question types without a usable prompt template are skipped with a warning.
+    """
+    registry = get_prompt_registry()
+    templates = {}
+    for msg_type in selected_types:
+        template = registry.get(msg_type)
+        if template is None:
+            logging.warning(f"Skipping {msg_type}: {registry.problems.get(msg_type, f'prompt file {msg_type}.md not found.')}")
+            continue
+        templates[msg_type] = template.content
+    if not templates:
+        raise ValueError(f"No prompt template found for {', '.join(selected_types)}.")
+    selected_types = list(templates)
+
+    jobs = []
+    for file_index, path in enumerate(discover_files(input_dir)):
+        try:
+            file_inputs = load_file_inputs(path)
+        except Exception as e:
+            logging.error(f"Skipping {path}: {e}")
+            continue
+        if not file_inputs:
+            logging.warning(f"Skipping {path}: no text or images could be extracted.")
+            continue
+        for page_number, text, images_base64_list in file_inputs:
+            # Long documents are generated per chunk and merged again in write_exports
+            chunks = split_text_into_chunks(text, config.CHUNK_MAX_INPUT_TOKENS) or [text]
+            for chunk_index, chunk in enumerate(chunks):
+                for msg_type in selected_types:
+                    jobs.append({
+                        "custom_id": f"f{file_index}-p{page_number or 0}-c{chunk_index}-{msg_type}",
+                        "source": os.path.relpath(path, input_dir),
+                        "page": page_number,
+                        "chunk": chunk_index,
+                        "msg_type": msg_type,
+                        "request": dict(
+                            model_name=model_name,
+                            system_prompt=config.SYSTEM_PROMPT_EDUCATOR,
+                            user_prompt=build_user_prompt(templates[msg_type], chunk, learning_goals, language),
+                            images_base64_list=images_base64_list,
+                            settings=build_llm_settings(msg_type)
+                        ),
+                    })
+    return jobs
+
+
+class BatchJob:
+    """A resumable batch run, persisted in the output directory."""
+
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        self.state_path = os.path.join(output_dir, STATE_FILENAME)
+        self.state = {"jobs": [], "results": {}, "errors": {}, "batch_id": None}
+        if os.path.exists(self.state_path):
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                self.state = json.load(f)
+
+    @property
+    def is_initialized(self):
+        return bool(self.state["jobs"])
+
+    def initialize(self, jobs):
+        # Request bodies can be large (images); keep only the routing metadata in the state
+        self.state["jobs"] = [{key: job[key] for key in ("custom_id", "source", "page", "chunk", "msg_type")} for job in jobs]
+        self.save()
+
+    def save(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, ensure_ascii=False)
+        os.replace(tmp_path, self.state_path) # Atomic, so an interrupted save never corrupts the state
+
+    def pending(self, jobs):
+        return [job for job in jobs if job["custom_id"] not in self.state["results"]]
+
+    def record_result(self, custom_id, response):
+        self.state["results"][custom_id] = response
+        self.state["errors"].pop(custom_id, None)
+
+    def record_error(self, custom_id, message):
+        self.state["errors"][custom_id] = message
+
+    def run_local(self, jobs, api_key, max_workers=None, use_cache=True, cascade=False):
+        """
+        Runs the pending requests through generate_via_llm on a local worker pool (e.g. against a stand-in server).
+        With 'cascade' True, every request goes through the model cascade (core/cascade.py).
+        """
+        pending = self.pending(jobs)
+        logging.info(f"Running {len(pending)} request(s) on the local worker pool.")
+
+        def generate(job):
+            request = dict(provider="openai", api_key=api_key, use_cache=use_cache, priority=config.PRIORITY_BATCH, **job["request"])
+            return generate_with_cascade(job["msg_type"], **request) if cascade else generate_via_llm(**request)
+
+        with ThreadPoolExecutor(max_workers=max_workers or config.MAX_CONCURRENT_REQUESTS) as executor:
+            futures = {executor.submit(generate, job): job for job in pending}
+            for future in as_completed(futures):
+                job = futures[future]
+                try:
+                    self.record_result(job["custom_id"], future.result())
+                except Exception as e:
+                    logging.error(f"Request {job['custom_id']} failed: {e}")
+                    self.record_error(job["custom_id"], str(e))
+                self.save() # Persist after every response so a rerun resumes where it stopped
+
+    def submit_batch(self, jobs, api_key, use_cache=True):
+        """
+        Uploads the pending requests as a JSONL file and creates an OpenAI batch.
+        Requests already present in the response cache are resolved locally and not submitted.
+        Does nothing if a batch was already submitted for this job.
+        """
+        if self.state["batch_id"]:
+            return self.state["batch_id"]
+
+        cache = get_response_cache() if use_cache else None
+        from .providers import openai_provider
+
+        input_path = os.path.join(self.output_dir, BATCH_INPUT_FILENAME)
+        submitted = 0
+        with open(input_path, "w", encoding="utf-8") as f:
+            for job in self.pending(jobs):
+                if cache:
+                    cached_response = cache.get(make_cache_key("openai", **job["request"]))
+                    if cached_response is not None:
+                        self.record_result(job["custom_id"], cached_response)
+                        continue
+                f.write(json.dumps({
+                    "custom_id": job["custom_id"],
+                    "method": "POST",
+                    "url": "/v1/chat/completions",
+                    "body": openai_provider.build_chat_request(**job["request"]),
+                }, ensure_ascii=False) + "\n")
+                submitted += 1
+
+        if not submitted:
+            self.save()
+            return None
+
+        client = openai_provider.get_openai_client(api_key, config.OPENAI_BASE_URL)
+        with open(input_path, "rb") as f:
+            input_file = client.files.create(file=f, purpose="batch")
+        batch = client.batches.create(
+            input_file_id=input_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h"
+        )
+        self.state["batch_id"] = batch.id
+        self.save()
+        logging.info(f"Submitted batch {batch.id} with {submitted} request(s).")
+        return batch.id
+
+    def collect_batch(self, jobs, api_key, wait=True, poll_interval=30):
+        """
+        Polls the submitted batch and stores its results.
+        Returns True once the batch has finished (or nothing was submitted).
+        """
+        batch_id = self.state["batch_id"]
+        if not batch_id:
+            return True
+
+        from .providers import openai_provider
+        client = openai_provider.get_openai_client(api_key, config.OPENAI_BASE_URL)
+        while True:
+            batch = client.batches.retrieve(batch_id)
+            if batch.status in ("completed", "failed", "expired", "cancelled"):
+                break
+            if not wait:
+                logging.info(f"Batch {batch_id} is {batch.status}; run again later to collect the results.")
+                return False
+            logging.info(f"Batch {batch_id} is {batch.status}, waiting {poll_interval}s...")
+            time.sleep(poll_interval)
+
+        requests_by_id = {job["custom_id"]: job["request"] for job in jobs}
+        cache = get_response_cache()
+        with tracing.collect_usage() as usage:
+            for file_id in (batch.output_file_id, batch.error_file_id):
+                if not file_id:
+                    continue
+                for line in client.files.content(file_id).text.splitlines():
+                    if not line.strip():
+                        continue
+                    entry = json.loads(line)
+                    custom_id = entry["custom_id"]
+                    response = entry.get("response") or {}
+                    if entry.get("error") or response.get("status_code") != 200:
+                        self.record_error(custom_id, json.dumps(entry.get("error") or response.get("body"), ensure_ascii=False))
+                        continue
+                    content = response["body"]["choices"][0]["message"]["content"]
+                    tracing.record_usage(response["body"].get("usage"), response["body"].get("model"))
+                    self.record_result(custom_id, content)
+                    if cache and content and custom_id in requests_by_id:
+                        cache.set(make_cache_key("openai", **requests_by_id[custom_id]), content)
+        if usage["prompt"]:
+            logging.info(f"Batch {batch_id} used {usage['prompt']} prompt tokens ({usage['cached']} cached) and {usage['completion']} completion tokens.")
+
+        if batch.status != "completed":
+            logging.error(f"Batch {batch_id} ended with status {batch.status}.")
+        # A finished batch cannot be resubmitted; clearing the id lets a rerun retry failed requests
+        self.state["batch_id"] = None
+        self.save()
+        return True
+
+    def write_exports(self, selected_types, export_formats=None):
+        """
+        Writes the exports of every source file ('txt': OLAT text, 'zip': one OLAT file per type,
+        'qti': QTI 2.1 package), ordered by page and question type.
+        The responses of a long document's chunks are merged per page and type first.
+        Each source's processed sections are spooled, so memory stays bounded for large runs.
+        """
+        export_formats = export_formats or ["txt"]
+        type_order = {msg_type: idx for idx, msg_type in enumerate(selected_types)}
+        grouped = {}
+        for job in self.state["jobs"]:
+            response = self.state["results"].get(job["custom_id"])
+            if response:
+                grouped.setdefault(job["source"], {}).setdefault((job["page"], job["msg_type"]), []).append((job.get("chunk", 0), response))
+
+        written = []
+        for source, sections in sorted(grouped.items()):
+            with ExportWriter() as writer:
+                for (page, msg_type), chunk_responses in sections.items():
+                    responses = [response for _, response in sorted(chunk_responses, key=lambda entry: entry[0])]
+                    heading = msg_type.upper()
+                    if page:
+                        heading += f" (Seite {page})"
+                    conversion_warnings = []
+                    response = merge_chunk_responses(msg_type, responses, conversion_warnings) if len(responses) > 1 else responses[0]
+                    processed_response = process_response(msg_type, response, conversion_warnings)
+                    for warning in conversion_warnings:
+                        logging.warning(f"{source}, {heading}: {warning}")
+                    writer.add(msg_type, processed_response, sort_key=(page or 0, type_order.get(msg_type, 0)), heading=heading)
+
+                export_stem = os.path.join(self.output_dir, os.path.splitext(source)[0])
+                os.makedirs(os.path.dirname(export_stem), exist_ok=True)
+                for export_format in export_formats:
+                    export_path = export_stem + EXPORT_FILE_SUFFIXES[export_format]
+                    writer.save(export_path, export_format)
+                    written.append(export_path)
+        return written
+
+
+def run_batch(input_dir, output_dir, selected_types, api_key, learning_goals="", language="German", model_name=None, mode="api", wait=True, poll_interval=30, max_workers=None, use_cache=True, export_formats=None, cascade=False):
+    """
+    Runs (or resumes) a batch job end to end.
+    mode "api" submits to the OpenAI Batch endpoint, mode "local" uses the local worker pool.
+    'cascade' (local mode only) generates every request on config.CASCADE_MODEL_NAME first.
+    'export_formats' lists the export targets (see write_exports; default: OLAT text only).
+    Returns the paths of the written exports, or an empty list while an API batch is still running.
+    """
+    job = BatchJob(output_dir)
+    jobs = build_jobs(input_dir, selected_types, learning_goals, language, model_name or config.DEFAULT_MODEL_NAME)
+    if not job.is_initialized:
+        job.initialize(jobs)
+    elif {j["custom_id"] for j in jobs} != {j["custom_id"] for j in job.state["jobs"]}:
+        raise ValueError(f"{output_dir} belongs to a different batch (files or question types changed); use a new output directory.")
+
+    if mode == "local":
+        job.run_local(jobs, api_key, max_workers=max_workers, use_cache=use_cache, cascade=cascade)
+        if cascade:
+            logging.info(f"Model cascade: {get_cascade_stats()}")
+    elif mode == "api":
+        if cascade:
+            raise ValueError("The model cascade needs the responses before escalating; use mode 'local'.")
+        job.submit_batch(jobs, api_key, use_cache=use_cache)
+        if not job.collect_batch(jobs, api_key, wait=wait, poll_interval=poll_interval):
+            return []
+    else:
+        raise ValueError(f"Unsupported batch mode: {mode}")
+
+    if job.state["errors"]:
+        logging.warning(f"{len(job.state['errors'])} request(s) failed; run again to retry them.")
+    return job.write_exports(selected_types, export_formats)
@@ -0,0 +1,197 @@
+"""
+Model cascade: generate a question type on the small config.CASCADE_MODEL_NAME first and only
+generate it again on the requested (large) model if core.validators rejects the response.
+
+Each decision is recorded in a "cascade" trace span (outcome and problems), in the
+olat_cascade_decisions_total counter, and in the process-wide CascadeStats. CascadeStats also
+estimates what the cascade saved: the cost of every accepted response on the large model at
+the same token counts, and its latency at the mean latency of the escalated requests on the large model.
+"""
+import asyncio
+import logging
+import threading
+import time
+
+from . import config
+from . import tracing
+from .llm_service import generate_via_llm, generate_via_llm_async, stream_via_llm
+from .validators import validate_response
+
+RESTART = object() # Yielded by stream_with_cascade before the large model's deltas: discard the output so far
+
+
+def usage_cost(model_name, usage):
+    """USD cost of 'usage' ({"prompt", "completion", "cached"} tokens) on a model, or None without a price."""
+    prices = config.MODEL_PRICES_PER_MILLION.get(model_name)
+    if prices is None:
+        return None
+    uncached = usage["prompt"] - usage["cached"]
+    return (uncached * prices["prompt"] + usage["cached"] * prices["cached"] + usage["completion"] * prices["completion"]) / 1e6
+
+
+class CascadeStats:
+    """Thread-safe counters of cascade decisions with cost and latency totals, for the savings estimate."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.decisions = {} # msg_type -> {"accepted": n, "escalated": n}
+            self.cost = {"actual": 0.0, "without_cascade": 0.0}
+            # Small-model time of accepted and of escalated requests, large-model time of escalated ones
+            self.seconds = {"accepted_small": 0.0, "escalated_small": 0.0, "escalated_large": 0.0}
+
+    def record(self, msg_type, outcome, small_model, small_usage, small_seconds, large_model, large_usage=None, large_seconds=0.0):
+        small_cost = usage_cost(small_model, small_usage) or 0.0
+        with self._lock:
+            counts = self.decisions.setdefault(msg_type, {"accepted": 0, "escalated": 0})
+            counts[outcome] += 1
+            self.cost["actual"] += small_cost
+            if outcome == "accepted":
+                # The large model would have produced about as many tokens
+                self.cost["without_cascade"] += usage_cost(large_model, small_usage) or small_cost
+                self.seconds["accepted_small"] += small_seconds
+            else:
+                large_cost = usage_cost(large_model, large_usage) or 0.0
+                self.cost["actual"] += large_cost
+                self.cost["without_cascade"] += large_cost
+                self.seconds["escalated_small"] += small_seconds
+                self.seconds["escalated_large"] += large_seconds
+
+    def snapshot(self):
+        """Decisions per type, acceptance rate and the estimated cost (USD) and latency (seconds) saved."""
+        with self._lock:
+            decisions = {msg_type: dict(counts) for msg_type, counts in self.decisions.items()}
+            cost = dict(self.cost)
+            seconds = dict(self.seconds)
+        accepted = sum(counts["accepted"] for counts in decisions.values())
+        escalated = sum(counts["escalated"] for counts in decisions.values())
+        total = accepted + escalated
+        saved_seconds = None
+        if escalated:
+            # Without the cascade, accepted requests would have taken as long as the escalated ones
+            # did on the large model; escalated requests lost the time spent on the small model
+            mean_large_seconds = seconds["escalated_large"] / escalated
+            saved_seconds = accepted * mean_large_seconds - seconds["accepted_small"] - seconds["escalated_small"]
+        return {
+            "decisions": decisions,
+            "accepted": accepted,
+            "escalated": escalated,
+            "acceptance_rate": round(accepted / total, 3) if total else None,
+            "cost_usd": round(cost["actual"], 6),
+            "cost_usd_without_cascade": round(cost["without_cascade"], 6),
+            "saved_usd": round(cost["without_cascade"] - cost["actual"], 6),
+            "seconds": round(sum(seconds.values()), 3),
+            "saved_seconds": round(saved_seconds, 3) if saved_seconds is not None else None,
+        }
+
+
+stats = CascadeStats()
+
+
+def cascade_applies(msg_type, model_name):
+    """Whether requests of 'msg_type' for 'model_name' go through the cascade at all."""
+    return msg_type in config.CASCADE_TYPES and model_name != config.CASCADE_MODEL_NAME
+
+
+def _decide(msg_type, response, error, span):
+    """Validates the small model's response; returns the problems (empty if it is accepted)."""
+    if error is not None:
+        problems = [f"small model failed: {error}"]
+    else:
+        problems = [] if (result := validate_response(msg_type, response)).ok else result.problems or ["rejected"]
+    outcome = "escalated" if problems else "accepted"
+    span.set(outcome=outcome, problems="; ".join(problems[:3]) or None)
+    tracing.metrics.inc("olat_cascade_decisions_total", type=msg_type, outcome=outcome)
+    if problems:
+        logging.info(f"Cascade: {msg_type} escalated to the large model ({'; '.join(problems[:3])}).")
+    return problems
+
+
+def generate_with_cascade(msg_type, model_name, **request):
+    """
+    generate_via_llm for one question type through the cascade: the small model first, the
+    requested 'model_name' only if the small model's response fails validation (or the request fails).
+    """
+    if not cascade_applies(msg_type, model_name):
+        return generate_via_llm(model_name=model_name, **request)
+    with tracing.span("cascade", type=msg_type, small_model=config.CASCADE_MODEL_NAME, large_model=model_name) as span:
+        response, error = None, None
+        start = time.perf_counter()
+        with tracing.collect_usage() as small_usage:
+            try:
+                response = generate_via_llm(model_name=config.CASCADE_MODEL_NAME, **request)
+            except Exception as e: # Anything the large model might answer instead
+                error = e
+        small_seconds = time.perf_counter() - start
+        if not _decide(msg_type, response, error, span):
+            stats.record(msg_type, "accepted", config.CASCADE_MODEL_NAME, small_usage, small_seconds, model_name)
+            return response
+
+        start = time.perf_counter()
+        with tracing.collect_usage() as large_usage:
+            response = generate_via_llm(model_name=model_name, **request)
+        stats.record(msg_type, "escalated", config.CASCADE_MODEL_NAME, small_usage, small_seconds, model_name, large_usage, time.perf_counter() - start)
+        return response
+
+
+async def generate_with_cascade_async(msg_type, model_name, **request):
+    """Async counterpart of generate_with_cascade, on generate_via_llm_async."""
+    if not cascade_applies(msg_type, model_name):
+        return await generate_via_llm_async(model_name=model_name, **request)
+    with tracing.span("cascade", type=msg_type, small_model=config.CASCADE_MODEL_NAME, large_model=model_name) as span:
+        response, error = None, None
+        start = time.perf_counter()
+        with tracing.collect_usage() as small_usage:
+            try:
+                response = await generate_via_llm_async(model_name=config.CASCADE_MODEL_NAME, **request)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                error = e
+        small_seconds = time.perf_counter() - start
+        if not _decide(msg_type, response, error, span):
+            stats.record(msg_type, "accepted", config.CASCADE_MODEL_NAME, small_usage, small_seconds, model_name)
+            return response
+
+        start = time.perf_counter()
+        with tracing.collect_usage() as large_usage:
+            response = await generate_via_llm_async(model_name=model_name, **request)
+        stats.record(msg_type, "escalated", config.CASCADE_MODEL_NAME, small_usage, small_seconds, model_name, large_usage, time.perf_counter() - start)
+        return response
+
+
+def stream_with_cascade(msg_type, model_name, **request):
+    """
+    stream_via_llm through the cascade. The small model's deltas are yielded as they arrive; if its
+    response is rejected, RESTART is yielded, followed by the deltas of the requested 'model_name'.
+    """
+    if not cascade_applies(msg_type, model_name):
+        yield from stream_via_llm(model_name=model_name, **request)
+        return
+    with tracing.span("cascade", type=msg_type, small_model=config.CASCADE_MODEL_NAME, large_model=model_name, stream=True) as span:
+        deltas, error = [], None
+        start = time.perf_counter()
+        with tracing.collect_usage() as small_usage:
+            try:
+                for delta in stream_via_llm(model_name=config.CASCADE_MODEL_NAME, **request):
+                    deltas.append(delta)
+                    yield delta
+            except Exception as e:
+                error = e
+        small_seconds = time.perf_counter() - start
+        if not _decide(msg_type, "".join(deltas), error, span):
+            stats.record(msg_type, "accepted", config.CASCADE_MODEL_NAME, small_usage, small_seconds, model_name)
+            return
+
+        yield RESTART
+        start = time.perf_counter()
+        with tracing.collect_usage() as large_usage:
+            yield from stream_via_llm(model_name=model_name, **request)
+        stats.record(msg_type, "escalated", config.CASCADE_MODEL_NAME, small_usage, small_seconds, model_name, large_usage, time.perf_counter() - start)
+
+
+def get_cascade_stats():
+    return stats.snapshot()
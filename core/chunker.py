@@ -0,0 +1,110 @@
+import functools
+import re
+
+# Lines that start a new section: markdown headings, numbered headings ("2.1 Title"),
+# short all-caps lines and the page markers inserted by process_uploaded_pdf.
+_HEADING_RE = re.compile(
+    r"^(#{1,6}\s+\S.*"
+    r"|\d+(\.\d+)*\.?\s+[A-ZÄÖÜ].{0,80}"
+    r"|[A-ZÄÖÜ0-9][A-ZÄÖÜ0-9 \-:,]{3,80}"
+    r"|\[Seite \d+.*\])$"
+)
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s+")
+
+
+@functools.lru_cache(maxsize=None)
+def _get_encoding():
+    """The tiktoken encoding, loaded on first use (importing tiktoken and building it is slow), or None."""
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("o200k_base")
+    except Exception: # tiktoken is optional; fall back to the character heuristic
+        return None
+
+
+def estimate_tokens(text):
+    """Token count of a text: exact with tiktoken if installed, otherwise ~4 characters per token."""
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return len(text) // 4 + 1
+
+
+def _split_sections(text):
+    """Splits text at heading lines; every section keeps its heading."""
+    sections = []
+    current = []
+    for line in text.splitlines():
+        if _HEADING_RE.match(line.strip()) and any(part.strip() for part in current):
+            sections.append("\n".join(current).strip())
+            current = []
+        current.append(line)
+    if any(part.strip() for part in current):
+        sections.append("\n".join(current).strip())
+    return sections
+
+
+def _pack(parts, max_tokens, separator):
+    """Greedily joins consecutive parts into pieces of at most max_tokens."""
+    pieces = []
+    current = []
+    current_tokens = 0
+    for part in parts:
+        part_tokens = estimate_tokens(part)
+        if current and current_tokens + part_tokens > max_tokens:
+            pieces.append(separator.join(current))
+            current = []
+            current_tokens = 0
+        current.append(part)
+        current_tokens += part_tokens
+    if current:
+        pieces.append(separator.join(current))
+    return pieces
+
+
+def _split_oversized(block, max_tokens):
+    """Splits a block that exceeds the budget by paragraphs, then sentences, then characters."""
+    paragraphs = [part.strip() for part in re.split(r"\n\s*\n", block) if part.strip()]
+    if len(paragraphs) > 1:
+        return paragraphs
+    sentences = [part.strip() for part in _SENTENCE_END_RE.split(block) if part.strip()]
+    if len(sentences) > 1:
+        return _pack(sentences, max_tokens, " ")
+    # A single huge run without sentence boundaries: hard split by characters
+    max_chars = max(max_tokens * 4, 1)
+    return [block[i:i + max_chars] for i in range(0, len(block), max_chars)]
+
+
+def split_text_into_chunks(text, max_tokens):
+    """
+    Splits a document into chunks of at most about 'max_tokens' tokens.
+    Heading-delimited sections are kept together where they fit; larger sections are
+    split at paragraph and sentence boundaries. Returns the chunks in document order.
+    """
+    text = (text or "").strip()
+    if estimate_tokens(text) <= max_tokens:
+        return [text] if text else []
+
+    pending = _split_sections(text)
+    chunks = []
+    current = []
+    current_tokens = 0
+    while pending:
+        block = pending.pop(0)
+        block_tokens = estimate_tokens(block)
+        if block_tokens > max_tokens:
+            pieces = _split_oversized(block, max_tokens)
+            if len(pieces) > 1:
+                pending[:0] = pieces
+                continue
+        if current and current_tokens + block_tokens > max_tokens:
+            chunks.append("\n\n".join(current))
+            current = []
+            current_tokens = 0
+        current.append(block)
+        current_tokens += block_tokens
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
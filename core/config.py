@@ -1,6 +1,8 @@
 import logging
 import os
 
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) # Files and caches resolve from here, not from the working directory
+
 # App constants
 MESSAGE_TYPES = [
     "single_choice",
@@ -14,6 +16,114 @@ MESSAGE_TYPES = [
 DEFAULT_MODEL_NAME = "gpt-4.1" # Changed from gpt-4o to gpt-4.1 as in original
 DEFAULT_MAX_TOKENS = 16000 # Changed from 4096 to 16000 as in original
 DEFAULT_TEMPERATURE = 0.4
+MAX_CONCURRENT_REQUESTS = 6 # Upper bound for question types generated at the same time
+COMBINED_MAX_TOKENS = 32000 # Output budget when all selected types are generated in one request
+CHUNK_MAX_INPUT_TOKENS = 8000 # Longer texts are split into chunks of this size and generated per chunk
+MAX_PAGES_PER_REQUEST = 4 # "Generate all pages": most page images that may share one request
+
+# Prompt templates (prompts/<type>.md, resolved relative to the package, not the working directory)
+PROMPTS_DIR = os.path.join(APP_DIR, "prompts")
+PROMPT_RELOAD_INTERVAL = 2.0 # Seconds between checks for edited template files
+
+# PDF text extraction (page ranges are extracted in a process pool, see core/pdf_text.py)
+PDF_TEXT_PARALLEL_MIN_PAGES = 24 # Shorter ranges are extracted in-process; pool overhead would dominate
+PDF_TEXT_MAX_WORKERS = None # Worker processes; None uses os.cpu_count()
+PDF_TEXT_CACHE_MAX_ENTRIES = 16 # Extracted page ranges kept in memory, keyed by content hash
+
+# PDF rasterization (scanned PDFs are sent as page images)
+PDF_RASTER_CHUNK_SIZE = 4 # Pages rendered per pdf2image call; bounds peak memory
+PDF_RASTER_MIN_DPI = 50
+PDF_RASTER_MAX_DPI = 200
+
+# Image preparation for vision requests
+IMAGE_MAX_SIZE = 1000 # Longest image side sent to the API
+IMAGE_DETAIL = "auto" # "auto" picks low/high per image from its text density; "low"/"high" force a level
+IMAGE_MAX_TILES = 4 # High-detail images are sized to at most this many 512px tiles (85 + 170 tokens each)
+IMAGE_TEXT_DENSITY_HIGH_DETAIL = 0.06 # Edge density above which a document image is sent in high detail
+IMAGE_GRAYSCALE_MAX_SATURATION = 0.08 # Images below this mean saturation are encoded as grayscale
+IMAGE_CROP_WHITESPACE = True
+IMAGE_WHITESPACE_THRESHOLD = 235 # Gray level above which a pixel counts as margin
+IMAGE_JPEG_QUALITY = 70
+IMAGE_JPEG_QUALITY_TEXT = 80 # Text needs crisper edges
+IMAGE_CACHE_MAX_ENTRIES = 256 # Prepared images kept in memory
+IMAGE_CACHE_DIR = os.path.join(APP_DIR, ".cache", "images") # Prepared images kept across sessions; None disables
+IMAGE_CACHE_MAX_FILES = 2000
+
+# OpenAI connection settings
+OPENAI_BASE_URL = os.environ.get("OPENAI_BASE_URL") or None # None = official endpoint; set to point at a local/mock server
+HTTP2_ENABLED = True # Requires the 'h2' package (httpx[http2]); falls back to HTTP/1.1 if missing
+HTTP_MAX_CONNECTIONS = 20 # Per shared client
+HTTP_MAX_KEEPALIVE_CONNECTIONS = 10
+HTTP_KEEPALIVE_EXPIRY = 120.0 # Seconds an idle connection is kept open for reuse
+HTTP_CONNECT_TIMEOUT = 10.0
+HTTP_READ_TIMEOUT = 600.0 # Large completions (DEFAULT_MAX_TOKENS) can take several minutes
+
+# Provider routing (see core/router.py): the route named by a request's 'provider' goes first,
+# the others serve as hedge and failover targets in the order listed
+LOCAL_LLM_BASE_URL = os.environ.get("OLAT_LOCAL_LLM_BASE_URL") or None # OpenAI-compatible server, e.g. http://localhost:8000/v1
+LOCAL_LLM_MODEL = os.environ.get("OLAT_LOCAL_LLM_MODEL") or None # None sends the requested model name
+LOCAL_LLM_API_KEY = os.environ.get("OLAT_LOCAL_LLM_API_KEY") or "local" # Most local servers ignore it; the SDK needs one
+LLM_ROUTES = [
+    # name: what callers pass as 'provider'; provider: core.providers.registry name;
+    # base_url/api_key/model: None uses OPENAI_BASE_URL / the caller's key / the requested model
+    {"name": "openai", "provider": "openai", "base_url": None, "api_key": None, "model": None},
+] + ([
+    {"name": "local", "provider": "openai_compatible", "base_url": LOCAL_LLM_BASE_URL, "api_key": LOCAL_LLM_API_KEY, "model": LOCAL_LLM_MODEL},
+] if LOCAL_LLM_BASE_URL else [])
+ROUTER_HEDGING_ENABLED = os.environ.get("OLAT_HEDGING", "1") != "0"
+ROUTER_HEDGE_PERCENTILE = 0.95 # A request slower than this share of the route's recent requests is hedged
+ROUTER_HEDGE_MIN_DELAY = 1.0 # Seconds; never hedge sooner, whatever the percentile says
+ROUTER_HEDGE_DEFAULT_DELAY = 30.0 # Seconds; used until a route has ROUTER_LATENCY_MIN_SAMPLES latencies
+ROUTER_LATENCY_WINDOW = 200 # Recent successful latencies kept per route
+ROUTER_LATENCY_MIN_SAMPLES = 20
+ROUTER_FAILURE_THRESHOLD = 3 # Consecutive transient failures before a route is skipped
+ROUTER_RESET_SECONDS = 30.0 # Then a single probe request tests whether it recovered
+
+# Model cascade (see core/cascade.py): each question type is generated on CASCADE_MODEL_NAME first
+# and generated again on DEFAULT_MODEL_NAME only if core/validators.py rejects the output
+CASCADE_ENABLED = os.environ.get("OLAT_CASCADE", "0") == "1" # Default of the UI option and batch runs
+CASCADE_MODEL_NAME = os.environ.get("OLAT_CASCADE_MODEL") or "gpt-4.1-mini"
+CASCADE_TYPES = list(MESSAGE_TYPES) # Types the small model may answer
+CASCADE_MIN_QUESTIONS = 3 # Fewer questions in a response fail validation
+CASCADE_MAX_INVALID_SHARE = 0.0 # Share of malformed questions tolerated before escalating
+# USD per million tokens (list prices), for the cascade's cost and savings estimates
+MODEL_PRICES_PER_MILLION = {
+    "gpt-4.1": {"prompt": 2.00, "cached": 0.50, "completion": 8.00},
+    "gpt-4.1-mini": {"prompt": 0.40, "cached": 0.10, "completion": 1.60},
+    "gpt-4.1-nano": {"prompt": 0.10, "cached": 0.025, "completion": 0.40},
+}
+
+# Request scheduling (shared by all sessions of the process)
+RATE_LIMIT_REQUESTS_PER_MINUTE = int(os.environ.get("OPENAI_RPM_LIMIT", 500))
+RATE_LIMIT_TOKENS_PER_MINUTE = int(os.environ.get("OPENAI_TPM_LIMIT", 450000)) # Prompt + max_tokens, as OpenAI counts it
+RETRY_MAX_ATTEMPTS = 5 # Retries after the first attempt for 429/5xx/timeouts
+RETRY_BASE_DELAY = 1.0 # Seconds; doubled per retry, with full jitter
+RETRY_MAX_DELAY = 60.0
+CIRCUIT_FAILURE_THRESHOLD = 5 # Consecutive transient failures before failing fast
+CIRCUIT_RESET_SECONDS = 30.0
+PRIORITY_INTERACTIVE = 0 # Lower values are admitted first
+PRIORITY_BATCH = 10
+IMAGE_TOKEN_ESTIMATE = 85 # Tokens per low-detail image, for rate limiting
+
+# Response cache (identical requests are answered from disk instead of the API)
+RESPONSE_CACHE_ENABLED = True
+RESPONSE_CACHE_PATH = os.environ.get("OLAT_RESPONSE_CACHE_PATH", os.path.join(APP_DIR, ".cache", "llm_responses.sqlite3"))
+RESPONSE_CACHE_TTL_SECONDS = 7 * 24 * 3600 # One week
+RESPONSE_CACHE_MAX_BYTES = 200 * 1024 * 1024 # Least recently used entries are evicted beyond this size
+
+# Session result store (extracted text, page images and responses survive Streamlit reruns)
+RESULT_STORE_DIR = os.environ.get("OLAT_RESULT_STORE_DIR") or None # Set to also keep results on disk, across sessions
+RESULT_STORE_MAX_ENTRIES = 512 # Entries kept in memory per session; least recently used are dropped
+
+# Exports (generated responses are spooled to a temporary file as they complete)
+EXPORT_SPOOL_MAX_MEMORY = 8 * 1024 * 1024 # Bytes kept in memory before the spool moves to disk
+EXPORT_FORMATS = ["txt", "zip", "qti"] # OLAT text, zip of per-type OLAT files, IMS QTI 2.1 package
+
+# Tracing (stage timings and token usage, see core/tracing.py)
+TRACING_ENABLED = os.environ.get("OLAT_TRACING", "1") != "0"
+TRACE_JSONL_PATH = os.environ.get("OLAT_TRACE_JSONL") or None # One JSON line per finished span; None disables
+TRACE_PROMETHEUS_PATH = os.environ.get("OLAT_TRACE_PROMETHEUS") or None # Prometheus textfile; None disables
+TRACE_PROMETHEUS_INTERVAL = 10.0 # Seconds between textfile rewrites
 
 SYSTEM_PROMPT_EDUCATOR = """
 You are an expert educator specializing in generating test questions and answers across all topics, following Bloom’s Taxonomy. Your role is to create high-quality Q&A sets based on the material provided by the user, ensuring each question aligns with a specific level of Bloom’s Taxonomy: Remember, Understand, Apply, Analyze, Evaluate, and Create.
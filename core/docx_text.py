@@ -0,0 +1,241 @@
+"""
+Streaming DOCX text extraction.
+
+python-docx builds the whole document as an lxml object tree and only exposes the body
+paragraphs, so table content, headers and notes were lost. This reader iterparses the XML
+parts straight from the zip and emits blocks in reading order: the distinct page headers,
+then the body (headings with their level, paragraphs, tables row by row), then footnotes
+and endnotes. Each block is dropped from the parse tree as soon as it has been emitted,
+so memory stays bounded by the largest single block, not the document.
+
+Only the standard library is used (zipfile, xml.etree's expat parser).
+"""
+import posixpath
+import re
+import zipfile
+from collections import namedtuple
+from xml.etree import ElementTree
+
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_REL = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+_MC_FALLBACK = "{http://schemas.openxmlformats.org/markup-compatibility/2006}Fallback"
+_OFFICE_DOCUMENT = "/officeDocument"
+
+# Elements that hold blocks; a finished block is removed from them
+_CONTAINERS = {_W + "body", _W + "footnote", _W + "endnote", _W + "hdr", _W + "ftr", _W + "sdtContent"}
+_NOTE_PREFIXES = {_W + "footnote": "", _W + "endnote": "E"} # Endnote ids are separate from footnote ids
+_BLOCK_PARENTS = _CONTAINERS | set(_NOTE_PREFIXES) | {_W + "footnotes", _W + "endnotes"}
+_RUN_CONTENT = {_W + "t", _W + "tab", _W + "br", _W + "cr", _W + "noBreakHyphen", _W + "footnoteReference", _W + "endnoteReference"}
+_HEADING_NAME = re.compile(r"heading\s*(\d)$", re.IGNORECASE)
+_MAX_HEADING_LEVEL = 6
+
+DocxBlock = namedtuple("DocxBlock", ["kind", "text", "level"])
+DocxBlock.__doc__ = """
+A piece of document text: kind is "header", "heading", "paragraph", "table" or "note";
+level is the heading level (1-6) for headings and 0 otherwise. Table rows are separate
+lines with " | " between cells; notes start with their reference label, e.g. "[^3]".
+"""
+
+
+def _attr(element, name):
+    return element.get(_W + name)
+
+
+def _read_relationships(archive, part):
+    """Relationship type suffix (e.g. "/header") -> list of target part names, in document order."""
+    directory, name = posixpath.split(part)
+    rels_name = posixpath.join(directory, "_rels", name + ".rels")
+    targets = {}
+    if rels_name not in archive.namelist():
+        return targets
+    with archive.open(rels_name) as f:
+        for element in ElementTree.parse(f).getroot().iter(_REL + "Relationship"):
+            if element.get("TargetMode") == "External":
+                continue
+            target = element.get("Target", "")
+            target = target.lstrip("/") if target.startswith("/") else posixpath.normpath(posixpath.join(directory, target))
+            suffix = element.get("Type", "")[element.get("Type", "").rfind("/"):]
+            targets.setdefault(suffix, []).append(target)
+    return targets
+
+
+def _read_heading_levels(archive, part):
+    """Paragraph style id -> heading level, from the "heading N" style names and outline levels."""
+    if part not in archive.namelist():
+        return {}
+    levels, based_on = {}, {}
+    # Parsed in one go: the part does not grow with the document, and one C-level parse is
+    # much faster than iterparse's per-element events over its many table style entries
+    for style in ElementTree.fromstring(archive.read(part)).iterfind(_W + "style"):
+        if _attr(style, "type") != "paragraph":
+            continue
+        style_id = _attr(style, "styleId")
+        name = style.find(_W + "name")
+        outline = style.find(f"{_W}pPr/{_W}outlineLvl")
+        parent = style.find(_W + "basedOn")
+        match = _HEADING_NAME.match(_attr(name, "val") or "") if name is not None else None
+        if match:
+            levels[style_id] = int(match.group(1))
+        elif outline is not None and (_attr(outline, "val") or "").isdigit() and int(_attr(outline, "val")) < 9:
+            levels[style_id] = int(_attr(outline, "val")) + 1 # 9 is "body text"
+        elif parent is not None:
+            based_on[style_id] = _attr(parent, "val")
+    for style_id, parent in based_on.items():
+        seen = {style_id}
+        while parent in based_on and parent not in seen: # Inherit through chains of derived styles
+            seen.add(parent)
+            parent = based_on[parent]
+        if parent in levels:
+            levels[style_id] = levels[parent]
+    return {style_id: min(level, _MAX_HEADING_LEVEL) for style_id, level in levels.items()}
+
+
+class _Paragraph:
+    __slots__ = ("parts", "style", "outline_level")
+
+    def __init__(self):
+        self.parts = []
+        self.style = None
+        self.outline_level = None
+
+
+def _iter_part_blocks(archive, part, heading_levels):
+    """Yields (kind, text, level, note label) for the blocks of one XML part, in document order."""
+    stack = [] # Open elements, for removing finished blocks from their container
+    paragraphs = [] # Open paragraphs; text boxes nest paragraphs inside paragraphs
+    tables = [] # Open tables: lists of rows, a row is a list of cells, a cell a list of texts
+    notes = [] # Open notes: [label, texts]
+    fallback_depth = 0 # Inside mc:Fallback, which repeats the mc:Choice content (e.g. text boxes)
+
+    with archive.open(part) as f:
+        for event, element in ElementTree.iterparse(f, events=("start", "end")):
+            tag = element.tag
+            if event == "start":
+                stack.append(element)
+                if tag == _MC_FALLBACK:
+                    fallback_depth += 1
+                elif fallback_depth:
+                    continue
+                elif tag == _W + "p":
+                    paragraphs.append(_Paragraph())
+                elif tag == _W + "tbl":
+                    tables.append([])
+                elif tag == _W + "tr" and tables:
+                    tables[-1].append([])
+                elif tag == _W + "tc" and tables and tables[-1]:
+                    tables[-1][-1].append([])
+                elif tag in _NOTE_PREFIXES and _attr(element, "type") in (None, "normal"): # Skips separators
+                    notes.append([_NOTE_PREFIXES[tag] + (_attr(element, "id") or ""), []])
+                continue
+
+            stack.pop()
+            if tag == _MC_FALLBACK:
+                fallback_depth -= 1
+                continue
+            if fallback_depth:
+                continue
+
+            block = None
+            if paragraphs and tag in _RUN_CONTENT and stack[-1].tag != _W + "tabs": # Not a tab stop definition
+                paragraph = paragraphs[-1]
+                if tag == _W + "t":
+                    paragraph.parts.append(element.text or "")
+                elif tag == _W + "tab":
+                    paragraph.parts.append("\t")
+                elif tag in (_W + "br", _W + "cr"):
+                    paragraph.parts.append("\n")
+                elif tag == _W + "noBreakHyphen":
+                    paragraph.parts.append("-")
+                elif tag == _W + "footnoteReference":
+                    paragraph.parts.append(f"[^{_attr(element, 'id')}]")
+                else:
+                    paragraph.parts.append(f"[^E{_attr(element, 'id')}]")
+            elif tag == _W + "pStyle" and paragraphs:
+                paragraphs[-1].style = _attr(element, "val")
+            elif tag == _W + "outlineLvl" and paragraphs and (_attr(element, "val") or "").isdigit():
+                paragraphs[-1].outline_level = int(_attr(element, "val"))
+            elif tag == _W + "p" and paragraphs:
+                paragraph = paragraphs.pop()
+                text = "".join(paragraph.parts).strip()
+                if paragraphs: # A text box: its text continues the enclosing paragraph
+                    if text:
+                        paragraphs[-1].parts.append(" " + text + " ")
+                elif tables and tables[-1] and tables[-1][-1]:
+                    if text:
+                        tables[-1][-1][-1].append(text)
+                elif text:
+                    level = heading_levels.get(paragraph.style, 0)
+                    if paragraph.outline_level is not None and paragraph.outline_level < 9:
+                        level = min(paragraph.outline_level + 1, _MAX_HEADING_LEVEL)
+                    block = ("heading" if level else "paragraph", text, level)
+            elif tag == _W + "tbl" and tables:
+                rows = tables.pop()
+                lines = [" | ".join(" ".join(cell) for cell in row) for row in rows]
+                text = "\n".join(line for line in lines if line.strip(" |"))
+                if tables and tables[-1] and tables[-1][-1]: # A nested table belongs to the enclosing cell
+                    if text:
+                        tables[-1][-1][-1].append(text.replace("\n", "; "))
+                elif paragraphs:
+                    if text:
+                        paragraphs[-1].parts.append(" " + text + " ")
+                elif text:
+                    block = ("table", text, 0)
+
+            if block is not None:
+                if notes:
+                    notes[-1][1].append(block[1])
+                else:
+                    yield block + (None,)
+            if tag in _NOTE_PREFIXES and notes and _attr(element, "type") in (None, "normal"):
+                label, texts = notes.pop()
+                if texts:
+                    yield ("note", " ".join(texts), 0, label)
+
+            # Drop finished blocks so the tree never holds more than the open ones
+            if stack and stack[-1].tag in _BLOCK_PARENTS:
+                stack[-1].remove(element)
+
+
+def iter_docx_blocks(file):
+    """
+    Yields the DocxBlocks of a DOCX file (path or binary file object) in reading order:
+    each distinct page header once, the body, then footnotes and endnotes.
+    """
+    with zipfile.ZipFile(file) as archive:
+        document_part = _read_relationships(archive, "_rels/.rels").get(_OFFICE_DOCUMENT, ["word/document.xml"])[0]
+        relationships = _read_relationships(archive, document_part)
+        styles = relationships.get("/styles", [posixpath.join(posixpath.dirname(document_part), "styles.xml")])[0]
+        heading_levels = _read_heading_levels(archive, styles)
+        parts = archive.namelist()
+
+        seen_headers = set() # First page, even and odd headers often repeat the same text
+        for header in relationships.get("/header", []):
+            if header not in parts:
+                continue
+            for _, text, _, _ in _iter_part_blocks(archive, header, heading_levels):
+                if text not in seen_headers:
+                    seen_headers.add(text)
+                    yield DocxBlock("header", text, 0)
+
+        for kind, text, level, _ in _iter_part_blocks(archive, document_part, heading_levels):
+            yield DocxBlock(kind, text, level)
+
+        for suffix in ("/footnotes", "/endnotes"):
+            for notes_part in relationships.get(suffix, []):
+                if notes_part not in parts:
+                    continue
+                for kind, text, _, label in _iter_part_blocks(archive, notes_part, heading_levels):
+                    if kind == "note":
+                        yield DocxBlock("note", f"[^{label}]: {text}", 0)
+
+
+def format_block(block):
+    """The text of a block as sent to the model; headings are marked with '#' per level."""
+    if block.kind == "heading":
+        return "#" * block.level + " " + block.text
+    return block.text
+
+
+def extract_docx_text(file):
+    """The text of a DOCX file, one block per line (table rows on lines of their own)."""
+    return "\n".join(format_block(block) for block in iter_docx_blocks(file))
@@ -0,0 +1,308 @@
+"""
+Streaming export of generated question banks.
+
+Processed responses are appended to a spooled temporary file as they complete (in memory up
+to config.EXPORT_SPOOL_MAX_MEMORY, on disk beyond), and only a small index of sections is
+kept. Exports read the sections back one at a time in their sort order, so memory stays
+bounded by the largest single section no matter how many pages or types are generated.
+
+Targets:
+  - OLAT tab-separated text (one file, "--- TYPE ---" headed sections)
+  - zip with one OLAT text file per question type
+  - IMS QTI 2.1 content package (one assessmentItem per question)
+"""
+import io
+import shutil
+import tempfile
+import zipfile
+
+from . import config
+from .output_frontmatter import question_blocks
+
+QTI_NAMESPACE = "http://www.imsglobal.org/xsd/imsqti_v2p1"
+IMSCP_NAMESPACE = "http://www.imsglobal.org/xsd/imscp_v1p1"
+# Equivalent to xml.sax.saxutils.escape/quoteattr, which would pull urllib, http and email into the app's cold start
+_ATTR_ESCAPES = {'"': "&quot;", "\n": "&#10;", "\r": "&#13;", "\t": "&#9;"}
+
+
+def _escape(text):
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+def _quoteattr(text):
+    return '"' + "".join(_ATTR_ESCAPES.get(char, char) for char in _escape(text)) + '"'
+
+
+class ExportWriter:
+    """
+    Collects processed responses as sections and writes them to the export targets.
+
+        writer = ExportWriter()
+        writer.add("single_choice", text, sort_key=(0,))      # in completion order
+        writer.write_olat_text(f)                              # in sort_key order
+    """
+
+    def __init__(self, max_memory=None):
+        self._spool = tempfile.SpooledTemporaryFile(max_size=max_memory or config.EXPORT_SPOOL_MAX_MEMORY, mode="w+b")
+        self._sections = [] # (sort_key, sequence, msg_type, heading, offset, length)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def __len__(self):
+        return len(self._sections)
+
+    def close(self):
+        self._spool.close()
+
+    def add(self, msg_type, text, sort_key=None, heading=None):
+        """Appends one processed response. Sections are exported ordered by sort_key (then arrival)."""
+        data = text.strip().encode("utf-8")
+        if not data:
+            return
+        self._spool.seek(0, io.SEEK_END)
+        offset = self._spool.tell()
+        self._spool.write(data)
+        sequence = len(self._sections)
+        self._sections.append((sort_key if sort_key is not None else (sequence,), sequence, msg_type, heading or msg_type.upper(), offset, len(data)))
+
+    def iter_sections(self):
+        """Yields (msg_type, heading, text) in export order, reading one section at a time."""
+        for _, _, msg_type, heading, offset, length in sorted(self._sections, key=lambda section: section[:2]):
+            self._spool.seek(offset)
+            yield msg_type, heading, self._spool.read(length).decode("utf-8")
+
+    # --- OLAT text -------------------------------------------------------------------
+
+    def iter_olat_text(self):
+        """The OLAT text export in chunks, one per section."""
+        for index, (_, heading, text) in enumerate(self.iter_sections()):
+            separator = "" if index == 0 else "\n\n"
+            yield f"{separator}--- {heading} ---\n{text}"
+
+    def write_olat_text(self, fileobj):
+        """Writes the OLAT text export to a binary file object."""
+        for chunk in self.iter_olat_text():
+            fileobj.write(chunk.encode("utf-8"))
+
+    # --- zip of per-type files -------------------------------------------------------
+
+    def write_zip(self, fileobj):
+        """Writes a zip with one '<type>.txt' OLAT file per question type (sections of a type in order)."""
+        by_type = {}
+        for _, _, msg_type, _, _, _ in sorted(self._sections, key=lambda section: section[:2]):
+            by_type.setdefault(msg_type, 0)
+            by_type[msg_type] += 1
+        with zipfile.ZipFile(fileobj, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+            for msg_type, count in by_type.items():
+                with archive.open(f"{msg_type}.txt", "w") as member:
+                    first = True
+                    for section_type, heading, text in self.iter_sections():
+                        if section_type != msg_type:
+                            continue
+                        prefix = "" if first else "\n\n"
+                        if count > 1:
+                            prefix += f"--- {heading} ---\n"
+                        member.write((prefix + text).encode("utf-8"))
+                        first = False
+
+    # --- QTI -------------------------------------------------------------------------
+
+    def write_qti(self, fileobj):
+        """
+        Writes an IMS QTI 2.1 content package: one item per question plus imsmanifest.xml.
+        Returns the number of questions that could not be converted and were left out.
+        """
+        resources = []
+        skipped = 0
+        with zipfile.ZipFile(fileobj, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+            for _, _, text in self.iter_sections():
+                for block in question_blocks(text):
+                    question = parse_olat_question(block)
+                    identifier = f"item{len(resources) + 1:05d}"
+                    item_xml = qti_item_xml(question, identifier) if question else None
+                    if item_xml is None:
+                        skipped += 1
+                        continue
+                    href = f"items/{identifier}.xml"
+                    archive.writestr(href, item_xml)
+                    resources.append((identifier, href))
+            archive.writestr("imsmanifest.xml", _qti_manifest(resources))
+        return skipped
+
+    # --- convenience -----------------------------------------------------------------
+
+    def to_file(self, export_format):
+        """Returns the export ('txt', 'zip' or 'qti') as a rewound spooled binary file."""
+        output = tempfile.SpooledTemporaryFile(max_size=config.EXPORT_SPOOL_MAX_MEMORY, mode="w+b")
+        if export_format == "txt":
+            self.write_olat_text(output)
+        elif export_format == "zip":
+            self.write_zip(output)
+        elif export_format == "qti":
+            self.write_qti(output)
+        else:
+            raise ValueError(f"Unknown export format: {export_format}")
+        output.seek(0)
+        return output
+
+    def save(self, path, export_format):
+        """Writes the export ('txt', 'zip' or 'qti') to 'path'."""
+        with self.to_file(export_format) as source, open(path, "wb") as target:
+            shutil.copyfileobj(source, target)
+
+
+EXPORT_FILE_SUFFIXES = {"txt": ".txt", "zip": ".zip", "qti": "_qti.zip"}
+EXPORT_MIME_TYPES = {"txt": "text/plain", "zip": "application/zip", "qti": "application/zip"}
+
+
+# --- OLAT text -> question structure -------------------------------------------------
+
+def parse_olat_question(block):
+    """
+    Parses one OLAT text question into a dict:
+      {"type", "title", "question", "points", "choices": [(text, correct)], "segments": [...]}
+    'segments' (FIB/Inlinechoice) alternates ("text", str) and ("gap", answer, options).
+    Returns None if the block is not a recognizable question.
+    """
+    question = {"type": None, "title": "", "question": "", "points": 1.0, "choices": [], "segments": []}
+    for line in block.splitlines():
+        fields = line.split("\t")
+        key = fields[0].strip()
+        value = fields[1].strip() if len(fields) > 1 else ""
+        if key in ("Typ", "Type"):
+            question["type"] = value.upper()
+        elif key == "Title":
+            question["title"] = value
+        elif key == "Question":
+            question["question"] = value
+        elif key == "Points":
+            question["points"] = _as_float(value, 1.0)
+        elif key == "Text":
+            question["segments"].append(("text", value))
+        elif question["type"] == "FIB" and len(fields) >= 2 and _as_float(key) is not None:
+            question["segments"].append(("gap", value, []))
+        elif question["type"] == "INLINECHOICE" and len(fields) >= 3:
+            options = [option for option in value.split("|") if option]
+            question["segments"].append(("gap", fields[2].strip(), options))
+        elif len(fields) >= 2 and (key in ("+", "-") or _as_float(key) is not None) and value:
+            correct = key == "+" or (key not in ("+", "-") and _as_float(key) > 0)
+            question["choices"].append((value, correct))
+    if not question["type"]:
+        return None
+    if question["type"] in ("FIB", "INLINECHOICE"):
+        return question if any(segment[0] == "gap" for segment in question["segments"]) else None
+    return question if question["choices"] else None
+
+
+def _as_float(value, default=None):
+    try:
+        return float(value.replace(",", "."))
+    except (AttributeError, ValueError):
+        return default
+
+
+def qti_item_xml(question, identifier):
+    """QTI 2.1 assessmentItem for a parsed question, or None for unsupported shapes."""
+    title = question["title"] or question["question"][:60] or identifier
+    header = (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        f'<assessmentItem xmlns="{QTI_NAMESPACE}" identifier={_quoteattr(identifier)} '
+        f'title={_quoteattr(title)} adaptive="false" timeDependent="false">\n'
+    )
+    score = (
+        '  <outcomeDeclaration identifier="SCORE" cardinality="single" baseType="float">'
+        '<defaultValue><value>0</value></defaultValue></outcomeDeclaration>\n'
+    )
+    if question["type"] in ("FIB", "INLINECHOICE"):
+        return header + _gap_item_body(question, score) + "</assessmentItem>\n"
+
+    correct = [f"C{index}" for index, (_, is_correct) in enumerate(question["choices"], start=1) if is_correct]
+    if not correct:
+        return None
+    single = question["type"] == "SC" and len(correct) == 1
+    values = "".join(f"<value>{choice_id}</value>" for choice_id in correct)
+    choices = "".join(
+        f'      <simpleChoice identifier="C{index}">{_escape(text)}</simpleChoice>\n'
+        for index, (text, _) in enumerate(question["choices"], start=1)
+    )
+    return (
+        header
+        + f'  <responseDeclaration identifier="RESPONSE" cardinality="{"single" if single else "multiple"}" baseType="identifier">'
+        + f'<correctResponse>{values}</correctResponse></responseDeclaration>\n'
+        + score
+        + '  <itemBody>\n'
+        + f'    <choiceInteraction responseIdentifier="RESPONSE" shuffle="true" maxChoices="{1 if single else 0}">\n'
+        + f'      <prompt>{_escape(question["question"])}</prompt>\n'
+        + choices
+        + '    </choiceInteraction>\n'
+        + '  </itemBody>\n'
+        + '  <responseProcessing template="http://www.imsglobal.org/question/qti_v2p1/rptemplates/match_correct"/>\n'
+        + "</assessmentItem>\n"
+    )
+
+
+def _gap_item_body(question, score):
+    declarations, body, processing = [], [], []
+    gap_number = 0
+    for segment in question["segments"]:
+        if segment[0] == "text":
+            body.append(_escape(segment[1]))
+            continue
+        gap_number += 1
+        _, answer, options = segment
+        response_id = f"RESPONSE_{gap_number}"
+        if options:
+            choice_ids = {}
+            for option in options:
+                choice_ids.setdefault(option, f"G{gap_number}_{len(choice_ids) + 1}")
+            choice_ids.setdefault(answer, f"G{gap_number}_{len(choice_ids) + 1}")
+            declarations.append(
+                f'  <responseDeclaration identifier="{response_id}" cardinality="single" baseType="identifier">'
+                f'<correctResponse><value>{choice_ids[answer]}</value></correctResponse></responseDeclaration>\n'
+            )
+            choices = "".join(f'<inlineChoice identifier="{choice_id}">{_escape(option)}</inlineChoice>' for option, choice_id in choice_ids.items())
+            body.append(f'<inlineChoiceInteraction responseIdentifier="{response_id}" shuffle="true">{choices}</inlineChoiceInteraction>')
+        else:
+            declarations.append(
+                f'  <responseDeclaration identifier="{response_id}" cardinality="single" baseType="string">'
+                f'<correctResponse><value>{_escape(answer)}</value></correctResponse></responseDeclaration>\n'
+            )
+            body.append(f'<textEntryInteraction responseIdentifier="{response_id}" expectedLength="20"/>')
+        processing.append(
+            f'    <responseCondition><responseIf><match><variable identifier="{response_id}"/><correct identifier="{response_id}"/></match>'
+            '<setOutcomeValue identifier="SCORE"><sum><variable identifier="SCORE"/><baseValue baseType="float">1</baseValue></sum></setOutcomeValue>'
+            '</responseIf></responseCondition>\n'
+        )
+    prompt = f"    <p>{_escape(question['question'])}</p>\n" if question["question"] else ""
+    return (
+        "".join(declarations)
+        + score
+        + "  <itemBody>\n"
+        + prompt
+        + f"    <p>{' '.join(body)}</p>\n"
+        + "  </itemBody>\n"
+        + "  <responseProcessing>\n"
+        + "".join(processing)
+        + "  </responseProcessing>\n"
+    )
+
+
+def _qti_manifest(resources):
+    entries = "".join(
+        f'    <resource identifier="{identifier}" type="imsqti_item_xmlv2p1" href="{href}"><file href="{href}"/></resource>\n'
+        for identifier, href in resources
+    )
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        f'<manifest xmlns="{IMSCP_NAMESPACE}" identifier="MANIFEST-OLAT-QUESTIONS">\n'
+        "  <organizations/>\n"
+        "  <resources>\n"
+        + entries
+        + "  </resources>\n"
+        "</manifest>\n"
+    )
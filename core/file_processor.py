@@ -1,99 +1,160 @@
-import base64
-import io
-from PIL import Image
-import PyPDF2
-import docx
-from pdf2image import convert_from_bytes
+import os
 import streamlit as st # For @st.cache_data
+# pdf2image is imported in the functions that need it (PyPDF2 in core.pdf_text); DOCX files are
+# read with the standard library in core.docx_text, so a PDF upload does not pay for the DOCX parser
 
-@st.cache_data
-def convert_pdf_to_images(file_bytes):
-    """Convert PDF pages to images."""
-    images = convert_from_bytes(file_bytes)
-    return images
+from . import config
+from .image_pipeline import prepare_image_for_api
+from .docx_text import extract_docx_text
+from .pdf_text import extract_pdf_text
+from .tracing import traced
 
-@st.cache_data
-def extract_text_from_pdf(file):
-    """Extract text from PDF using PyPDF2."""
+MAX_IMAGE_SIZE = config.IMAGE_MAX_SIZE  # Longest image side; reduced to limit memory and image tokens
+
+
+def get_pdf_page_count(file_bytes):
+    """Number of pages of a PDF, read from the document info without rendering anything."""
+    from pdf2image import pdfinfo_from_bytes
+    return int(pdfinfo_from_bytes(file_bytes)["Pages"])
+
+
+def _raster_dpi(pdf_info):
+    """
+    DPI at which the largest page side renders at about MAX_IMAGE_SIZE pixels.
+    Rendering at the default 200 DPI and downscaling afterwards wastes time and memory.
+    """
+    try:
+        # e.g. "595.276 x 841.89 pts (A4)"
+        width_pts, _, height_pts = pdf_info["Page size"].split()[:3]
+        dpi = MAX_IMAGE_SIZE * 72 / max(float(width_pts), float(height_pts))
+    except (KeyError, ValueError):
+        dpi = config.PDF_RASTER_MAX_DPI
+    return max(config.PDF_RASTER_MIN_DPI, min(config.PDF_RASTER_MAX_DPI, int(dpi)))
+
+
+def iter_pdf_page_images(file_bytes, first_page=1, last_page=None, dpi=None, chunk_size=None):
+    """
+    Lazily renders PDF pages, yielding (page_number, PIL image) pairs.
+    Pages are rendered in chunks of 'chunk_size' with one poppler thread per page of a chunk,
+    so at most one chunk of full images is held in memory at a time.
+    """
+    from pdf2image import convert_from_bytes, pdfinfo_from_bytes
+    if last_page is None or dpi is None:
+        pdf_info = pdfinfo_from_bytes(file_bytes)
+        last_page = last_page or int(pdf_info["Pages"])
+        dpi = dpi or _raster_dpi(pdf_info)
+    chunk_size = chunk_size or config.PDF_RASTER_CHUNK_SIZE
+    thread_count = max(1, min(chunk_size, os.cpu_count() or 1))
+
+    for chunk_first in range(first_page, last_page + 1, chunk_size):
+        chunk_last = min(chunk_first + chunk_size - 1, last_page)
+        images = convert_from_bytes(
+            file_bytes,
+            dpi=dpi,
+            first_page=chunk_first,
+            last_page=chunk_last,
+            thread_count=thread_count
+        )
+        for offset, image in enumerate(images):
+            yield chunk_first + offset, image
+        del images
+
+
+@st.cache_data(max_entries=16)
+def convert_pdf_to_images(file_bytes, first_page=1, last_page=None):
+    """
+    Convert PDF pages (optionally a page range) to API-ready images.
+    Returns a list of prepared images (see image_pipeline.prepare_image_for_api), one per page.
+    The lossless renders go straight into the pipeline, so every page is JPEG-encoded only once;
+    only the compact results are cached, the rendered pages are released one at a time.
+    """
+    return [
+        prepare_image_for_api(image)
+        for _, image in iter_pdf_page_images(file_bytes, first_page=first_page, last_page=last_page)
+    ]
+
+def _read_pdf_bytes(file):
     # Ensure the file pointer is at the beginning
     file.seek(0)
-    pdf_reader = PyPDF2.PdfReader(file)
-    text = ""
-    for page in pdf_reader.pages:
-        page_text = page.extract_text()
-        if page_text:
-            text += page_text
-    return text.strip()
+    return file.read()
+
+def extract_page_texts_from_pdf(file, first_page=1, last_page=None):
+    """Extract the text of each page (optionally a 1-based page range); one string per page."""
+    return extract_pdf_text(_read_pdf_bytes(file), first_page, last_page).pages()
+
+def extract_text_from_pdf(file, first_page=1, last_page=None):
+    """Extract text from PDF (optionally a 1-based page range); cached by content hash in core.pdf_text."""
+    return extract_pdf_text(_read_pdf_bytes(file), first_page, last_page).text.strip()
 
 @st.cache_data
 def extract_text_from_docx(file):
-    """Extract text from DOCX file."""
-    # Ensure the file pointer is at the beginning
-    file.seek(0)
-    doc = docx.Document(file)
-    text = "\n".join([paragraph.text for paragraph in doc.paragraphs])
-    return text.strip()
-
-def process_image_for_api(_image):
     """
-    Process and resize an image to base64 string for API usage.
-    Reduces memory footprint.
+    Extract text from DOCX file: headers, headings (marked with '#'), paragraphs, table rows
+    and footnotes in reading order, streamed from the zip by core.docx_text.
     """
-    if isinstance(_image, (str, bytes)): # If already base64 string or bytes
-        if isinstance(_image, str): # If base64 string, decode first
-             img_bytes = base64.b64decode(_image)
-        else: # If raw bytes
-            img_bytes = _image
-        img = Image.open(io.BytesIO(img_bytes))
-    elif isinstance(_image, Image.Image): # If PIL Image object
-        img = _image
-    else: # Assume it's a file-like object (e.g., UploadedFile)
-        img = Image.open(_image)
-
-    # Convert to RGB mode if it's not
-    if img.mode != 'RGB':
-        img = img.convert('RGB')
-
-    # Resize if the image is too large
-    max_size = 1000  # Reduced max size to reduce memory consumption
-    if max(img.size) > max_size:
-        img.thumbnail((max_size, max_size))
-
-    # Save to bytes
-    img_byte_arr = io.BytesIO()
-    img.save(img_byte_arr, format='JPEG') # Using JPEG for smaller size
-    img_byte_arr = img_byte_arr.getvalue()
-
-    return base64.b64encode(img_byte_arr).decode('utf-8')
-
+    # Ensure the file pointer is at the beginning
+    file.seek(0)
+    return extract_docx_text(file).strip()
 
-@st.cache_data
 def is_pdf_ocr(text):
     """Placeholder function to determine if PDF is OCRed."""
     # A simple heuristic: if text is very short, it might not be OCRed properly.
     # This is a basic check and can be improved.
     return len(text) > 100 # Arbitrary threshold, adjust as needed
 
-def process_uploaded_pdf(uploaded_file):
+def _page_runs(page_numbers):
+    """Groups sorted page numbers into (first, last) runs of consecutive pages."""
+    runs = []
+    for page_number in page_numbers:
+        if runs and runs[-1][1] == page_number - 1:
+            runs[-1][1] = page_number
+        else:
+            runs.append([page_number, page_number])
+    return [tuple(run) for run in runs]
+
+@traced()
+def process_uploaded_pdf(uploaded_file, first_page=1, last_page=None):
     """
-    Processes an uploaded PDF file.
+    Processes an uploaded PDF file, optionally restricted to a 1-based page range.
+    Every page is classified on its own: pages with enough extractable text use the text,
+    only the remaining (scanned) pages are rasterized.
     Returns (text_content, images_from_pdf)
-    text_content is None if PDF is not OCRed or text extraction fails.
-    images_from_pdf is None if text extraction is successful.
+    text_content is None if no page has usable text.
+    images_from_pdf (prepared images, one per scanned page) is None if every page has text.
+    For mixed PDFs both are set; the text then marks which pages are attached as images.
     """
-    # Ensure the file pointer is at the beginning for multiple reads if necessary
-    uploaded_file.seek(0)
-    text_content = extract_text_from_pdf(uploaded_file)
-    
-    uploaded_file.seek(0) # Reset pointer again before potential image conversion
-    if text_content and is_pdf_ocr(text_content):
-        return text_content, None
-    else:
-        # Fallback to image processing
+    file_bytes = _read_pdf_bytes(uploaded_file) # Read once, for the text and the page images
+    pdf_text = extract_pdf_text(file_bytes, first_page, last_page)
+    page_texts = pdf_text.pages()
+    page_numbers = range(first_page, first_page + len(page_texts))
+    scanned_pages = [number for number, text in zip(page_numbers, page_texts) if not is_pdf_ocr(text.strip())]
+
+    if not scanned_pages:
+        return pdf_text.text.strip(), None
+
+    if len(scanned_pages) == len(page_texts):
         st.warning("Attempting to convert PDF to images as text extraction was insufficient.")
-        try:
-            images = convert_pdf_to_images(uploaded_file.read())
-            return None, images
-        except Exception as e:
-            st.error(f"Failed to convert PDF to images: {e}")
-            return None, None
\ No newline at end of file
+    else:
+        st.info(f"{len(scanned_pages)} von {len(page_texts)} Seite(n) enthalten keinen verwertbaren Text und werden als Bilder verarbeitet.")
+    try:
+        images = []
+        # Only the scanned pages are rendered, in runs of consecutive pages
+        for run_first, run_last in _page_runs(scanned_pages):
+            images.extend(convert_pdf_to_images(file_bytes, run_first, run_last))
+    except Exception as e:
+        st.error(f"Failed to convert PDF to images: {e}")
+        images = None
+
+    if len(scanned_pages) == len(page_texts):
+        return None, images
+
+    scanned = set(scanned_pages)
+    image_index = {number: idx + 1 for idx, number in enumerate(scanned_pages)}
+    sections = []
+    for number, text in zip(page_numbers, page_texts):
+        if number in scanned:
+            if images:
+                sections.append(f"[Seite {number}: siehe angehängtes Bild {image_index[number]}]")
+        else:
+            sections.append(f"[Seite {number}]\n{text.strip()}")
+    return "\n\n".join(sections), images
@@ -0,0 +1,250 @@
+"""
+Image preparation for vision requests.
+
+Every image is identified by a hash of its content. Each distinct image is analysed and
+encoded once: results are kept in memory for the session and on disk across sessions.
+Preparation crops surrounding whitespace, converts scanned text to grayscale, picks the
+OpenAI detail level from the text density, and sizes the image so that it uses as few
+512px tiles (image tokens) as its content allows.
+"""
+import base64
+import hashlib
+import io
+import json
+import logging
+import math
+import os
+import threading
+from collections import OrderedDict
+
+from PIL import Image, ImageFilter, ImageStat
+
+from . import config
+
+PIPELINE_VERSION = 1 # Bump when the preparation changes, so stale disk entries are ignored
+LOW_DETAIL_SIZE = 512 # The API downsizes low-detail images to 512px anyway
+
+
+class LRUCache:
+    """Small thread-safe in-memory LRU mapping."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._data:
+                return None
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+def load_image_bytes(_image):
+    """Returns the raw encoded bytes for base64 strings, bytes and file-like objects; None for PIL images."""
+    if isinstance(_image, str):
+        return base64.b64decode(_image)
+    if isinstance(_image, bytes):
+        return _image
+    if isinstance(_image, Image.Image):
+        return None
+    _image.seek(0)
+    data = _image.read()
+    _image.seek(0)
+    return data
+
+
+def content_hash(_image):
+    """SHA-256 of the image content: of the encoded bytes, or of the pixels for PIL images."""
+    data = load_image_bytes(_image)
+    digest = hashlib.sha256()
+    if data is None:
+        digest.update(f"{_image.mode}:{_image.size}".encode("utf-8"))
+        digest.update(_image.tobytes())
+    else:
+        digest.update(data)
+    return digest.hexdigest()
+
+
+def open_image(_image):
+    """Opens any supported image input as a PIL image."""
+    data = load_image_bytes(_image)
+    return _image if data is None else Image.open(io.BytesIO(data))
+
+
+def to_rgb(img):
+    """Converts to RGB, flattening transparency onto white instead of black."""
+    if img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info):
+        img = img.convert("RGBA")
+        background = Image.new("RGB", img.size, (255, 255, 255))
+        background.paste(img, mask=img.getchannel("A"))
+        return background
+    return img.convert("RGB") if img.mode != "RGB" else img
+
+
+def estimate_image_tokens(width, height, detail):
+    """Input tokens OpenAI bills for an image (85 base + 170 per 512px tile in high detail)."""
+    if detail == "low":
+        return 85
+    scale = min(1.0, 2048 / max(width, height)) # Fit into 2048x2048
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height)) # Shortest side at most 768
+    width, height = width * scale, height * scale
+    return 85 + 170 * math.ceil(width / 512) * math.ceil(height / 512)
+
+
+def _fit_tile_budget(width, height, max_tiles):
+    """Largest size (keeping the aspect ratio) whose high-detail tile count stays within max_tiles."""
+    scale = 1.0
+    while scale > 0.1 and (estimate_image_tokens(width * scale, height * scale, "high") - 85) / 170 > max_tiles:
+        scale *= 0.95
+    return max(1, int(width * scale)), max(1, int(height * scale))
+
+
+def crop_whitespace(img):
+    """Crops uniform light margins (typical for scans) if that removes a noticeable part of the image."""
+    mask = img.convert("L").point(lambda p: 255 if p < config.IMAGE_WHITESPACE_THRESHOLD else 0)
+    bbox = mask.getbbox()
+    if not bbox:
+        return img
+    margin = int(max(img.size) * 0.01)
+    left, top, right, bottom = bbox
+    bbox = (max(0, left - margin), max(0, top - margin), min(img.width, right + margin), min(img.height, bottom + margin))
+    cropped_area = (bbox[2] - bbox[0]) * (bbox[3] - bbox[1])
+    if cropped_area > 0.9 * img.width * img.height:
+        return img
+    return img.crop(bbox)
+
+
+def analyze_image(img):
+    """
+    Cheap content statistics on a small thumbnail:
+    saturation (0..1), share of light background pixels, and edge (text) density.
+    """
+    thumb = img.copy()
+    thumb.thumbnail((256, 256))
+    saturation = ImageStat.Stat(thumb.convert("HSV").getchannel("S")).mean[0] / 255
+    gray = thumb.convert("L")
+    pixels = gray.width * gray.height
+    light_share = sum(gray.histogram()[200:]) / pixels
+    edges = gray.filter(ImageFilter.FIND_EDGES)
+    edge_density = sum(edges.histogram()[64:]) / pixels
+    return {"saturation": saturation, "light_share": light_share, "edge_density": edge_density}
+
+
+def choose_detail(stats):
+    """High detail only for text-dense documents, where low detail would make the text unreadable."""
+    if config.IMAGE_DETAIL in ("low", "high"):
+        return config.IMAGE_DETAIL
+    is_document = stats["light_share"] >= 0.5
+    return "high" if is_document and stats["edge_density"] >= config.IMAGE_TEXT_DENSITY_HIGH_DETAIL else "low"
+
+
+def _prepare(image):
+    img = to_rgb(image)
+    if config.IMAGE_CROP_WHITESPACE:
+        img = crop_whitespace(img)
+    stats = analyze_image(img)
+    detail = choose_detail(stats)
+    if stats["saturation"] < config.IMAGE_GRAYSCALE_MAX_SATURATION:
+        img = img.convert("L") # Scanned text: grayscale JPEGs are markedly smaller
+    if img is image:
+        img = img.copy() # thumbnail() resizes in place; the caller's image must stay as it is
+
+    if detail == "low":
+        img.thumbnail((LOW_DETAIL_SIZE, LOW_DETAIL_SIZE))
+    else:
+        img.thumbnail((config.IMAGE_MAX_SIZE, config.IMAGE_MAX_SIZE))
+        width, height = _fit_tile_budget(img.width, img.height, config.IMAGE_MAX_TILES)
+        if (width, height) != img.size:
+            img = img.resize((width, height), Image.LANCZOS)
+
+    quality = config.IMAGE_JPEG_QUALITY_TEXT if detail == "high" else config.IMAGE_JPEG_QUALITY
+    buffer = io.BytesIO()
+    img.save(buffer, format="JPEG", quality=quality, optimize=True)
+    return {
+        "data": base64.b64encode(buffer.getvalue()).decode("utf-8"),
+        "detail": detail,
+        "tokens": estimate_image_tokens(img.width, img.height, detail),
+    }
+
+
+_memory_cache = LRUCache(config.IMAGE_CACHE_MAX_ENTRIES)
+
+
+def _disk_path(key):
+    return os.path.join(config.IMAGE_CACHE_DIR, f"{key}.json") if config.IMAGE_CACHE_DIR else None
+
+
+def _prune_disk_cache():
+    """Keeps the newest IMAGE_CACHE_MAX_FILES entries of the disk cache."""
+    entries = sorted(os.scandir(config.IMAGE_CACHE_DIR), key=lambda entry: entry.stat().st_mtime, reverse=True)
+    for entry in entries[config.IMAGE_CACHE_MAX_FILES:]:
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
+
+
+def _settings_key():
+    """Every setting _prepare depends on, so changing one of them invalidates the cached results."""
+    return ":".join(str(value) for value in (
+        PIPELINE_VERSION, config.IMAGE_DETAIL, config.IMAGE_MAX_TILES, config.IMAGE_MAX_SIZE,
+        config.IMAGE_JPEG_QUALITY, config.IMAGE_JPEG_QUALITY_TEXT, config.IMAGE_CROP_WHITESPACE,
+        config.IMAGE_WHITESPACE_THRESHOLD, config.IMAGE_TEXT_DENSITY_HIGH_DETAIL, config.IMAGE_GRAYSCALE_MAX_SATURATION
+    ))
+
+
+def clear_cache():
+    """Empties the in-memory cache (the disk cache is kept)."""
+    _memory_cache.clear()
+
+
+def prepare_image_for_api(_image):
+    """
+    Prepares an image (PIL image, base64 string, bytes or file-like object) for a vision request.
+    Returns {"data": base64 JPEG, "detail": "low" | "high", "tokens": estimated image tokens};
+    results are cached by content hash and settings in memory and on disk.
+    Already prepared images (e.g. the pages from file_processor.convert_pdf_to_images) are returned as they are.
+    """
+    if isinstance(_image, dict):
+        return _image
+    key = hashlib.sha256(f"{content_hash(_image)}:{_settings_key()}".encode("utf-8")).hexdigest()
+    prepared = _memory_cache.get(key)
+    if prepared is not None:
+        return prepared
+
+    path = _disk_path(key)
+    if path and os.path.exists(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                prepared = json.load(f)
+        except (OSError, ValueError):
+            prepared = None
+
+    if prepared is None:
+        prepared = _prepare(open_image(_image))
+        if path:
+            try:
+                os.makedirs(config.IMAGE_CACHE_DIR, exist_ok=True)
+                with open(path, "w", encoding="utf-8") as f:
+                    json.dump(prepared, f)
+                if len(os.listdir(config.IMAGE_CACHE_DIR)) > config.IMAGE_CACHE_MAX_FILES:
+                    _prune_disk_cache()
+            except OSError as e:
+                logging.warning(f"Could not write image cache entry: {e}")
+
+    _memory_cache.set(key, prepared)
+    return prepared
@@ -0,0 +1,206 @@
+"""
+Single-pass tolerant JSON parser for LLM output.
+
+Accepts what models typically get wrong: prose or ``` code fences around the JSON,
+trailing (or doubled) commas, raw newlines and tabs inside strings, invalid escapes,
+Python literals (True/False/None), and output truncated by max_tokens. For a truncated
+document every complete element is kept and only the unfinished one is dropped.
+"""
+import json
+import re
+
+_NUMBER_RE = re.compile(r'-?(?:\d+)(?:\.\d+)?(?:[eE][+-]?\d+)?')
+_LITERALS = {"true": True, "false": False, "null": None, "True": True, "False": False, "None": None}
+_ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+_WHITESPACE = " \t\n\r"
+_CONTAINER_START_RE = re.compile(r'[\[{]')
+
+
+class _Truncated(Exception):
+    """The input ended inside a value; 'partial' is what could be recovered of it (or None)."""
+
+    def __init__(self, partial=None):
+        super().__init__()
+        self.partial = partial
+
+
+class _TolerantParser:
+    def __init__(self, text):
+        self.text = text
+        self.pos = 0
+        self.end = len(text)
+
+    def error(self, message):
+        return json.JSONDecodeError(message, self.text, self.pos)
+
+    def skip_whitespace(self):
+        while self.pos < self.end and self.text[self.pos] in _WHITESPACE:
+            self.pos += 1
+
+    def parse(self):
+        """
+        Tries every '[' / '{' in turn, since prose before the JSON may contain brackets too
+        ("Here are [3] items: [...]"). The first object, or array of objects, wins; otherwise
+        the first value that parsed at all. A truncated value ends the search, it reached the end.
+        """
+        first_value, first_error = None, None
+        resume = 0
+        for match in _CONTAINER_START_RE.finditer(self.text):
+            if match.start() < resume:
+                continue # Nested inside a value that already parsed
+            self.pos = match.start()
+            try:
+                value = self.value()
+            except _Truncated as truncated:
+                if truncated.partial is None:
+                    raise self.error("Truncated before any complete value")
+                return truncated.partial, False
+            except json.JSONDecodeError as e:
+                first_error = first_error or e
+                continue
+            if isinstance(value, dict) or (value and all(isinstance(item, dict) for item in value)):
+                return value, True
+            if first_value is None:
+                first_value = value
+            resume = self.pos
+        if first_value is not None:
+            return first_value, True
+        raise first_error or self.error("No JSON array or object found")
+
+    def value(self):
+        self.skip_whitespace()
+        if self.pos >= self.end:
+            raise _Truncated()
+        char = self.text[self.pos]
+        if char == '{':
+            return self.object()
+        if char == '[':
+            return self.array()
+        if char == '"':
+            return self.string()
+        match = _NUMBER_RE.match(self.text, self.pos)
+        if match:
+            if match.end() >= self.end:
+                raise _Truncated() # The number may continue beyond the cut
+            self.pos = match.end()
+            number = match.group(0)
+            return float(number) if any(c in number for c in '.eE') else int(number)
+        for literal, literal_value in _LITERALS.items():
+            if self.text.startswith(literal, self.pos):
+                self.pos += len(literal)
+                return literal_value
+            if literal.startswith(self.text[self.pos:self.end]):
+                raise _Truncated() # e.g. "tr" at the very end
+        raise self.error(f"Unexpected character {char!r}")
+
+    def array(self):
+        self.pos += 1 # '['
+        items = []
+        while True:
+            self.skip_whitespace()
+            if self.pos >= self.end:
+                raise _Truncated(items)
+            char = self.text[self.pos]
+            if char == ']':
+                self.pos += 1
+                return items
+            if char == ',':
+                self.pos += 1 # Also skips trailing and doubled commas
+                continue
+            try:
+                items.append(self.value())
+            except _Truncated:
+                raise _Truncated(items) # Keep the complete items, drop the unfinished one
+
+    def object(self):
+        self.pos += 1 # '{'
+        obj = {}
+        while True:
+            self.skip_whitespace()
+            if self.pos >= self.end:
+                raise _Truncated(obj)
+            char = self.text[self.pos]
+            if char == '}':
+                self.pos += 1
+                return obj
+            if char == ',':
+                self.pos += 1
+                continue
+            try:
+                key = self.string() if char == '"' else self.bare_key()
+            except _Truncated:
+                raise _Truncated(obj)
+            self.skip_whitespace()
+            if self.pos >= self.end:
+                raise _Truncated(obj)
+            if self.text[self.pos] != ':':
+                raise self.error("Expected ':' after object key")
+            self.pos += 1
+            try:
+                obj[key] = self.value()
+            except _Truncated as truncated:
+                # Keep recovered containers (e.g. the complete items of a cut-off list)
+                if isinstance(truncated.partial, (list, dict)):
+                    obj[key] = truncated.partial
+                raise _Truncated(obj)
+
+    def bare_key(self):
+        match = re.compile(r'[A-Za-z_][\w\-]*').match(self.text, self.pos)
+        if not match:
+            raise self.error("Expected object key")
+        self.pos = match.end()
+        return match.group(0)
+
+    def string(self):
+        self.pos += 1 # Opening quote
+        chunks = []
+        chunk_start = self.pos
+        text = self.text
+        while True:
+            next_special = self.pos
+            while next_special < self.end and text[next_special] not in '"\\':
+                next_special += 1 # Raw newlines and other control characters are kept as they are
+            if next_special >= self.end:
+                raise _Truncated()
+            chunks.append(text[chunk_start:next_special])
+            self.pos = next_special
+            if text[self.pos] == '"':
+                self.pos += 1
+                return "".join(chunks)
+            # Backslash escape
+            if self.pos + 1 >= self.end:
+                raise _Truncated()
+            escape = text[self.pos + 1]
+            if escape == 'u':
+                digits = text[self.pos + 2:self.pos + 6]
+                if len(digits) < 4:
+                    raise _Truncated()
+                try:
+                    chunks.append(chr(int(digits, 16)))
+                    self.pos += 6
+                except ValueError:
+                    chunks.append(escape) # Invalid \u escape: keep the letter
+                    self.pos += 2
+            else:
+                chunks.append(_ESCAPES.get(escape, escape)) # Unknown escapes keep the character
+                self.pos += 2
+            chunk_start = self.pos
+
+
+def loads_tolerant(text):
+    """
+    Parses the first JSON object, or array of objects, in 'text' (falling back to the first
+    array of other values).
+    Returns (value, complete); complete is False if the input was truncated and 'value'
+    holds only the recovered complete elements. Raises json.JSONDecodeError if nothing
+    could be recovered.
+    """
+    if not isinstance(text, str):
+        raise TypeError("loads_tolerant expects a string")
+    stripped = text.strip()
+    if stripped[:1] in ('[', '{'):
+        try:
+            return json.loads(stripped), True # Fast path for well-formed output
+        except json.JSONDecodeError:
+            pass
+    return _TolerantParser(text).parse()
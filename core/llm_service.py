@@ -1,49 +1,255 @@
 # In core/llm_service.py
-def generate_via_llm(provider: str, api_key: str, model_name: str, system_prompt: str, user_prompt: str, images_base64_list: list = None, settings: dict = None):
+import asyncio
+import threading
+
+from . import config
+from . import tracing
+from .chunker import estimate_tokens
+from .response_cache import get_response_cache, make_cache_key
+from .router import get_router
+from .scheduler import get_scheduler
+
+
+def build_llm_settings(msg_type: str):
+    """Default generation settings for a question type."""
+    llm_settings = {
+        "temperature": config.DEFAULT_TEMPERATURE,
+        "max_tokens": config.DEFAULT_MAX_TOKENS,
+    }
+    # If the prompt type is expected to be JSON (e.g. inline_fib), set response_format
+    if msg_type == "inline_fib":
+        llm_settings["response_format"] = {"type": "json_object"}
+    return llm_settings
+
+
+def build_combined_llm_settings(selected_types: list):
+    """
+    Settings for generating several question types in one request: a strict JSON schema with
+    one field per type (OLAT plain text, or the item list for inline_fib).
+    """
+    inline_fib_items = {
+        "type": "array",
+        "items": {
+            "type": "object",
+            "properties": {
+                "text": {"type": "string"},
+                "blanks": {"type": "array", "items": {"type": "string"}},
+                "wrong_substitutes": {"type": "array", "items": {"type": "string"}},
+            },
+            "required": ["text", "blanks", "wrong_substitutes"],
+            "additionalProperties": False,
+        },
+    }
+    properties = {
+        msg_type: inline_fib_items if msg_type == "inline_fib" else {"type": "string"}
+        for msg_type in selected_types
+    }
+    return {
+        "temperature": config.DEFAULT_TEMPERATURE,
+        "max_tokens": config.COMBINED_MAX_TOKENS,
+        "response_format": {
+            "type": "json_schema",
+            "json_schema": {
+                "name": "question_sets",
+                "strict": True,
+                "schema": {
+                    "type": "object",
+                    "properties": properties,
+                    "required": list(selected_types),
+                    "additionalProperties": False,
+                },
+            },
+        },
+    }
+
+
+def estimate_request_tokens(system_prompt: str, user_prompt: str, images_base64_list: list = None, settings: dict = None):
+    """Tokens a request counts against the provider's TPM limit: prompt + images + max_tokens."""
+    max_tokens = (settings or {}).get("max_tokens", config.DEFAULT_MAX_TOKENS)
+    images_tokens = sum(
+        image.get("tokens", config.IMAGE_TOKEN_ESTIMATE) if isinstance(image, dict) else config.IMAGE_TOKEN_ESTIMATE
+        for image in (images_base64_list or [])
+    )
+    return estimate_tokens(system_prompt) + estimate_tokens(user_prompt) + images_tokens + max_tokens
+
+
+def generate_via_llm(provider: str, api_key: str, model_name: str, system_prompt: str, user_prompt: str, images_base64_list: list = None, settings: dict = None, use_cache: bool = True, priority: int = None):
     """
     Generic function to interact with an LLM provider.
+    Responses are served from / stored in the persistent response cache; provider calls go
+    through the shared scheduler (rate limits, retries with backoff, circuit breaker) and
+    the router (hedged requests and failover across the configured routes).
 
     Args:
-        provider (str): Name of the LLM provider (e.g., "openai").
-        api_key (str): API key for the provider.
+        provider (str): Name of the route tried first (config.LLM_ROUTES, e.g. "openai" or "local").
+        api_key (str): API key for the provider (routes with their own key, e.g. "local", use that).
         model_name (str): Specific model to use.
         system_prompt (str): The system prompt.
         user_prompt (str): The user's prompt (potentially with placeholders resolved).
-        images_base64_list (list, optional): List of base64 encoded images.
+        images_base64_list (list, optional): List of base64 encoded images, or prepared image dicts (image_pipeline).
         settings (dict, optional): Additional provider-specific settings (e.g., temperature, response_format for OpenAI).
+        use_cache (bool, optional): False bypasses the cache lookup ("regenerate"); the fresh response still replaces the cached one.
+        priority (int, optional): Scheduling priority, lower first. Defaults to config.PRIORITY_INTERACTIVE.
 
     Returns:
         str: The LLM's response (expected to be a JSON string or text).
     """
-    if provider.lower() == "openai":
-        from .providers import openai_provider # Use relative import
-        try:
-            return openai_provider.get_openai_response(
-                api_key=api_key,
-                model_name=model_name,
-                system_prompt=system_prompt,
-                user_prompt=user_prompt,
-                images_base64_list=images_base64_list,
-                settings=settings
-            )
-        except ConnectionError as e: # Catch specific error from provider
-            # Log or handle as needed, then re-raise or return an error message
-            # For now, re-raise to let the UI handle it.
-            raise
-        except Exception as e:
-            # Catch any other unexpected errors from the provider
-            raise ValueError(f"An unexpected error occurred with the OpenAI provider: {e}")
-
-    # Example for future providers:
-    # elif provider.lower() == "anthropic":
-    #     from .providers import anthropic_provider # Create this module
-    #     return anthropic_provider.get_anthropic_response(
-    #         api_key=api_key,
-    #         model_name=model_name,
-    #         system_prompt=system_prompt,
-    #         user_prompt=user_prompt,
-    #         images_base64_list=images_base64_list,
-    #         settings=settings
-    #     )
-    else:
-        raise ValueError(f"Unsupported LLM provider: {provider}")
\ No newline at end of file
+    with tracing.span("generate_via_llm", provider=provider, model=model_name) as span:
+        cache = get_response_cache()
+        if cache and use_cache:
+            cache_key = _route_cache_key(get_router().routes_for(provider)[0], model_name, system_prompt, user_prompt, images_base64_list, settings)
+            cached_response = cache.get(cache_key)
+            if cached_response is not None:
+                span.set(cache="hit")
+                return cached_response
+
+        span.set(cache="miss")
+        response, route = get_scheduler().call(
+            lambda: _call_provider(provider, api_key, model_name, system_prompt, user_prompt, images_base64_list, settings),
+            token_estimate=estimate_request_tokens(system_prompt, user_prompt, images_base64_list, settings),
+            priority=priority
+        )
+        if cache and response:
+            cache.set(_route_cache_key(route, model_name, system_prompt, user_prompt, images_base64_list, settings), response)
+        return response
+
+
+def _route_cache_key(route, model_name: str, system_prompt: str, user_prompt: str, images_base64_list: list = None, settings: dict = None):
+    """
+    Cache key of a request on 'route', with the model the route actually uses. Responses are
+    stored under the route that answered, so a failover answer is never served as the
+    requested provider's.
+    """
+    return make_cache_key(route.name, route.model or model_name, system_prompt, user_prompt, images_base64_list, settings)
+
+
+def _provider_request(api_key: str, model_name: str, system_prompt: str, user_prompt: str, images_base64_list: list = None, settings: dict = None):
+    return dict(api_key=api_key, model_name=model_name, system_prompt=system_prompt, user_prompt=user_prompt,
+                images_base64_list=images_base64_list, settings=settings)
+
+
+def _call_provider(provider: str, api_key: str, model_name: str, system_prompt: str, user_prompt: str, images_base64_list: list = None, settings: dict = None):
+    """
+    Sends a single request, without caching, over the provider routes (core.router): the
+    route named 'provider' first, hedged and failed over to the other configured routes.
+    Returns (response, route that answered).
+    """
+    try:
+        return get_router().generate(provider, **_provider_request(api_key, model_name, system_prompt, user_prompt, images_base64_list, settings))
+    except (ConnectionError, ValueError): # Provider errors for the scheduler; ValueError: unknown provider
+        # Re-raise to let the scheduler retry and the UI handle it
+        raise
+    except Exception as e:
+        # Catch any other unexpected errors from the provider
+        raise ValueError(f"An unexpected error occurred with the {provider} provider: {e}")
+
+
+def stream_via_llm(provider: str, api_key: str, model_name: str, system_prompt: str, user_prompt: str, images_base64_list: list = None, settings: dict = None, use_cache: bool = True, priority: int = None):
+    """
+    Streaming counterpart of generate_via_llm: yields the response in text deltas.
+    A cache hit is yielded as a single delta; a completed stream is stored in the cache.
+    Opening the stream is scheduled and retried; once deltas flow, errors are raised as they are.
+    """
+    with tracing.span("stream_via_llm", provider=provider, model=model_name) as span:
+        cache = get_response_cache()
+        if cache and use_cache:
+            cache_key = _route_cache_key(get_router().routes_for(provider)[0], model_name, system_prompt, user_prompt, images_base64_list, settings)
+            cached_response = cache.get(cache_key)
+            if cached_response is not None:
+                span.set(cache="hit")
+                yield cached_response
+                return
+
+        span.set(cache="miss")
+        request = _provider_request(api_key, model_name, system_prompt, user_prompt, images_base64_list, settings)
+        # Request errors surface on the first delta, so the router fetches it inside the retried call
+        first_delta, stream, route = get_scheduler().call(
+            lambda: get_router().open_stream(provider, **request),
+            token_estimate=estimate_request_tokens(system_prompt, user_prompt, images_base64_list, settings),
+            priority=priority
+        )
+        deltas = []
+        if first_delta is not None:
+            deltas.append(first_delta)
+            yield first_delta
+        for delta in stream:
+            deltas.append(delta)
+            yield delta
+
+        response = "".join(deltas)
+        if cache and response:
+            cache.set(_route_cache_key(route, model_name, system_prompt, user_prompt, images_base64_list, settings), response)
+
+
+async def generate_via_llm_async(provider: str, api_key: str, model_name: str, system_prompt: str, user_prompt: str, images_base64_list: list = None, settings: dict = None, use_cache: bool = True, priority: int = None):
+    """
+    Async counterpart of generate_via_llm (same arguments, caching, scheduling and return value).
+    Requests run on a long-lived, pooled client per API key, so many concurrent
+    generations share connections.
+    """
+    with tracing.span("generate_via_llm_async", provider=provider, model=model_name) as span:
+        cache = get_response_cache()
+        if cache and use_cache:
+            cache_key = _route_cache_key(get_router().routes_for(provider)[0], model_name, system_prompt, user_prompt, images_base64_list, settings)
+            cached_response = await asyncio.to_thread(cache.get, cache_key)
+            if cached_response is not None:
+                span.set(cache="hit")
+                return cached_response
+
+        span.set(cache="miss")
+        response, route = await get_scheduler().call_async(
+            lambda: _call_provider_async(provider, api_key, model_name, system_prompt, user_prompt, images_base64_list, settings),
+            token_estimate=estimate_request_tokens(system_prompt, user_prompt, images_base64_list, settings),
+            priority=priority
+        )
+        if cache and response:
+            await asyncio.to_thread(cache.set, _route_cache_key(route, model_name, system_prompt, user_prompt, images_base64_list, settings), response)
+        return response
+
+
+async def _call_provider_async(provider: str, api_key: str, model_name: str, system_prompt: str, user_prompt: str, images_base64_list: list = None, settings: dict = None):
+    """Async counterpart of _call_provider; the slower attempt of a hedged request is cancelled."""
+    try:
+        return await get_router().generate_async(provider, **_provider_request(api_key, model_name, system_prompt, user_prompt, images_base64_list, settings))
+    except (ConnectionError, ValueError):
+        raise
+    except Exception as e:
+        raise ValueError(f"An unexpected error occurred with the {provider} provider: {e}")
+
+
+# A single background event loop shared by all sync callers (e.g. Streamlit script threads).
+# Keeping the loop alive keeps the async clients, and their open connections, alive between reruns.
+_background_loop = None
+_background_loop_lock = threading.Lock()
+
+
+def _get_background_loop():
+    global _background_loop
+    with _background_loop_lock:
+        if _background_loop is None or _background_loop.is_closed():
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="llm-event-loop", daemon=True).start()
+            _background_loop = loop
+        return _background_loop
+
+
+def run_async(coro):
+    """Runs a coroutine on the shared background event loop and blocks until it returns."""
+    return asyncio.run_coroutine_threadsafe(coro, _get_background_loop()).result()
+
+
+def get_cache_stats():
+    """Hit/miss counters and size of the response cache, or None if caching is disabled."""
+    cache = get_response_cache()
+    return cache.stats() if cache else None
+
+
+def get_scheduler_stats():
+    """Request, retry, rate-limit and circuit-breaker counters of the shared scheduler."""
+    scheduler = get_scheduler()
+    return {**scheduler.stats, "circuit": scheduler.breaker.state}
+
+
+def get_router_stats():
+    """Hedging and failover counters, and health and latency percentiles per route."""
+    return get_router().snapshot()
@@ -1,7 +1,12 @@
+import bisect
 import json
+import logging
 import random
 import re
-import streamlit as st # For error reporting in transform_output
+from collections import Counter
+
+from .json_repair import loads_tolerant
+from .tracing import traced
 
 def replace_german_sharp_s(text):
     """Replace all occurrences of 'ß' with 'ss'."""
@@ -9,84 +14,163 @@ def replace_german_sharp_s(text):
         return text.replace('ß', 'ss')
     return text
 
+def _warn(warnings, message):
+    """Collects a conversion problem for the caller to show; logs it if the caller passed no list."""
+    if warnings is None:
+        logging.warning(message)
+    else:
+        warnings.append(message)
+
 def clean_json_string(s):
-    """Cleans a string to make it valid JSON, focusing on common LLM output issues."""
+    """
+    Cleans a string to make it valid JSON, focusing on common LLM output issues
+    (code fences, surrounding text, trailing commas, raw newlines, truncation).
+    Returns the re-serialized JSON, or the stripped input if no JSON could be recovered.
+    """
     if not isinstance(s, str):
         return s # Or raise an error, or try to convert
-
-    s = s.strip()
-    # Remove markdown ```json ... ```
-    s = re.sub(r'^```json\s*', '', s, flags=re.IGNORECASE)
-    s = re.sub(r'\s*```$', '', s)
-    s = s.strip()
-
-    # Replace escaped newlines within string values properly
-    # This regex looks for "key": "value with \n newlines"
-    # and replaces \n with \\n ONLY within the quoted string values.
-    # It's a bit tricky to get right for all cases.
-    # A simpler approach for now:
-    # s = s.replace('\n', '\\n') # This might be too broad, careful.
-
-    # Attempt to ensure it's a list of objects or a single object
-    # This is a common pattern for LLM JSON outputs.
-    # If it's not starting with [ or {, try to find the first [ or {
-    # This part is heuristic and might need refinement.
-    first_char_index = -1
-    for i, char in enumerate(s):
-        if char in ['[', '{']:
-            first_char_index = i
+    try:
+        data, _ = loads_tolerant(s)
+    except json.JSONDecodeError:
+        return s.strip()
+    return json.dumps(data, ensure_ascii=False)
+
+
+class IncrementalJSONArrayParser:
+    """
+    Extracts the elements of the first JSON array in a streamed response as soon as they are complete.
+    Works for a bare array as well as for an array wrapped in an object (json_object response format),
+    and tolerates leading text or code fences. Only object/array elements are emitted; an array
+    closed without any (e.g. "[Hinweis]" in leading prose) is skipped and the search goes on.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._pos = 0 # Next buffer index to scan
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._array_depth = None # Depth of the target array once found
+        self._item_start = None # Buffer index where the current element started
+        self._has_elements = False # Whether the target array has had an object/array element yet
+        self.finished = False # True once the target array has been closed
+
+    def feed(self, chunk):
+        """Adds a chunk of the stream and returns the list of elements completed by it."""
+        if self.finished or not chunk:
+            return []
+        self._buffer += chunk
+        items = []
+        buffer = self._buffer
+        for i in range(self._pos, len(buffer)):
+            char = buffer[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+
+            if char == '"':
+                self._in_string = True
+            elif char in '[{':
+                self._depth += 1
+                if self._array_depth is None:
+                    if char == '[':
+                        self._array_depth = self._depth
+                elif self._depth == self._array_depth + 1 and self._item_start is None:
+                    self._item_start = i
+                    self._has_elements = True
+            elif char in ']}':
+                if self._item_start is not None and self._depth == self._array_depth + 1:
+                    try:
+                        item, complete = loads_tolerant(buffer[self._item_start:i + 1])
+                        if complete:
+                            items.append(item)
+                    except json.JSONDecodeError:
+                        pass # Malformed element; the full response is still parsed at the end
+                    self._item_start = None
+                self._depth -= 1
+                if self._array_depth is not None and self._depth < self._array_depth:
+                    if not self._has_elements:
+                        self._array_depth = None # Not the data array; keep looking
+                        continue
+                    self.finished = True
+                    break
+
+        # Drop everything that can no longer be part of a pending element
+        keep_from = self._item_start if self._item_start is not None else len(buffer)
+        self._buffer = buffer[keep_from:]
+        if self._item_start is not None:
+            self._item_start = 0
+        self._pos = len(self._buffer)
+        return items
+
+
+BLANK_PLACEHOLDER = "{blank}"
+UNDEFINED_ANSWER = "CORRECT_ANSWER_UNDEFINED"
+
+
+def split_text_on_blanks(text, blanks):
+    """
+    Locates all blanks of an inline_fib item in a single scan of its text.
+    Returns (parts, answers): the answers of the gaps in text order and the text around
+    them (len(answers) + 1 parts). Each blank takes its first free occurrence; whole words
+    win over matches inside other words, and longer blanks over blanks they contain
+    ("Zellen" vs. "Zelle"). Blanks that do not occur in the text are left out.
+    Texts that already contain {blank} placeholders are split on those instead.
+    """
+    answers = [str(blank) for blank in blanks]
+    if BLANK_PLACEHOLDER in text:
+        parts = text.split(BLANK_PLACEHOLDER)
+        gaps = len(parts) - 1
+        return parts, answers[:gaps] + [UNDEFINED_ANSWER] * (gaps - len(answers))
+
+    remaining = Counter(answer for answer in answers if answer)
+    if not remaining:
+        return [text], []
+    alternatives = "|".join(re.escape(answer) for answer in sorted(remaining, key=len, reverse=True))
+    starts, spans = [], [] # Sorted, non-overlapping (start, end, answer)
+    for pattern in (rf'(?<!\w)(?:{alternatives})(?!\w)', f'(?:{alternatives})'):
+        for match in re.finditer(pattern, text):
+            answer = match.group(0)
+            if not remaining[answer]:
+                continue
+            start, end = match.span()
+            position = bisect.bisect(starts, start)
+            if (position and spans[position - 1][1] > start) or (position < len(spans) and spans[position][0] < end):
+                continue # Overlaps a gap found in the whole-word pass
+            starts.insert(position, start)
+            spans.insert(position, (start, end, answer))
+            remaining[answer] -= 1
+        if not +remaining: # Every blank placed
             break
-    if first_char_index > 0:
-        s = s[first_char_index:]
-
-    # Remove trailing commas before closing ] or }
-    s = re.sub(r',\s*(\}|\])', r'\1', s)
-    
-    # Remove non-printable characters (except newline if it's intended for structure)
-    # s = ''.join(char for char in s if ord(char) >= 32 or char in ['\n', '\r', '\t'])
-
-    # The original clean_json_string had more specific regexes, let's try to adapt them
-    # s = re.sub(r'\s+', ' ', s) # This might break intended newlines in JSON strings
-    # s = re.sub(r'(?<=text": ")(.+?)(?=")', lambda m: m.group(1).replace('\n', '\\n'), s) # This was good
-    
-    # A less aggressive cleaning for newlines within text values:
-    # This is complex. For now, we rely on JSON parser to handle valid escapes.
-    # The main issue is often unescaped newlines.
-    # Let's assume the LLM is asked for JSON and it tries its best.
-    # The ```json stripping is the most common fix needed.
-
-    # Try to extract content between the first '[' and last ']' or first '{' and last '}'
-    # This helps if there's extraneous text around the JSON array/object.
-    json_match_array = re.search(r'(\[.*\])', s, re.DOTALL)
-    json_match_object = re.search(r'(\{.*\})', s, re.DOTALL)
-
-    if json_match_array:
-        s = json_match_array.group(0)
-    elif json_match_object: # If no array, try to find an object
-        s = json_match_object.group(0)
-    # If neither, the string might be malformed or not JSON.
-
-    return s
-
-
-def convert_json_to_text_format(json_input):
-    """Converts JSON input (for inline_fib) to FIB and Inlinechoice text formats."""
+
+    parts, found, cursor = [], [], 0
+    for start, end, answer in spans:
+        parts.append(text[cursor:start])
+        found.append(answer)
+        cursor = end
+    parts.append(text[cursor:])
+    return parts, found
+
+
+@traced()
+def convert_json_to_text_format(json_input, warnings=None):
+    """
+    Converts JSON input (for inline_fib) to FIB and Inlinechoice text formats.
+    Skipped items and other problems are appended to 'warnings' (logged if it is None).
+    """
     if isinstance(json_input, str):
         try:
-            data = json.loads(json_input)
+            data, complete = loads_tolerant(json_input)
         except json.JSONDecodeError as e:
-            # If direct loading fails, try with the cleaned string
-            st.warning(f"JSONDecodeError in convert_json_to_text_format: {e}. Trying to clean.")
-            cleaned_str = clean_json_string(json_input)
-            try:
-                data = json.loads(cleaned_str)
-            except json.JSONDecodeError as e2:
-                st.error(f"Still failed to parse JSON after cleaning: {e2}")
-                st.text("Original problematic JSON string:")
-                st.code(json_input, language='text')
-                st.text("Cleaned problematic JSON string:")
-                st.code(cleaned_str, language='text')
-                raise ValueError("Invalid JSON for FIB/Inlinechoice conversion") from e2
+            _warn(warnings, f"Failed to parse JSON for FIB/Inlinechoice conversion: {e}")
+            raise ValueError("Invalid JSON for FIB/Inlinechoice conversion") from e
+        if not complete:
+            _warn(warnings, "The JSON for FIB/Inlinechoice was truncated; only complete items are converted.")
     else:
         data = json_input # Assuming it's already a Python list/dict
 
@@ -94,13 +178,13 @@ def convert_json_to_text_format(json_input):
     ic_output = []
 
     if not isinstance(data, list): # Ensure data is a list of items
-        st.warning("FIB/Inlinechoice JSON data is not a list. Wrapping it in a list.")
+        _warn(warnings, "FIB/Inlinechoice JSON data is not a list. Wrapping it in a list.")
         data = [data]
 
 
     for item in data:
         if not isinstance(item, dict):
-            st.warning(f"Skipping non-dict item in FIB/Inlinechoice data: {item}")
+            _warn(warnings, f"Skipping non-dict item in FIB/Inlinechoice data: {item}")
             continue
 
         text = item.get('text', '')
@@ -108,38 +192,32 @@ def convert_json_to_text_format(json_input):
         wrong_substitutes = item.get('wrong_substitutes', [])
 
         if not isinstance(blanks, list) or not isinstance(wrong_substitutes, list):
-            st.error(f"Invalid 'blanks' or 'wrong_substitutes' in item: {item}. Skipping.")
+            _warn(warnings, f"Invalid 'blanks' or 'wrong_substitutes' in item: {item}. Skipping.")
             continue
             
-        num_blanks = len(blanks)
-        if num_blanks == 0 and "{blank}" not in text: # If no blanks are provided, and no placeholders in text
-            st.warning(f"No blanks found for FIB/Inlinechoice item: {item}. Skipping this item.")
+        if not blanks and BLANK_PLACEHOLDER not in text: # If no blanks are provided, and no placeholders in text
+            _warn(warnings, f"No blanks found for FIB/Inlinechoice item: {item}. Skipping this item.")
             continue
 
+        # Both formats share one segmentation of the text: parts[i] precedes the gap answers[i]
+        parts, answers = split_text_on_blanks(text, blanks)
+        if not answers:
+            _warn(warnings, f"None of the blanks occur in the text of FIB/Inlinechoice item: {item}. Skipping this item.")
+            continue
+        if len(answers) < len(blanks):
+            _warn(warnings, f"{len(blanks) - len(answers)} blank(s) not found in the text and left out: {item.get('text', '')[:80]}")
+        points = len(answers)
 
         # FIB Generation
         fib_lines = [
             "Type\tFIB",
             "Title\t✏✏Vervollständigen Sie die Lücken mit dem korrekten Begriff.✏✏",
-            f"Points\t{num_blanks if num_blanks > 0 else 1}" # Ensure points is at least 1
+            f"Points\t{points}"
         ]
-        
-        current_text_for_fib = text
-        # Replace placeholders if blanks are provided
-        if blanks:
-            for blank_word in blanks:
-                current_text_for_fib = current_text_for_fib.replace(blank_word, "{blank}", 1)
-        
-        parts = current_text_for_fib.split("{blank}")
-        
         for index, part in enumerate(parts):
             fib_lines.append(f"Text\t{part.strip()}")
-            if index < len(blanks): # Ensure we have a blank for this part
-                fib_lines.append(f"1\t{blanks[index]}\t20") # Points per blank, size
-            elif index < num_blanks and not blanks: # Case where {blank} is in text but no blanks list
-                 fib_lines.append(f"1\tCORRECT_ANSWER_UNDEFINED\t20")
-
-
+            if index < len(answers):
+                fib_lines.append(f"1\t{answers[index]}\t20") # Points per blank, size
         fib_output.append('\n'.join(fib_lines))
 
         # Inline Choice (IC) Generation
@@ -147,84 +225,146 @@ def convert_json_to_text_format(json_input):
             "Type\tInlinechoice",
             "Title\tWörter einordnen",
             "Question\t✏✏Wählen Sie die richtigen Wörter.✏✏",
-            f"Points\t{num_blanks if num_blanks > 0 else 1}"
+            f"Points\t{points}"
         ]
-
-        all_options = blanks + wrong_substitutes
+        all_options = [str(option) for option in blanks + wrong_substitutes]
         random.shuffle(all_options)
-        
-        current_text_for_ic = text # Use original text for IC part splitting
-        if blanks:
-            for blank_word in blanks:
-                current_text_for_ic = current_text_for_ic.replace(blank_word, "{blank}", 1)
-        
-        ic_parts = current_text_for_ic.split("{blank}")
-
-        for index, part in enumerate(ic_parts):
+        options_str = '|'.join(all_options) if all_options else "OPTION_A|OPTION_B" # Same options for every gap
+        for index, part in enumerate(parts):
             ic_lines.append(f"Text\t{part.strip()}")
-            if index < len(blanks): # Ensure we have a blank for this part
-                options_str = '|'.join(all_options) if all_options else "OPTION_A|OPTION_B"
-                correct_answer_for_ic = blanks[index]
-                ic_lines.append(f"1\t{options_str}\t{correct_answer_for_ic}\t|")
-            elif index < num_blanks and not blanks: # Case where {blank} is in text but no blanks list
-                options_str = '|'.join(wrong_substitutes) if wrong_substitutes else "OPTION_A|OPTION_B"
-                ic_lines.append(f"1\t{options_str}\tCORRECT_ANSWER_UNDEFINED\t|")
-
-
+            if index < len(answers):
+                ic_lines.append(f"1\t{options_str}\t{answers[index]}\t|")
         ic_output.append('\n'.join(ic_lines))
 
     return '\n\n'.join(fib_output), '\n\n'.join(ic_output)
 
 
-def transform_inline_fib_output(json_string):
-    """Transforms JSON string for inline_fib questions into OLAT text format."""
-    cleaned_json_string = clean_json_string(json_string)
+@traced()
+def transform_inline_fib_output(json_string, warnings=None):
+    """Transforms JSON string for inline_fib questions into OLAT text format (problems go to 'warnings')."""
     try:
-        # Attempt to parse the cleaned JSON
-        # The LLM is expected to return a list of objects for inline_fib
-        # e.g., [{"text": "...", "blanks": ["..."], "wrong_substitutes": ["..."]}, ...]
-        json_data = json.loads(cleaned_json_string)
-        
-        fib_output, ic_output = convert_json_to_text_format(json_data)
-        
+        # The LLM is expected to return a list of objects for inline_fib, wrapped in an object
+        # with the json_object response format, e.g. {"items": [{"text": "...", "blanks": ["..."], "wrong_substitutes": ["..."]}, ...]}
+        # Truncated output (max_tokens) keeps every complete item.
+        json_data, complete = loads_tolerant(json_string)
+        if not complete:
+            _warn(warnings, "The inline_fib response was truncated; only the complete entries were recovered.")
+
+        fib_output, ic_output = convert_json_to_text_format(_unwrap_items(json_data), warnings)
+
         fib_output = replace_german_sharp_s(fib_output)
         ic_output = replace_german_sharp_s(ic_output)
 
         return f"{ic_output}\n---\n{fib_output}"
-    
+
     except json.JSONDecodeError as e:
-        st.error(f"Error parsing JSON for inline_fib: {e}")
-        st.text("Cleaned JSON input that failed:")
-        st.code(cleaned_json_string, language='json')
-        st.text("Original JSON input:")
-        st.code(json_string, language='text')
-        
-        # Attempt to salvage if it's a common issue like a missing closing bracket for a list
-        # This is a very basic attempt and might not always work or be correct.
-        salvaged = False
-        if isinstance(cleaned_json_string, str) and cleaned_json_string.strip().startswith('[') and not cleaned_json_string.strip().endswith(']'):
-            try:
-                st.warning("Attempting to fix missing ']' in JSON array.")
-                fixed_json_string = cleaned_json_string.strip() + ']'
-                json_data = json.loads(fixed_json_string)
-                fib_output, ic_output = convert_json_to_text_format(json_data)
-                fib_output = replace_german_sharp_s(fib_output)
-                ic_output = replace_german_sharp_s(ic_output)
-                salvaged = True
-                st.success("Successfully salvaged and processed partial JSON.")
-                return f"{ic_output}\n---\n{fib_output}"
-            except Exception as e_partial:
-                st.error(f"Unable to salvage partial JSON: {e_partial}")
-        
-        if not salvaged:
-            return "Error: Invalid JSON format for inline_fib processing."
-            
+        _warn(warnings, f"Error parsing JSON for inline_fib: {e}")
+        return "Error: Invalid JSON format for inline_fib processing."
+
     except ValueError as ve: # Catch ValueError from convert_json_to_text_format
-        st.error(f"Error processing inline_fib data structure: {ve}")
+        _warn(warnings, f"Error processing inline_fib data structure: {ve}")
         return "Error: Invalid data structure for inline_fib."
 
     except Exception as e:
-        st.error(f"An unexpected error occurred during inline_fib transformation: {str(e)}")
-        st.text("Original input:")
-        st.code(json_string, language='text')
-        return "Error: Unable to process inline_fib input."
\ No newline at end of file
+        _warn(warnings, f"An unexpected error occurred during inline_fib transformation: {str(e)}")
+        return "Error: Unable to process inline_fib input."
+
+
+@traced()
+def process_response(msg_type, response, warnings=None):
+    """
+    Turns a raw LLM response for a question type into the OLAT text format.
+    Conversion problems are appended to 'warnings' for the caller to show (logged if it is None).
+    """
+    if msg_type == "inline_fib":
+        # transform_inline_fib_output handles JSON parsing and formatting
+        return transform_inline_fib_output(response, warnings)
+    # For other types, apply general cleaning
+    return replace_german_sharp_s(response)
+
+
+@traced()
+def split_combined_response(json_string, selected_types):
+    """
+    Splits the JSON object of a combined multi-type generation into per-type raw responses,
+    in the same shape a single-type request returns (OLAT text, or a JSON string for inline_fib).
+    Types missing from the response are left out.
+    """
+    data, _ = loads_tolerant(json_string)
+    if not isinstance(data, dict):
+        raise ValueError("Combined response is not a JSON object.")
+
+    responses = {}
+    for msg_type in selected_types:
+        value = data.get(msg_type)
+        if not value:
+            continue
+        responses[msg_type] = value if isinstance(value, str) else json.dumps(value, ensure_ascii=False)
+    return responses
+
+
+def _normalize_for_dedup(text):
+    return re.sub(r'\W+', ' ', text).strip().lower()
+
+
+def _json_items(json_string):
+    """The question items of an inline_fib response (a list, possibly wrapped in an object)."""
+    data, _ = loads_tolerant(json_string)
+    return _unwrap_items(data)
+
+
+def _unwrap_items(data):
+    """The item list of parsed inline_fib data; json_object responses wrap it, e.g. {"items": [...]}."""
+    if isinstance(data, dict):
+        data = next((value for value in data.values() if isinstance(value, list)), [data])
+    return data if isinstance(data, list) else [data]
+
+
+def question_blocks(text):
+    """Splits OLAT text output into one block per question (each starts with a 'Typ'/'Type' line)."""
+    blocks = []
+    current = []
+    for line in text.strip().splitlines():
+        if re.match(r'^(Typ|Type)\t', line) and any(part.strip() for part in current):
+            blocks.append("\n".join(current).strip())
+            current = []
+        current.append(line)
+    if any(part.strip() for part in current):
+        blocks.append("\n".join(current).strip())
+    return blocks
+
+
+@traced()
+def merge_chunk_responses(msg_type, responses, warnings=None):
+    """
+    Merges the raw responses generated for the chunks of one long document into a single
+    raw response of the same shape, dropping duplicate questions (same question text).
+    Unparsable chunk responses are skipped and reported in 'warnings' (logged if it is None).
+    """
+    seen = set()
+    if msg_type == "inline_fib":
+        merged_items = []
+        for response in responses:
+            try:
+                items = _json_items(response)
+            except json.JSONDecodeError as e:
+                _warn(warnings, f"Skipping an unparsable inline_fib chunk response: {e}")
+                continue
+            for item in items:
+                key = _normalize_for_dedup(item.get('text', '') if isinstance(item, dict) else str(item))
+                if key in seen:
+                    continue
+                seen.add(key)
+                merged_items.append(item)
+        return json.dumps(merged_items, ensure_ascii=False)
+
+    merged_blocks = []
+    for response in responses:
+        for block in question_blocks(response):
+            question = re.search(r'^Question\t(.*)$', block, re.MULTILINE)
+            key = _normalize_for_dedup(question.group(1) if question else block)
+            if key in seen:
+                continue
+            seen.add(key)
+            merged_blocks.append(block)
+    return "\n\n".join(merged_blocks)
\ No newline at end of file
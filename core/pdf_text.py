@@ -0,0 +1,157 @@
+"""
+Page-parallel PDF text extraction.
+
+PyPDF2 extracts one page after the other on a single core. Documents with at least
+config.PDF_TEXT_PARALLEL_MIN_PAGES pages are split into page ranges that are extracted in
+a shared process pool; the page texts are then assembled with a single join into a PdfText,
+which keeps the page boundaries as offsets. Results are cached in memory by the file's
+content hash and page range.
+
+This module only imports the standard library (and PyPDF2 where it is used), so the
+pool's worker processes start quickly.
+"""
+import bisect
+import hashlib
+import io
+import logging
+import multiprocessing
+import os
+import threading
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from . import config
+
+
+class PdfText:
+    """
+    The text of a page range as one string plus its page boundaries: page i (0-based within
+    the range) is text[offsets[i]:offsets[i + 1]].
+    """
+    __slots__ = ("text", "first_page", "offsets")
+
+    def __init__(self, page_texts, first_page=1):
+        self.first_page = first_page
+        self.text = "".join(page_texts)
+        self.offsets = array("Q", [0])
+        for page_text in page_texts:
+            self.offsets.append(self.offsets[-1] + len(page_text))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    @property
+    def last_page(self):
+        return self.first_page + len(self) - 1
+
+    @property
+    def char_counts(self):
+        """Characters per page, in page order."""
+        return [end - start for start, end in zip(self.offsets, self.offsets[1:])]
+
+    def page(self, page_number):
+        """The text of a 1-based page number of the document."""
+        index = page_number - self.first_page
+        if not 0 <= index < len(self):
+            raise IndexError(f"Page {page_number} is outside pages {self.first_page}-{self.last_page}")
+        return self.text[self.offsets[index]:self.offsets[index + 1]]
+
+    def pages(self):
+        """The texts of all pages, in order."""
+        return [self.text[start:end] for start, end in zip(self.offsets, self.offsets[1:])]
+
+    def page_at(self, offset):
+        """The page number containing the character at 'offset' of 'text'."""
+        return self.first_page + max(0, min(len(self) - 1, bisect.bisect_right(self.offsets, offset) - 1))
+
+
+def _extract_page_range(file_bytes, first_page, last_page):
+    """Worker: texts of the 1-based pages first_page..last_page."""
+    import PyPDF2
+    reader = PyPDF2.PdfReader(io.BytesIO(file_bytes))
+    return [page.extract_text() or "" for page in reader.pages[first_page - 1:last_page]]
+
+
+_pool = None
+_pool_lock = threading.Lock()
+_cache = OrderedDict() # (content hash, first_page, last_page) -> PdfText
+_cache_lock = threading.Lock()
+
+
+def _worker_count():
+    return max(1, config.PDF_TEXT_MAX_WORKERS or os.cpu_count() or 1)
+
+
+def _get_pool():
+    """The process pool shared by all extractions, started on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # 'spawn' instead of 'fork': the app process runs threads (Streamlit, event loop, workers)
+            _pool = ProcessPoolExecutor(max_workers=_worker_count(), mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def _page_ranges(first_page, last_page, parts):
+    """Splits first_page..last_page into at most 'parts' consecutive ranges of nearly equal size."""
+    page_count = last_page - first_page + 1
+    size, extra = divmod(page_count, parts)
+    ranges = []
+    start = first_page
+    for index in range(min(parts, page_count)):
+        end = start + size + (1 if index < extra else 0) - 1
+        ranges.append((start, end))
+        start = end + 1
+    return ranges
+
+
+def _extract_parallel(file_bytes, first_page, last_page):
+    global _pool
+    # Two ranges per worker even out pages of very different complexity
+    ranges = _page_ranges(first_page, last_page, _worker_count() * 2)
+    try:
+        futures = [_get_pool().submit(_extract_page_range, file_bytes, start, end) for start, end in ranges]
+        page_texts = []
+        for future in futures:
+            page_texts.extend(future.result())
+        return page_texts
+    except Exception as e: # e.g. a broken pool or no process support; PyPDF2 errors surface again below
+        logging.warning(f"Parallel PDF text extraction failed, extracting in-process: {e}")
+        with _pool_lock:
+            if _pool is not None:
+                _pool.shutdown(wait=False, cancel_futures=True)
+                _pool = None
+        return _extract_page_range(file_bytes, first_page, last_page)
+
+
+def extract_pdf_text(file_bytes, first_page=1, last_page=None):
+    """
+    Extracts the text of a PDF (optionally a 1-based page range) into a PdfText.
+    Large ranges are extracted page-range-parallel in the process pool.
+    """
+    key = (hashlib.sha256(file_bytes).hexdigest(), first_page, last_page)
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+
+    import PyPDF2
+    page_count = len(PyPDF2.PdfReader(io.BytesIO(file_bytes)).pages)
+    end_page = min(last_page or page_count, page_count)
+    if end_page - first_page + 1 >= config.PDF_TEXT_PARALLEL_MIN_PAGES and _worker_count() > 1:
+        page_texts = _extract_parallel(file_bytes, first_page, end_page)
+    else:
+        page_texts = _extract_page_range(file_bytes, first_page, end_page)
+    pdf_text = PdfText(page_texts, first_page)
+
+    with _cache_lock:
+        _cache[key] = pdf_text
+        while len(_cache) > config.PDF_TEXT_CACHE_MAX_ENTRIES:
+            _cache.popitem(last=False)
+    return pdf_text
+
+
+def clear_cache():
+    with _cache_lock:
+        _cache.clear()
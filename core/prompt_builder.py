@@ -1,40 +1,200 @@
-import streamlit as st # For @st.cache_data
+import streamlit as st # For error reporting in read_prompt_from_md
+import functools
+import logging
 import os
+import re
+import threading
+import time
 
-@st.cache_data
-def read_prompt_from_md(filename):
-    """Read the prompt from a markdown file in the 'prompts' directory and cache the result."""
-    # Construct path relative to this file or a known base directory if needed
-    # For simplicity, assuming 'prompts' is in the current working directory or accessible path
-    # A more robust solution would use os.path.join and __file__
-    
-    # Assuming the script is run from the root of olat-question-engine-v2
-    prompt_file_path = os.path.join("prompts", f"{filename}.md")
-    
-    try:
-        with open(prompt_file_path, "r", encoding="utf-8") as file:
-            return file.read()
-    except FileNotFoundError:
-        st.error(f"Prompt file not found: {prompt_file_path}")
-        # Try looking in the current directory as a fallback (original behavior)
+from . import config
+from .tracing import traced
+
+# Placeholders templates may use, e.g. "Focus on {{learning_goals}}". Single braces such as
+# "{bloom_level}" are part of the OLAT output templates and are left alone.
+_PLACEHOLDER_RE = re.compile(r"\{\{\s*(\w+)\s*\}\}")
+KNOWN_PLACEHOLDERS = {"user_input", "learning_goals", "language"}
+
+
+class PromptTemplate:
+    """A loaded prompt template, split into literal text and placeholders once at load time."""
+
+    def __init__(self, name, content, path=None, mtime=None):
+        self.name = name
+        self.content = content
+        self.path = path
+        self.mtime = mtime
+        self._parts = _PLACEHOLDER_RE.split(content) # literal, name, literal, name, ..., literal
+        self.placeholders = set(self._parts[1::2])
+        # Static tail of every request of this type; identical across requests and re-runs
+        self.instructions = f"MAIN INSTRUCTIONS:\n{content}" if not self.placeholders else None
+
+    def render(self, **values):
+        """Substitutes {{name}} placeholders; placeholders without a value are kept as they are."""
+        if not self.placeholders:
+            return self.content
+        rendered = []
+        for index, part in enumerate(self._parts):
+            if index % 2 == 0:
+                rendered.append(part)
+            else:
+                value = values.get(part)
+                rendered.append("{{" + part + "}}" if value is None else str(value))
+        return "".join(rendered)
+
+
+class PromptRegistry:
+    """
+    Loads and validates the templates of all question types from 'directory' (one
+    '<type>.md' per type). Templates are served from memory; a changed file (mtime) is
+    reloaded on the next lookup, checked at most every 'reload_interval' seconds.
+    """
+
+    def __init__(self, directory, names, reload_interval):
+        self.directory = directory
+        self.names = list(names)
+        self.reload_interval = reload_interval
+        self.problems = {} # name -> reason the template is unusable or suspicious
+        self._templates = {}
+        self._last_check = {}
+        self._lock = threading.Lock()
+        for name in self.names:
+            self._load(name)
+
+    def path(self, name):
+        return os.path.join(self.directory, f"{name}.md")
+
+    def _load(self, name):
+        path = self.path(name)
         try:
-            with open(f"{filename}.md", "r", encoding="utf-8") as file:
-                st.warning(f"Found prompt file {filename}.md in current directory instead of prompts/ folder.")
-                return file.read()
-        except FileNotFoundError:
-            st.error(f"Prompt file {filename}.md also not found in current directory.")
-            return None
-
-
-def format_prompt(template_content, user_input, learning_goals):
-    """
-    Injects user input and learning goals into a prompt template.
-    This is a basic example; more sophisticated templating might be needed.
-    """
-    # This is a placeholder. The actual formatting happens in generate_questions_ui
-    # where MAIN INSTRUCTIONS, User Input, and Learning Goals are combined.
-    # This function could be expanded if prompts have specific placeholders like {{user_input}}.
-    # For now, the combination logic is:
-    # f"MAIN INSTRUCTIONS:\n{template_content}\n\nUser Input: {user_input}\n\nLearning Goals: {learning_goals}"
-    # This function could just return template_content if the above formatting is done by the caller.
-    return template_content # Or implement more complex formatting if needed
\ No newline at end of file
+            mtime = os.stat(path).st_mtime
+            with open(path, "r", encoding="utf-8") as file:
+                content = file.read()
+        except OSError:
+            self._templates.pop(name, None)
+            self.problems[name] = f"Prompt file not found: {path}"
+            return
+        self._last_check[name] = time.monotonic()
+        if not content.strip():
+            self._templates.pop(name, None)
+            self.problems[name] = f"Prompt file is empty: {path}"
+            return
+        template = PromptTemplate(name, content, path, mtime)
+        unknown = template.placeholders - KNOWN_PLACEHOLDERS
+        if unknown:
+            self.problems[name] = f"Unknown placeholder(s) in {path}: {', '.join(sorted(unknown))}"
+        else:
+            self.problems.pop(name, None)
+        self._templates[name] = template
+
+    def get(self, name):
+        """The template for 'name' (reloaded if its file changed), or None if it is unavailable."""
+        with self._lock:
+            template = self._templates.get(name)
+            now = time.monotonic()
+            if template is None or now - self._last_check.get(name, 0) >= self.reload_interval:
+                self._last_check[name] = now
+                try:
+                    changed = template is None or os.stat(self.path(name)).st_mtime != template.mtime
+                except OSError:
+                    changed = True
+                if changed:
+                    self._load(name)
+                    template = self._templates.get(name)
+            return template
+
+    def available(self):
+        """The question types whose template is loaded, in configuration order."""
+        return [name for name in self.names if self.get(name) is not None]
+
+    @property
+    def missing(self):
+        return [name for name in self.names if name not in self._templates]
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_prompt_registry():
+    """Returns the process-wide template registry, loading and validating all templates on first use."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = PromptRegistry(config.PROMPTS_DIR, config.MESSAGE_TYPES, config.PROMPT_RELOAD_INTERVAL)
+            for name, problem in _registry.problems.items():
+                logging.warning(f"Prompt template '{name}': {problem}")
+        return _registry
+
+
+@traced()
+def read_prompt_from_md(filename):
+    """Returns the prompt template of a question type from the template registry, or None."""
+    template = get_prompt_registry().get(filename)
+    if template is None:
+        st.error(get_prompt_registry().problems.get(filename, f"Prompt file {filename}.md not found."))
+        return None
+    return template.content
+
+
+@functools.lru_cache(maxsize=64)
+def _compiled(template_content):
+    return PromptTemplate(None, template_content)
+
+
+def format_prompt(template_content, user_input, learning_goals, language=None):
+    """
+    Injects user input, learning goals and output language into the {{user_input}},
+    {{learning_goals}} and {{language}} placeholders of a prompt template.
+    Templates without placeholders are returned unchanged.
+    """
+    return _compiled(template_content).render(user_input=user_input, learning_goals=learning_goals, language=language)
+
+
+def _instructions(template_content, user_input, learning_goals, language):
+    """The 'MAIN INSTRUCTIONS' block of a template; pre-assembled unless it has placeholders."""
+    template = _compiled(template_content)
+    if template.instructions is not None:
+        return template.instructions
+    return f"MAIN INSTRUCTIONS:\n{template.render(user_input=user_input, learning_goals=learning_goals, language=language)}"
+
+
+def build_document_prompt(user_input, learning_goals, language):
+    """
+    The part of the user prompt shared by every question type: the user's text, the learning
+    goals and the output language. It leads the request so all types of a run (and re-runs)
+    send an identical prefix, which the provider can serve from its prompt cache.
+    """
+    return (
+        f"User Input: {user_input}\n\n"
+        f"Learning Goals: {learning_goals}\n\n"
+        f"Output Language: {language}" # Explicitly pass selected language
+    )
+
+
+def build_user_prompt(template_content, user_input, learning_goals, language):
+    """
+    Assembles the full user prompt for one question type:
+    the shared document part first, the type's instructions last.
+    """
+    return (
+        f"{build_document_prompt(user_input, learning_goals, language)}\n\n"
+        f"{_instructions(template_content, user_input, learning_goals, language)}"
+    )
+
+
+def build_combined_user_prompt(templates, user_input, learning_goals, language):
+    """
+    Assembles one user prompt for several question types ('templates' maps type -> template content).
+    The document is sent once; each type's instructions name the JSON field its output goes into.
+    """
+    sections = [
+        f"{build_document_prompt(user_input, learning_goals, language)}\n\n"
+        "Generate the questions for EACH of the following question types from the User Input above. "
+        "Answer with a single JSON object that has one field per question type. "
+        "For every type, follow its MAIN INSTRUCTIONS exactly and put the complete output of that type "
+        "(as plain text in the required format, or as the required JSON items) into its field."
+    ]
+    for msg_type, template_content in templates.items():
+        instructions = format_prompt(template_content, user_input, learning_goals, language)
+        sections.append(f'MAIN INSTRUCTIONS for "{msg_type}" (JSON field "{msg_type}"):\n{instructions}')
+    return "\n\n".join(sections)
\ No newline at end of file
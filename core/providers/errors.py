@@ -0,0 +1,52 @@
+class ProviderError(ConnectionError):
+    """
+    A failed provider request. Subclasses ConnectionError so existing callers keep handling it.
+    'retryable' tells the scheduler whether sending the same request again may succeed.
+    """
+
+    retryable = False
+
+    def __init__(self, message, status_code=None, retry_after=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after # Seconds, from the Retry-After header if the server sent one
+
+
+class RateLimitError(ProviderError):
+    """HTTP 429: the provider asks us to slow down."""
+
+    retryable = True
+
+
+class TransientProviderError(ProviderError):
+    """Server errors (5xx), timeouts and connection failures."""
+
+    retryable = True
+
+
+class CircuitOpenError(ProviderError):
+    """Raised without contacting the provider while its circuit breaker is open."""
+
+
+class RouteUnavailableError(CircuitOpenError):
+    """
+    Raised by the router while a route's circuit breaker is open. Retryable: for the scheduler it
+    is a transient failure of the provider, waited out ('retry_after' = rest of the cooldown) and
+    counted towards the scheduler's own breaker.
+    """
+
+    retryable = True
+
+
+def parse_retry_after(headers):
+    """Seconds to wait according to 'retry-after-ms' / 'retry-after' response headers, or None."""
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        pass # HTTP-date values are rare for these APIs; fall back to backoff
+    return None
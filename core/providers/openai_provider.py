@@ -1,15 +1,166 @@
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
+import openai
+import asyncio
 import httpx
 import logging
+import threading
 
 # Local import from the same package (core)
-from ..file_processor import process_image_for_api # Adjusted import
+from .. import config
+from .. import tracing
+from .errors import ProviderError, RateLimitError, TransientProviderError, parse_retry_after
 
-# Initialize a custom httpx client without proxies
+
+def _http2_available():
+    """HTTP/2 support in httpx needs the optional 'h2' package."""
+    if not config.HTTP2_ENABLED:
+        return False
+    try:
+        import h2 # noqa: F401
+        return True
+    except ImportError:
+        logging.warning("HTTP/2 requested but the 'h2' package is not installed; using HTTP/1.1.")
+        return False
+
+
+def _http_client_options():
+    """Shared connection-pool, keep-alive and timeout settings for the httpx clients."""
+    return dict(
+        http2=_http2_available(),
+        limits=httpx.Limits(
+            max_connections=config.HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=config.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=config.HTTP_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(config.HTTP_READ_TIMEOUT, connect=config.HTTP_CONNECT_TIMEOUT),
+    )
+
+
+# Custom httpx client without proxies, created with the first OpenAI client instead of at import
 # This relies on proxy env vars being cleared by core.config
-http_client = httpx.Client()
+http_client = None
+
+# Long-lived OpenAI clients, one per (api_key, base_url).
+# Async clients are additionally bound to the event loop that created them,
+# since httpx connection pools cannot be shared across loops.
+_sync_clients = {}
+_async_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_openai_client(api_key: str, base_url: str = None):
+    """Returns the shared synchronous OpenAI client for this API key, creating it on first use."""
+    global http_client
+    key = (api_key, base_url)
+    with _clients_lock:
+        client = _sync_clients.get(key)
+        if client is None:
+            if http_client is None:
+                http_client = httpx.Client(**_http_client_options())
+            client = OpenAI(
+                api_key=api_key,
+                base_url=base_url,
+                max_retries=0, # Retries and backoff are handled by core.scheduler
+                http_client=http_client # Use the pre-configured client
+            )
+            _sync_clients[key] = client
+        return client
+
+
+def get_async_openai_client(api_key: str, base_url: str = None):
+    """
+    Returns the shared AsyncOpenAI client for this API key on the running event loop.
+    All coroutines on the same loop reuse one pooled httpx.AsyncClient (and its TLS connections).
+    """
+    loop = asyncio.get_running_loop()
+    key = (api_key, base_url)
+    with _clients_lock:
+        entry = _async_clients.get(key)
+        if entry is None or entry[0] is not loop:
+            client = AsyncOpenAI(
+                api_key=api_key,
+                base_url=base_url,
+                max_retries=0, # Retries and backoff are handled by core.scheduler
+                http_client=httpx.AsyncClient(**_http_client_options())
+            )
+            entry = (loop, client)
+            _async_clients[key] = entry
+        return entry[1]
+
+
+async def close_async_clients():
+    """Closes the async clients owned by the running event loop (e.g. on shutdown)."""
+    loop = asyncio.get_running_loop()
+    with _clients_lock:
+        owned = [key for key, (client_loop, _) in _async_clients.items() if client_loop is loop]
+        clients = [_async_clients.pop(key)[1] for key in owned]
+    for client in clients:
+        await client.close()
+
+
+def _as_provider_error(e):
+    """Maps an OpenAI SDK exception to the provider error types the scheduler understands."""
+    if isinstance(e, openai.RateLimitError):
+        return RateLimitError(f"OpenAI API rate limit: {e}", status_code=429, retry_after=parse_retry_after(e.response.headers))
+    if isinstance(e, openai.APIStatusError):
+        error_class = TransientProviderError if e.status_code >= 500 or e.status_code in (408, 409) else ProviderError
+        return error_class(f"OpenAI API request failed: {e}", status_code=e.status_code, retry_after=parse_retry_after(e.response.headers))
+    if isinstance(e, (openai.APIConnectionError, httpx.TransportError)): # Includes timeouts
+        return TransientProviderError(f"OpenAI API request failed: {e}")
+    return ProviderError(f"OpenAI API request failed: {e}")
+
+
+def _build_messages(system_prompt: str, user_prompt: str, images_base64_list: list = None):
+    """
+    Builds the chat messages (system + optional images + user text).
+    Images go before the text: together with the system prompt and the document at the start
+    of the user prompt they form a prefix shared by all question types of a page, so the
+    provider's prompt cache covers them; only the trailing type instructions differ.
+    """
+    messages = [{"role": "system", "content": system_prompt}]
+
+    user_content = []
+    if images_base64_list:
+        for image in images_base64_list:
+            # Entries are either ready-to-use base64 JPEG strings (sent in low detail, as in the
+            # original app) or prepared images from image_pipeline.prepare_image_for_api,
+            # which carry their own detail level.
+            base64_image_str, detail = (image["data"], image["detail"]) if isinstance(image, dict) else (image, "low")
+            user_content.append({
+                "type": "image_url",
+                "image_url": {
+                    "url": f"data:image/jpeg;base64,{base64_image_str}",
+                    "detail": detail
+                }
+            })
+    user_content.append({"type": "text", "text": user_prompt})
+
+    messages.append({"role": "user", "content": user_content})
+    return messages
+
+
+def _build_api_settings(settings: dict = None):
+    """Default settings if not provided, merged/overridden with the provided settings."""
+    # If a specific response_format is requested (like json_object), ensure it's passed
+    # For example, settings could be {"response_format": {"type": "json_object"}}
+    return {
+        "temperature": 0.4, # from original app
+        "max_tokens": 16000, # from original app
+        # "response_format": {"type": "json_object"}, # Enable if all responses should be JSON
+        **(settings or {}) # Merge/override with provided settings
+    }
+
+
+def build_chat_request(model_name: str, system_prompt: str, user_prompt: str, images_base64_list: list = None, settings: dict = None):
+    """Request body for /v1/chat/completions, as used by the live calls and by Batch API input files."""
+    return {
+        "model": model_name,
+        "messages": _build_messages(system_prompt, user_prompt, images_base64_list),
+        **_build_api_settings(settings)
+    }
 
-def get_openai_response(api_key: str, model_name: str, system_prompt: str, user_prompt: str, images_base64_list: list = None, settings: dict = None):
+
+def get_openai_response(api_key: str, model_name: str, system_prompt: str, user_prompt: str, images_base64_list: list = None, settings: dict = None, base_url: str = None):
     """
     Fetches response from OpenAI GPT.
 
@@ -18,56 +169,70 @@ def get_openai_response(api_key: str, model_name: str, system_prompt: str, user_
         model_name (str): Specific OpenAI model to use.
         system_prompt (str): The system prompt.
         user_prompt (str): The user's prompt.
-        images_base64_list (list, optional): List of base64 encoded image strings.
-        settings (dict, optional): Additional OpenAI-specific settings 
+        images_base64_list (list, optional): List of base64 encoded image strings or prepared image dicts.
+        settings (dict, optional): Additional OpenAI-specific settings
                                    (e.g., temperature, max_tokens, response_format).
+        base_url (str, optional): Alternative API endpoint. Defaults to config.OPENAI_BASE_URL.
 
     Returns:
         str: The LLM's response content.
     """
     try:
-        client = OpenAI(
-            api_key=api_key,
-            http_client=http_client # Use the pre-configured client
-        )
-
-        messages = [{"role": "system", "content": system_prompt}]
-        
-        user_content = [{"type": "text", "text": user_prompt}]
-        if images_base64_list:
-            for base64_image_str in images_base64_list:
-                # The process_image_for_api function is now expected to return a base64 string.
-                # If it's already base64, it can just pass it through or ensure correct format.
-                # For this provider, we assume images_base64_list contains ready-to-use base64 strings.
-                user_content.append({
-                    "type": "image_url",
-                    "image_url": {
-                        "url": f"data:image/jpeg;base64,{base64_image_str}",
-                        "detail": "low" # As per original app
-                    }
-                })
-        
-        messages.append({"role": "user", "content": user_content})
-
-        # Default settings if not provided
-        api_settings = {
-            "temperature": 0.4, # from original app
-            "max_tokens": 16000, # from original app
-            # "response_format": {"type": "json_object"}, # Enable if all responses should be JSON
-            **(settings or {}) # Merge/override with provided settings
-        }
-        
-        # If a specific response_format is requested (like json_object), ensure it's passed
-        # For example, settings could be {"response_format": {"type": "json_object"}}
+        client = get_openai_client(api_key, base_url or config.OPENAI_BASE_URL)
 
         completion = client.chat.completions.create(
-            model=model_name,
-            messages=messages,
-            **api_settings
+            **build_chat_request(model_name, system_prompt, user_prompt, images_base64_list, settings)
         )
-        
+        tracing.record_usage(completion.usage, model_name)
+
         return completion.choices[0].message.content
     except Exception as e:
         logging.error(f"Error communicating with OpenAI API: {e}")
         # Re-raise the exception so the caller (llm_service) can handle it or propagate it
-        raise ConnectionError(f"OpenAI API request failed: {e}") from e
\ No newline at end of file
+        raise _as_provider_error(e) from e
+
+
+def stream_openai_response(api_key: str, model_name: str, system_prompt: str, user_prompt: str, images_base64_list: list = None, settings: dict = None, base_url: str = None):
+    """
+    Streaming variant of get_openai_response.
+    Yields the content deltas as they arrive instead of waiting for the full completion.
+    """
+    try:
+        client = get_openai_client(api_key, base_url or config.OPENAI_BASE_URL)
+
+        stream = client.chat.completions.create(
+            stream=True,
+            stream_options={"include_usage": True}, # Usage arrives in a final chunk without choices
+            **build_chat_request(model_name, system_prompt, user_prompt, images_base64_list, settings)
+        )
+        for chunk in stream:
+            if chunk.usage:
+                tracing.record_usage(chunk.usage, model_name)
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    except Exception as e:
+        logging.error(f"Error communicating with OpenAI API: {e}")
+        raise _as_provider_error(e) from e
+
+
+async def get_openai_response_async(api_key: str, model_name: str, system_prompt: str, user_prompt: str, images_base64_list: list = None, settings: dict = None, base_url: str = None):
+    """
+    Async variant of get_openai_response.
+    Runs on the shared AsyncOpenAI client of the current event loop, so concurrent
+    generations reuse pooled (HTTP/2 keep-alive) connections instead of opening new ones.
+
+    Returns:
+        str: The LLM's response content.
+    """
+    try:
+        client = get_async_openai_client(api_key, base_url or config.OPENAI_BASE_URL)
+
+        completion = await client.chat.completions.create(
+            **build_chat_request(model_name, system_prompt, user_prompt, images_base64_list, settings)
+        )
+        tracing.record_usage(completion.usage, model_name)
+
+        return completion.choices[0].message.content
+    except Exception as e:
+        logging.error(f"Error communicating with OpenAI API: {e}")
+        raise _as_provider_error(e) from e
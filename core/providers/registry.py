@@ -0,0 +1,59 @@
+"""
+Provider registry: maps a provider name to the functions that send one request.
+
+Providers are registered as loader functions and imported on first use, so the app does not
+pay for an SDK it never calls. Every provider exposes the same three functions, all taking
+(api_key, model_name, system_prompt, user_prompt, images_base64_list, settings, base_url):
+
+    generate        -> response text
+    generate_async  -> awaitable response text
+    stream          -> iterator of text deltas
+
+"openai_compatible" talks to any server implementing /v1/chat/completions (vLLM, llama.cpp,
+Ollama, LM Studio, the mock server in tools/) through the OpenAI SDK; routes give it a base_url.
+"""
+import threading
+from collections import namedtuple
+
+Provider = namedtuple("Provider", ["name", "generate", "generate_async", "stream"])
+
+_loaders = {}
+_providers = {}
+_lock = threading.Lock()
+
+
+def register_provider(name, loader):
+    """Registers 'loader', a function returning a Provider, under 'name' (replacing an earlier one)."""
+    with _lock:
+        _loaders[name.lower()] = loader
+        _providers.pop(name.lower(), None)
+
+
+def get_provider(name):
+    """The Provider registered as 'name'; raises ValueError for unknown names."""
+    key = name.lower()
+    with _lock:
+        if key not in _providers:
+            if key not in _loaders:
+                raise ValueError(f"Unsupported LLM provider: {name}")
+            _providers[key] = _loaders[key]()
+        return _providers[key]
+
+
+def provider_names():
+    with _lock:
+        return sorted(_loaders)
+
+
+def _load_openai(name):
+    from . import openai_provider
+    return Provider(
+        name=name,
+        generate=openai_provider.get_openai_response,
+        generate_async=openai_provider.get_openai_response_async,
+        stream=openai_provider.stream_openai_response,
+    )
+
+
+register_provider("openai", lambda: _load_openai("openai"))
+register_provider("openai_compatible", lambda: _load_openai("openai_compatible"))
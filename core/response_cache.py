@@ -0,0 +1,148 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+
+def make_cache_key(provider: str, model_name: str, system_prompt: str, user_prompt: str, images_base64_list: list = None, settings: dict = None):
+    """
+    Content address of a generation request: SHA-256 over every input that influences the output.
+    Images are hashed individually so the key payload stays small.
+    """
+    payload = {
+        "provider": provider.lower(),
+        "model": model_name,
+        "system": system_prompt,
+        "user": user_prompt,
+        "images": [
+            hashlib.sha256(json.dumps(image, sort_keys=True).encode("utf-8")).hexdigest()
+            for image in (images_base64_list or [])
+        ],
+        "settings": settings or {},
+    }
+    serialized = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Persistent SQLite cache for LLM responses with TTL expiry and size-based LRU eviction.
+    Safe to share between threads; several processes may use the same file (WAL mode).
+    """
+
+    def __init__(self, path: str, ttl_seconds: float, max_bytes: int):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY,"
+                " response TEXT NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " last_access REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses(last_access)")
+
+    def get(self, key: str):
+        """Returns the cached response or None on a miss (expired entries count as misses)."""
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and now - row[1] > self.ttl_seconds:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return row[0]
+
+    def set(self, key: str, response: str):
+        """Stores a response and evicts expired and least recently used entries beyond max_bytes."""
+        now = time.time()
+        size = len(response.encode("utf-8"))
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, size, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, response, size, now, now)
+            )
+            self._evict(now)
+
+    def _evict(self, now: float):
+        cursor = self._conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,))
+        self.evictions += max(cursor.rowcount, 0)
+
+        total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total_bytes <= self.max_bytes:
+            return
+        stale_keys = []
+        for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY last_access ASC"):
+            if total_bytes <= self.max_bytes:
+                break
+            stale_keys.append((key,))
+            total_bytes -= size
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", stale_keys)
+        self.evictions += len(stale_keys)
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM responses")
+
+    def stats(self):
+        """Hit/miss counters of this process plus the current size of the store."""
+        with self._lock:
+            entries, total_bytes = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": entries,
+            "bytes": total_bytes,
+        }
+
+
+_cache = None
+_cache_failed = False # An open that failed is not retried on every request
+_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """Returns the process-wide response cache, or None if caching is disabled or unavailable."""
+    global _cache, _cache_failed
+    from . import config
+    if not config.RESPONSE_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None and not _cache_failed:
+            try:
+                _cache = ResponseCache(
+                    config.RESPONSE_CACHE_PATH,
+                    ttl_seconds=config.RESPONSE_CACHE_TTL_SECONDS,
+                    max_bytes=config.RESPONSE_CACHE_MAX_BYTES
+                )
+            except (sqlite3.Error, OSError) as e:
+                logging.error(f"Response cache disabled, could not open {config.RESPONSE_CACHE_PATH}: {e}")
+                _cache_failed = True
+        return _cache
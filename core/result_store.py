@@ -0,0 +1,119 @@
+"""
+Session-scoped store for everything computed from an upload.
+
+Streamlit reruns the whole script on every widget interaction. The store keeps the
+extracted text, the rendered page images and the processed responses per page and
+question type in st.session_state, keyed by the file's content hash, so a rerun reuses
+them instead of extracting or generating again. Every response carries a fingerprint of
+the inputs it was generated from; only types whose fingerprint changed are regenerated.
+With config.RESULT_STORE_DIR set, entries are also written to disk and outlive the session.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+import streamlit as st # For st.session_state
+
+from . import config
+
+
+def content_key(data):
+    """SHA-256 of a file's bytes (or a text), used as the key of everything derived from it."""
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+
+def result_fingerprint(**inputs):
+    """Fingerprint of the inputs a response was generated from (template, text, goals, language, images, model)."""
+    serialized = json.dumps(inputs, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+
+class ResultStore:
+    """
+    In-memory LRU mapping of (kind, file_key, page, name) -> JSON-serializable value,
+    optionally mirrored to one JSON file per entry in 'directory'.
+    Kinds used by the app: "page_count", "pdf_pages" ([text, prepared images] of a page range), "text"
+    (DOCX) and "response" ({"fingerprint", "response"} per page and question type).
+    """
+
+    def __init__(self, directory=None, max_entries=None):
+        self.directory = directory
+        self.max_entries = max_entries or config.RESULT_STORE_MAX_ENTRIES
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        digest = hashlib.sha256(json.dumps(key).encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, f"{digest}.json")
+
+    def get(self, kind, file_key, page=None, name=None):
+        """The stored value, or None if nothing is stored under this key."""
+        key = (kind, file_key, page, name)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+        if not self.directory:
+            return None
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as f:
+                value = json.load(f)["value"]
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError) as e:
+            logging.warning(f"Ignoring unreadable result store entry for {kind}: {e}")
+            return None
+        self._remember(key, value)
+        return value
+
+    def set(self, kind, file_key, value, page=None, name=None):
+        key = (kind, file_key, page, name)
+        self._remember(key, value)
+        if not self.directory:
+            return
+        path = self._path(key)
+        try:
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump({"key": key, "value": value}, f, ensure_ascii=False)
+            os.replace(path + ".tmp", path) # Atomic, so concurrent sessions never read half an entry
+        except OSError as e:
+            logging.warning(f"Could not write result store entry for {kind}: {e}")
+
+    def _remember(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_response(self, file_key, page, msg_type, fingerprint):
+        """
+        The processed response stored for a page and type, if it was generated from the inputs
+        'fingerprint' stands for; a response for other inputs (e.g. edited text) is not returned.
+        """
+        entry = self.get("response", file_key, page, msg_type)
+        if entry is None or entry["fingerprint"] != fingerprint:
+            return None
+        return entry["response"]
+
+    def set_response(self, file_key, page, msg_type, fingerprint, response):
+        self.set("response", file_key, {"fingerprint": fingerprint, "response": response}, page, msg_type)
+
+    def clear(self):
+        """Forgets the in-memory entries; entries on disk are kept."""
+        with self._lock:
+            self._entries.clear()
+
+
+def get_result_store():
+    """The result store of the current Streamlit session, created on first use."""
+    if "result_store" not in st.session_state:
+        st.session_state["result_store"] = ResultStore(config.RESULT_STORE_DIR)
+    return st.session_state["result_store"]
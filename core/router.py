@@ -0,0 +1,352 @@
+"""
+Routes provider requests over the configured endpoints (config.LLM_ROUTES).
+
+The route named by the request's 'provider' is tried first. If it has not answered after
+its hedge delay (the ROUTER_HEDGE_PERCENTILE latency of its recent requests), a duplicate
+request goes to the next route and the first answer wins; the slower one is cancelled
+(async) or its answer discarded (sync). A route failing with a transient error, or whose
+circuit breaker is open after repeated failures, fails over to the next route at once.
+Every route tracks its latencies, outcomes and health.
+
+The router runs inside the scheduler's call: rate limiting and retries with backoff still
+apply to the request as a whole, a hedge is an additional attempt within it. A request whose
+routes are all skipped fails with the retryable RouteUnavailableError, so the scheduler waits
+out the cooldown and counts the failure towards its own circuit breaker.
+"""
+import asyncio
+import contextvars
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from . import config
+from . import tracing
+from .providers.errors import CircuitOpenError, ProviderError, RouteUnavailableError
+from .providers.registry import get_provider
+from .scheduler import CircuitBreaker
+
+
+class LatencyTracker:
+    """Sliding window of a route's recent successful request latencies."""
+
+    def __init__(self, window):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    @property
+    def count(self):
+        with self._lock:
+            return len(self._samples)
+
+    def percentile(self, share):
+        """The latency below which 'share' of the recent requests finished, or None without samples."""
+        with self._lock:
+            ordered = sorted(self._samples)
+        if not ordered:
+            return None
+        return ordered[min(len(ordered) - 1, int(round(share * (len(ordered) - 1))))]
+
+
+class Route:
+    """One endpoint: a registered provider plus the base URL, API key and model to use with it."""
+
+    def __init__(self, name, provider, base_url=None, api_key=None, model=None):
+        self.name = name
+        self.provider = provider
+        self.base_url = base_url
+        self.api_key = api_key
+        self.model = model
+        self.latency = LatencyTracker(config.ROUTER_LATENCY_WINDOW)
+        self.breaker = CircuitBreaker(config.ROUTER_FAILURE_THRESHOLD, config.ROUTER_RESET_SECONDS)
+        self.stats = {"requests": 0, "successes": 0, "failures": 0, "hedges": 0, "hedge_wins": 0, "cancelled": 0}
+        self._stats_lock = threading.Lock()
+
+    def count(self, key):
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    def hedge_delay(self):
+        """Seconds to wait for this route before sending a duplicate to the next one."""
+        if self.latency.count < config.ROUTER_LATENCY_MIN_SAMPLES:
+            return config.ROUTER_HEDGE_DEFAULT_DELAY
+        return max(config.ROUTER_HEDGE_MIN_DELAY, self.latency.percentile(config.ROUTER_HEDGE_PERCENTILE))
+
+    def request_kwargs(self, request):
+        """The provider function arguments for 'request', with this route's endpoint, key and model."""
+        return {
+            **request,
+            "api_key": self.api_key or request["api_key"],
+            "model_name": self.model or request["model_name"],
+            "base_url": self.base_url,
+        }
+
+    def snapshot(self):
+        p50, p95 = self.latency.percentile(0.5), self.latency.percentile(0.95)
+        with self._stats_lock:
+            stats = dict(self.stats)
+        return {
+            **stats,
+            "health": self.breaker.state,
+            "latency_p50": round(p50, 4) if p50 is not None else None,
+            "latency_p95": round(p95, 4) if p95 is not None else None,
+            "hedge_delay": round(self.hedge_delay(), 4),
+        }
+
+
+def _can_fail_over(error):
+    """Transient failures and open breakers are worth another route; invalid requests are not."""
+    return isinstance(error, CircuitOpenError) or (isinstance(error, ProviderError) and error.retryable)
+
+
+def _pick_error(errors):
+    """The error to raise when every route failed: a retryable one if any, so the scheduler retries."""
+    for error in errors:
+        if isinstance(error, ProviderError) and error.retryable:
+            return error
+    return errors[0]
+
+
+class Router:
+    """Sends requests over the routes with hedging and failover. One instance is shared by all sessions."""
+
+    def __init__(self, routes, hedging=True):
+        self.routes = routes
+        self.hedging = hedging
+        self.stats = {"requests": 0, "hedged": 0, "failovers": 0}
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def routes_for(self, provider):
+        """The routes in the order they are tried: the one named 'provider' first, then the others."""
+        primary = [route for route in self.routes if route.name == provider.lower()]
+        if not primary:
+            raise ValueError(f"Unsupported LLM provider: {provider}")
+        return primary + [route for route in self.routes if route is not primary[0]]
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # A hedged request holds two threads; blocked threads only wait on the network
+                self._executor = ThreadPoolExecutor(
+                    max_workers=config.HTTP_MAX_CONNECTIONS * len(self.routes), thread_name_prefix="llm-route"
+                )
+            return self._executor
+
+    # --- single attempts -------------------------------------------------------------
+
+    def _before_attempt(self, route, hedge):
+        try:
+            route.breaker.before_request()
+        except CircuitOpenError as e:
+            # Retryable, unlike the scheduler's own CircuitOpenError: a route skipped for its recent
+            # failures is a transient failure of the request, so the scheduler backs off and counts it
+            raise RouteUnavailableError(f"LLM route {route.name} is skipped after repeated failures.", retry_after=e.retry_after) from e
+        route.count("requests")
+        if hedge:
+            route.count("hedges")
+
+    def _record_success(self, route, seconds):
+        route.breaker.record_success()
+        route.latency.record(seconds)
+        route.count("successes")
+        tracing.metrics.observe("olat_route_latency_seconds", seconds, route=route.name)
+        tracing.metrics.inc("olat_route_requests_total", route=route.name, outcome="success")
+
+    def _record_failure(self, route, error):
+        if isinstance(error, ProviderError) and error.retryable and error.status_code != 429:
+            route.breaker.record_failure()
+        else:
+            route.breaker.record_success() # Busy (429) or a bad request: the route itself is fine
+        route.count("failures")
+        tracing.metrics.inc("olat_route_requests_total", route=route.name, outcome="failure")
+
+    def _attempt(self, route, request, hedge=False):
+        self._before_attempt(route, hedge)
+        start = time.perf_counter()
+        with tracing.span("route_attempt", route=route.name, hedge=hedge):
+            try:
+                response = get_provider(route.provider).generate(**route.request_kwargs(request))
+            except Exception as e:
+                self._record_failure(route, e)
+                raise
+        self._record_success(route, time.perf_counter() - start)
+        return response
+
+    async def _attempt_async(self, route, request, hedge=False):
+        self._before_attempt(route, hedge)
+        start = time.perf_counter()
+        with tracing.span("route_attempt", route=route.name, hedge=hedge):
+            try:
+                response = await get_provider(route.provider).generate_async(**route.request_kwargs(request))
+            except asyncio.CancelledError:
+                route.breaker.cancel_request()
+                route.count("cancelled")
+                raise
+            except Exception as e:
+                self._record_failure(route, e)
+                raise
+        self._record_success(route, time.perf_counter() - start)
+        return response
+
+    # --- requests --------------------------------------------------------------------
+
+    def generate(self, provider, **request):
+        """
+        Sends a request (the provider function arguments without base_url) and returns
+        (response, route) for the first successful response; 'route' is the one that answered.
+        Hedges run on a thread pool; a losing attempt finishes in the background and only
+        contributes its latency.
+        """
+        routes = self.routes_for(provider)
+        self._count("requests")
+        if len(routes) == 1:
+            return self._attempt(routes[0], request), routes[0]
+
+        remaining = list(routes)
+        futures = {} # future -> (route, hedge)
+        errors = []
+        hedge_at = None
+
+        def launch(hedge=False):
+            nonlocal hedge_at
+            route = remaining.pop(0)
+            context = contextvars.copy_context() # Keeps the tracing span and usage totals of the caller
+            futures[self._get_executor().submit(context.run, self._attempt, route, request, hedge)] = (route, hedge)
+            if not hedge:
+                hedge_at = time.monotonic() + route.hedge_delay()
+
+        launch()
+        while futures:
+            timeout = None
+            if self.hedging and remaining and len(futures) == 1 and not any(hedge for _, hedge in futures.values()):
+                timeout = max(0.0, hedge_at - time.monotonic())
+            done, _ = wait(futures, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                self._count("hedged")
+                launch(hedge=True)
+                continue
+            for future in done:
+                route, hedge = futures.pop(future)
+                error = future.exception()
+                if error is None:
+                    if hedge:
+                        route.count("hedge_wins")
+                    return future.result(), route
+                errors.append(error)
+                if not _can_fail_over(error):
+                    raise error
+            if not futures and remaining:
+                self._count("failovers")
+                logging.warning(f"LLM route {route.name} failed ({errors[-1]}); trying {remaining[0].name}.")
+                launch()
+        raise _pick_error(errors)
+
+    async def generate_async(self, provider, **request):
+        """Async counterpart of generate (same return value); the losing attempt of a hedged request is cancelled."""
+        routes = self.routes_for(provider)
+        self._count("requests")
+        if len(routes) == 1:
+            return await self._attempt_async(routes[0], request), routes[0]
+
+        remaining = list(routes)
+        tasks = {} # task -> (route, hedge)
+        errors = []
+        hedge_at = None
+
+        def launch(hedge=False):
+            nonlocal hedge_at
+            route = remaining.pop(0)
+            tasks[asyncio.ensure_future(self._attempt_async(route, request, hedge))] = (route, hedge)
+            if not hedge:
+                hedge_at = time.monotonic() + route.hedge_delay()
+
+        launch()
+        try:
+            while tasks:
+                timeout = None
+                if self.hedging and remaining and len(tasks) == 1 and not any(hedge for _, hedge in tasks.values()):
+                    timeout = max(0.0, hedge_at - time.monotonic())
+                done, _ = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    self._count("hedged")
+                    launch(hedge=True)
+                    continue
+                for task in done:
+                    route, hedge = tasks.pop(task)
+                    error = task.exception()
+                    if error is None:
+                        if hedge:
+                            route.count("hedge_wins")
+                        return task.result(), route
+                    errors.append(error)
+                    if not _can_fail_over(error):
+                        raise error
+                if not tasks and remaining:
+                    self._count("failovers")
+                    logging.warning(f"LLM route {route.name} failed ({errors[-1]}); trying {remaining[0].name}.")
+                    launch()
+            raise _pick_error(errors)
+        finally:
+            for task in tasks: # The slower attempt of a hedged request, or all on cancellation
+                task.cancel()
+
+    def open_stream(self, provider, **request):
+        """
+        Opens a streamed response on the first route that delivers a first delta; returns
+        (first delta or None, remaining delta iterator, route). Streams fail over but are not hedged.
+        """
+        errors = []
+        self._count("requests")
+        for index, route in enumerate(self.routes_for(provider)):
+            if index:
+                self._count("failovers")
+            try:
+                self._before_attempt(route, hedge=False)
+            except CircuitOpenError as e:
+                errors.append(e)
+                continue
+            try:
+                # Request errors surface on the first delta, so fetch it here
+                stream = get_provider(route.provider).stream(**route.request_kwargs(request))
+                first_delta = next(stream, None)
+            except Exception as e:
+                self._record_failure(route, e)
+                errors.append(e)
+                if not _can_fail_over(e):
+                    raise
+                continue
+            route.breaker.record_success()
+            route.count("successes") # Latency is not recorded: time to first delta is a different measure
+            return first_delta, stream, route
+        raise _pick_error(errors)
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self.stats)
+        return {**stats, "routes": {route.name: route.snapshot() for route in self.routes}}
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_router():
+    """Returns the process-wide router over config.LLM_ROUTES, shared by all Streamlit sessions."""
+    global _router
+    with _router_lock:
+        if _router is None:
+            _router = Router(
+                [Route(**route) for route in config.LLM_ROUTES],
+                hedging=config.ROUTER_HEDGING_ENABLED
+            )
+        return _router
@@ -0,0 +1,282 @@
+"""
+Process-wide request scheduler for the provider layer.
+
+Every LLM request first waits for a slot in two token buckets (requests per minute and
+tokens per minute), queued by priority so interactive sessions go ahead of batch work.
+Rate limits (429, honouring Retry-After) and transient failures (5xx, timeouts) are
+retried with exponential backoff and full jitter; repeated transient failures open a
+circuit breaker that fails fast until the provider has had time to recover.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+
+from . import config
+from .providers.errors import CircuitOpenError, ProviderError
+
+
+class TokenBucket:
+    """Classic token bucket: 'capacity' tokens, refilled continuously at 'rate' tokens per second."""
+
+    def __init__(self, capacity, rate):
+        self.capacity = float(capacity)
+        self.rate = float(rate)
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """Seconds until 'amount' tokens are available (0 if they are available now)."""
+        self._refill(now)
+        amount = min(amount, self.capacity) # Oversized requests must still be able to pass
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount, now):
+        self._refill(now)
+        self.tokens -= min(amount, self.capacity)
+
+
+class CircuitBreaker:
+    """
+    Opens after 'failure_threshold' consecutive transient failures, rejects requests for
+    'reset_seconds', then lets a single probe request through (half-open) to test recovery.
+    """
+
+    def __init__(self, failure_threshold, reset_seconds):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self.probe_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state(time.monotonic())
+
+    def _state(self, now):
+        if self.opened_at is None:
+            return "closed"
+        if now - self.opened_at >= self.reset_seconds:
+            return "half-open"
+        return "open"
+
+    def before_request(self):
+        """Raises CircuitOpenError unless a request may be sent now."""
+        with self._lock:
+            now = time.monotonic()
+            state = self._state(now)
+            if state == "open" or (state == "half-open" and self.probe_in_flight):
+                # Until the breaker turns half-open; a probe in flight has no known end
+                retry_after = self.reset_seconds - (now - self.opened_at) if state == "open" else None
+                raise CircuitOpenError("Provider temporarily unavailable after repeated failures; please try again shortly.", retry_after=retry_after)
+            if state == "half-open":
+                self.probe_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probe_in_flight = False
+
+    def cancel_request(self):
+        """An admitted request was abandoned without an outcome (e.g. a cancelled hedge); frees the probe slot."""
+        with self._lock:
+            self.probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.probe_in_flight = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic() # (Re-)open; a failed probe restarts the cooldown
+
+
+class RequestScheduler:
+    """
+    Admits requests in priority order (lower value first, FIFO within a priority) as the
+    request and token buckets allow, and runs them with retries and circuit breaking.
+    One instance is shared by all sessions of the process.
+    """
+
+    def __init__(self, requests_per_minute, tokens_per_minute, max_retries, base_delay, max_delay, breaker):
+        self.request_bucket = TokenBucket(requests_per_minute, requests_per_minute / 60)
+        self.token_bucket = TokenBucket(tokens_per_minute, tokens_per_minute / 60)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.breaker = breaker
+        self.paused_until = 0.0 # Set from Retry-After so every queued request backs off, not just one
+        self._waiters = [] # Heap of (priority, sequence)
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self.stats = {"requests": 0, "retries": 0, "rate_limited": 0, "failures": 0, "rejected": 0}
+
+    # --- admission -------------------------------------------------------------------
+
+    def _enqueue(self, priority):
+        ticket = (priority, next(self._sequence))
+        with self._condition:
+            heapq.heappush(self._waiters, ticket)
+        return ticket
+
+    def _try_admit(self, ticket, token_estimate):
+        """Admits the ticket if it is at the head of the queue and both buckets allow it; otherwise returns the wait hint."""
+        with self._condition:
+            now = time.monotonic()
+            if self._waiters[0] != ticket:
+                return 0.05
+            wait = max(
+                self.paused_until - now,
+                self.request_bucket.wait_time(1, now),
+                self.token_bucket.wait_time(token_estimate, now),
+            )
+            if wait > 0:
+                return wait
+            self.request_bucket.consume(1, now)
+            self.token_bucket.consume(token_estimate, now)
+            heapq.heappop(self._waiters)
+            self._condition.notify_all() # The next ticket is now at the head
+            return 0.0
+
+    def _abandon(self, ticket):
+        with self._condition:
+            if ticket in self._waiters:
+                self._waiters.remove(ticket)
+                heapq.heapify(self._waiters)
+                self._condition.notify_all()
+
+    def acquire(self, token_estimate, priority):
+        """Blocks until the request may be sent."""
+        ticket = self._enqueue(priority)
+        try:
+            while True:
+                wait = self._try_admit(ticket, token_estimate)
+                if not wait:
+                    return
+                with self._condition:
+                    self._condition.wait(timeout=wait)
+        except BaseException:
+            self._abandon(ticket)
+            raise
+
+    async def acquire_async(self, token_estimate, priority):
+        """Async counterpart of acquire; waits without blocking the event loop."""
+        ticket = self._enqueue(priority)
+        try:
+            while True:
+                wait = self._try_admit(ticket, token_estimate)
+                if not wait:
+                    return
+                await asyncio.sleep(min(wait, 1.0))
+        except BaseException:
+            self._abandon(ticket)
+            raise
+
+    # --- retries ---------------------------------------------------------------------
+
+    def _backoff(self, attempt):
+        """Exponential backoff with full jitter."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def _count(self, key):
+        with self._condition: # Attempts run on many worker threads
+            self.stats[key] += 1
+
+    def _before_attempt(self):
+        try:
+            self.breaker.before_request()
+        except CircuitOpenError:
+            self._count("rejected")
+            raise
+        self._count("requests")
+
+    def _handle_failure(self, error, attempt):
+        """Records a failed attempt; returns the delay before retrying, or re-raises if it should not be retried."""
+        if not isinstance(error, ProviderError) or not error.retryable:
+            # Not the provider's fault (e.g. invalid request); the circuit stays as it is
+            self.breaker.record_success()
+            raise error
+        if error.status_code == 429:
+            self._count("rate_limited")
+            self.breaker.record_success() # The provider is reachable, just busy
+            delay = error.retry_after if error.retry_after is not None else self._backoff(attempt)
+            with self._condition:
+                self.paused_until = max(self.paused_until, time.monotonic() + delay)
+        else:
+            self._count("failures")
+            self.breaker.record_failure()
+            delay = error.retry_after if error.retry_after is not None else self._backoff(attempt)
+        if attempt >= self.max_retries:
+            raise error
+        self._count("retries")
+        logging.warning(f"Provider request failed ({error}); retry {attempt + 1}/{self.max_retries} in {delay:.1f}s.")
+        return delay
+
+    def call(self, fn, token_estimate=0, priority=None):
+        """Runs fn() once admitted, retrying retryable provider errors."""
+        priority = config.PRIORITY_INTERACTIVE if priority is None else priority
+        for attempt in range(self.max_retries + 1):
+            self._before_attempt()
+            try:
+                self.acquire(token_estimate, priority)
+                result = fn()
+            except Exception as e:
+                delay = self._handle_failure(e, attempt)
+            except BaseException:
+                # Interrupted without an outcome (e.g. KeyboardInterrupt): free a claimed probe slot
+                self.breaker.cancel_request()
+                raise
+            else:
+                self.breaker.record_success()
+                return result
+            time.sleep(delay)
+
+    async def call_async(self, fn, token_estimate=0, priority=None):
+        """Async counterpart of call; fn() must return an awaitable."""
+        priority = config.PRIORITY_INTERACTIVE if priority is None else priority
+        for attempt in range(self.max_retries + 1):
+            self._before_attempt()
+            try:
+                await self.acquire_async(token_estimate, priority)
+                result = await fn()
+            except Exception as e:
+                delay = self._handle_failure(e, attempt)
+            except BaseException:
+                # Cancelled (e.g. the losing attempt of a hedged request): free a claimed probe slot
+                self.breaker.cancel_request()
+                raise
+            else:
+                self.breaker.record_success()
+                return result
+            await asyncio.sleep(delay)
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """Returns the process-wide scheduler, shared by all Streamlit sessions."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = RequestScheduler(
+                requests_per_minute=config.RATE_LIMIT_REQUESTS_PER_MINUTE,
+                tokens_per_minute=config.RATE_LIMIT_TOKENS_PER_MINUTE,
+                max_retries=config.RETRY_MAX_ATTEMPTS,
+                base_delay=config.RETRY_BASE_DELAY,
+                max_delay=config.RETRY_MAX_DELAY,
+                breaker=CircuitBreaker(config.CIRCUIT_FAILURE_THRESHOLD, config.CIRCUIT_RESET_SECONDS)
+            )
+        return _scheduler
@@ -0,0 +1,319 @@
+"""
+Lightweight tracing for generation runs.
+
+Spans time the stages of a run (file extraction, prompt loading, LLM requests,
+post-processing) and nest per thread/task through context variables, so every span knows
+its trace and parent. Token usage reported by the provider is attached to the innermost
+span. Finished spans are
+  - aggregated in memory into Prometheus-style metrics (get_metrics_text()),
+  - optionally appended as JSON lines to config.TRACE_JSONL_PATH,
+  - optionally written as a Prometheus textfile to config.TRACE_PROMETHEUS_PATH.
+"""
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+from . import config
+
+DURATION_BUCKETS = (0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+_current_span = contextvars.ContextVar("olat_current_span", default=None)
+_usage_totals = contextvars.ContextVar("olat_usage_totals", default=None)
+
+
+class Span:
+    """One timed operation. Attributes and token usage may be added while it is open."""
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "attributes", "usage", "start_time", "_start", "duration", "error")
+
+    def __init__(self, name, parent=None, attributes=None):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex[:16]
+        self.span_id = uuid.uuid4().hex[:8]
+        self.parent_id = parent.span_id if parent else None
+        self.attributes = dict(attributes or {})
+        self.usage = {}
+        self.start_time = time.time()
+        self._start = time.perf_counter()
+        self.duration = None
+        self.error = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def add_usage(self, **tokens):
+        for kind, count in tokens.items():
+            if count:
+                self.usage[kind] = self.usage.get(kind, 0) + count
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start": round(self.start_time, 6),
+            "duration_ms": round(self.duration * 1000, 3) if self.duration is not None else None,
+            "status": "error" if self.error else "ok",
+            "error": self.error,
+            "attributes": self.attributes,
+            "usage": self.usage,
+        }
+
+
+class _NullSpan:
+    """Returned while tracing is disabled; accepts and ignores everything."""
+
+    def set(self, **attributes):
+        pass
+
+    def add_usage(self, **tokens):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+# --- metrics -------------------------------------------------------------------------
+
+class Metrics:
+    """Thread-safe in-memory counters and duration histograms, rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {} # (metric, labels) -> value
+        self._histograms = {} # (metric, labels) -> [bucket counts..., sum, count]
+
+    def inc(self, metric, value=1, **labels):
+        key = (metric, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, metric, value, **labels):
+        key = (metric, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.setdefault(key, [0] * len(DURATION_BUCKETS) + [0.0, 0])
+            for index, bound in enumerate(DURATION_BUCKETS):
+                if value <= bound:
+                    histogram[index] += 1
+            histogram[-2] += value
+            histogram[-1] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._counters), {key: list(value) for key, value in self._histograms.items()}
+
+    def render(self):
+        counters, histograms = self.snapshot()
+        lines = []
+        for metric in sorted({key[0] for key in counters}):
+            lines.append(f"# TYPE {metric} counter")
+            for (name, labels), value in sorted(counters.items()):
+                if name == metric:
+                    lines.append(f"{metric}{_labels(labels)} {value}")
+        for metric in sorted({key[0] for key in histograms}):
+            lines.append(f"# TYPE {metric} histogram")
+            for (name, labels), histogram in sorted(histograms.items()):
+                if name != metric:
+                    continue
+                for bound, count in zip(DURATION_BUCKETS, histogram):
+                    lines.append(f"{metric}_bucket{_labels(labels + (('le', str(bound)),))} {count}")
+                lines.append(f"{metric}_bucket{_labels(labels + (('le', '+Inf'),))} {histogram[-1]}")
+                lines.append(f"{metric}_sum{_labels(labels)} {histogram[-2]:.6f}")
+                lines.append(f"{metric}_count{_labels(labels)} {histogram[-1]}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    escaped = (
+        f'{key}="' + str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+        for key, value in labels
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+metrics = Metrics()
+
+
+# --- sinks ---------------------------------------------------------------------------
+
+_sink_lock = threading.Lock()
+_last_prometheus_write = 0.0
+
+
+def _write_jsonl(span):
+    try:
+        line = json.dumps(span.to_dict(), ensure_ascii=False, default=str)
+        with _sink_lock:
+            directory = os.path.dirname(config.TRACE_JSONL_PATH)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(config.TRACE_JSONL_PATH, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+    except OSError as e:
+        logging.warning(f"Could not write trace span: {e}")
+
+
+def write_prometheus_textfile(path=None):
+    """Writes the current metrics atomically (for the node_exporter textfile collector)."""
+    path = path or config.TRACE_PROMETHEUS_PATH
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        f.write(metrics.render())
+    os.replace(temp_path, path)
+
+
+def _maybe_write_prometheus():
+    global _last_prometheus_write
+    now = time.monotonic()
+    with _sink_lock:
+        if now - _last_prometheus_write < config.TRACE_PROMETHEUS_INTERVAL:
+            return
+        _last_prometheus_write = now
+    try:
+        write_prometheus_textfile()
+    except OSError as e:
+        logging.warning(f"Could not write Prometheus metrics: {e}")
+
+
+def _finish(span):
+    labels = {"span": span.name, "status": "error" if span.error else "ok"}
+    metrics.observe("olat_span_duration_seconds", span.duration, span=span.name)
+    metrics.inc("olat_spans_total", **labels)
+    model = span.attributes.get("model", "")
+    for kind, count in span.usage.items():
+        metrics.inc("olat_llm_tokens_total", count, model=model, kind=kind)
+    if config.TRACE_JSONL_PATH:
+        _write_jsonl(span)
+    if config.TRACE_PROMETHEUS_PATH:
+        _maybe_write_prometheus()
+
+
+# --- API -----------------------------------------------------------------------------
+
+class span:
+    """
+    Context manager timing a block as a span named 'name':
+
+        with tracing.span("generate_via_llm", model=model_name) as s:
+            ...
+            s.set(cache="hit")
+    """
+
+    def __init__(self, name, **attributes):
+        self.name = name
+        self.attributes = attributes
+        self._span = None
+        self._token = None
+
+    def __enter__(self):
+        if not config.TRACING_ENABLED:
+            return _NULL_SPAN
+        self._span = Span(self.name, _current_span.get(), self.attributes)
+        self._token = _current_span.set(self._span)
+        return self._span
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._span is None:
+            return False
+        current = self._span
+        current.duration = time.perf_counter() - current._start
+        if exc is not None and not isinstance(exc, GeneratorExit):
+            current.error = f"{exc_type.__name__}: {exc}"
+        try:
+            _current_span.reset(self._token)
+        except ValueError:
+            # Exited in another context (e.g. a generator resumed elsewhere)
+            _current_span.set(None)
+        _finish(current)
+        return False
+
+
+def traced(name=None):
+    """Decorator running each call of the function (sync or async) in a span."""
+    def decorator(func):
+        span_name = name or func.__name__
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(span_name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def current_span():
+    """The innermost open span (a no-op span if there is none or tracing is disabled)."""
+    return _current_span.get() or _NULL_SPAN
+
+
+def record_usage(usage, model=None):
+    """
+    Attaches the token usage of a provider response (OpenAI 'usage' object or dict) to the
+    current span and the enclosing collect_usage block: prompt, completion and cached prompt tokens.
+    """
+    if usage is None:
+        return
+    get = usage.get if isinstance(usage, dict) else (lambda field, default=None: getattr(usage, field, default))
+    details = get("prompt_tokens_details")
+    cached = (details.get("cached_tokens") if isinstance(details, dict) else getattr(details, "cached_tokens", None)) if details else None
+    counts = {"prompt": get("prompt_tokens", 0) or 0, "completion": get("completion_tokens", 0) or 0, "cached": cached or 0}
+    totals = _usage_totals.get()
+    if totals is not None:
+        for kind, count in counts.items():
+            totals[kind] += count
+    current = current_span()
+    current.add_usage(**counts)
+    if model:
+        current.set(model=model)
+
+
+class collect_usage:
+    """
+    Context manager summing the token usage of all provider responses recorded inside the
+    block (in this thread or task), independent of whether tracing is enabled:
+
+        with tracing.collect_usage() as usage:
+            generate_via_llm(...)
+        usage["cached"], usage["prompt"], usage["completion"]
+
+    Blocks nest: the usage of an inner block also counts for the enclosing one.
+    """
+
+    def __enter__(self):
+        self.totals = {"prompt": 0, "completion": 0, "cached": 0}
+        self._outer = _usage_totals.get()
+        self._token = _usage_totals.set(self.totals)
+        return self.totals
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            _usage_totals.reset(self._token)
+        except ValueError:
+            _usage_totals.set(None)
+        if self._outer is not None:
+            for kind, count in self.totals.items():
+                self._outer[kind] += count
+        return False
+
+
+def get_metrics_text():
+    """The aggregated metrics in the Prometheus text exposition format."""
+    return metrics.render()
@@ -0,0 +1,121 @@
+"""
+Structural checks of raw LLM responses per question type.
+
+The model cascade (core/cascade.py) uses them to decide whether the small model's response
+is good enough or the type is generated again on the large model. The checks are purely
+structural: the response parses, has enough questions, and every question has the shape its
+type requires (answer options, exactly one correct single-choice answer, blanks that occur
+in the text). They cannot tell whether the content is right.
+"""
+import json
+from collections import namedtuple
+
+from . import config
+from .exporter import parse_olat_question
+from .json_repair import loads_tolerant
+from .output_frontmatter import question_blocks, split_text_on_blanks
+
+ValidationResult = namedtuple("ValidationResult", ["ok", "questions", "problems"])
+ValidationResult.__doc__ = "'ok' if the response passed, the number of questions found and the problems, as short messages."
+
+# Per OLAT question type: accepted 'Typ' keywords and the (min, max) number of answer options
+# and of correct options; None leaves a value unchecked
+QUESTION_SHAPES = {
+    "single_choice": {"types": ("SC",), "options": (4, 4), "correct": (1, 1)},
+    "multiple_choice1": {"types": ("MC",), "options": (3, None), "correct": (1, None)},
+    "multiple_choice2": {"types": ("MC",), "options": (3, None), "correct": (1, None)},
+    "kprim": {"types": ("KPRIM",), "options": (4, 4), "correct": (None, None)},
+    "truefalse": {"types": None, "options": (1, None), "correct": (None, None)},
+}
+
+
+def _out_of_range(value, bounds):
+    low, high = bounds
+    return (low is not None and value < low) or (high is not None and value > high)
+
+
+def _range_text(bounds):
+    low, high = bounds
+    if low == high:
+        return str(low)
+    return f"at least {low}" if high is None else f"{low}-{high}"
+
+
+def _olat_problems(msg_type, response):
+    """(number of questions, problems) of an OLAT text response."""
+    shape = QUESTION_SHAPES.get(msg_type, {"types": None, "options": (1, None), "correct": (None, None)})
+    blocks = question_blocks(response)
+    problems = []
+    for number, block in enumerate(blocks, start=1):
+        question = parse_olat_question(block)
+        if question is None:
+            problems.append(f"question {number}: no question type or answer options")
+            continue
+        if shape["types"] and question["type"] not in shape["types"]:
+            problems.append(f"question {number}: type {question['type']}, expected {'/'.join(shape['types'])}")
+        if not (question["question"] or question["title"]):
+            problems.append(f"question {number}: no question text")
+        options = [text for text, _ in question["choices"]]
+        correct = sum(1 for _, is_correct in question["choices"] if is_correct)
+        if _out_of_range(len(options), shape["options"]):
+            problems.append(f"question {number}: {len(options)} answer options, expected {_range_text(shape['options'])}")
+        if _out_of_range(correct, shape["correct"]):
+            problems.append(f"question {number}: {correct} correct options, expected {_range_text(shape['correct'])}")
+        if len({option.lower() for option in options}) < len(options):
+            problems.append(f"question {number}: repeated answer options")
+    return len(blocks), problems
+
+
+def _inline_fib_problems(response):
+    """(number of items, problems) of an inline_fib JSON response."""
+    try:
+        data, complete = loads_tolerant(response)
+    except json.JSONDecodeError as e:
+        return 0, [f"no JSON: {e}"]
+    problems = [] if complete else ["truncated JSON"]
+    if isinstance(data, dict): # json_object responses wrap the list, e.g. {"items": [...]}
+        data = next((value for value in data.values() if isinstance(value, list)), [data])
+    items = data if isinstance(data, list) else [data]
+    for number, item in enumerate(items, start=1):
+        if not isinstance(item, dict) or not isinstance(item.get("text"), str) or not item["text"].strip():
+            problems.append(f"item {number}: no text")
+            continue
+        blanks = item.get("blanks")
+        wrong_substitutes = item.get("wrong_substitutes")
+        if not isinstance(blanks, list) or not blanks or not all(isinstance(blank, str) and blank for blank in blanks):
+            problems.append(f"item {number}: no blanks")
+            continue
+        _, found = split_text_on_blanks(item["text"], blanks)
+        if len(found) < len(blanks):
+            problems.append(f"item {number}: {len(blanks) - len(found)} blank(s) not in the text")
+        if not isinstance(wrong_substitutes, list) or not wrong_substitutes:
+            problems.append(f"item {number}: no wrong substitutes")
+        elif {str(option).lower() for option in wrong_substitutes} & {blank.lower() for blank in blanks}:
+            problems.append(f"item {number}: a wrong substitute is also a blank")
+    return len(items), problems
+
+
+def validate_response(msg_type, response, min_questions=None, max_invalid_share=None):
+    """
+    Checks the raw response of a question type (OLAT text, or JSON for inline_fib).
+    It passes with at least 'min_questions' questions (default config.CASCADE_MIN_QUESTIONS)
+    if at most 'max_invalid_share' of them (default config.CASCADE_MAX_INVALID_SHARE) have problems.
+    """
+    min_questions = config.CASCADE_MIN_QUESTIONS if min_questions is None else min_questions
+    max_invalid_share = config.CASCADE_MAX_INVALID_SHARE if max_invalid_share is None else max_invalid_share
+    if not response or not response.strip():
+        return ValidationResult(False, 0, ["empty response"])
+
+    if msg_type == "inline_fib":
+        questions, problems = _inline_fib_problems(response)
+    else:
+        questions, problems = _olat_problems(msg_type, response)
+
+    # Problems of single questions count against the share; response-level ones always fail
+    question_problems = [problem for problem in problems if problem.startswith(("question ", "item "))]
+    fatal = [problem for problem in problems if problem not in question_problems]
+    if questions < min_questions:
+        fatal.append(f"{questions} question(s), expected at least {min_questions}")
+    invalid = len({problem.split(":")[0] for problem in question_problems})
+    ok = not fatal and invalid <= max_invalid_share * questions
+    return ValidationResult(ok, questions, fatal + question_problems)
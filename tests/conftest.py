@@ -0,0 +1,76 @@
+"""
+Shared fixtures: the mock OpenAI server from tools/ and a minimal HTTP client for it, so the
+scheduler and router can be tested against real 429/5xx responses without the OpenAI SDK.
+"""
+import json
+import os
+import sys
+import urllib.error
+import urllib.request
+
+import pytest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from core.providers.errors import ProviderError, RateLimitError, TransientProviderError, parse_retry_after # noqa: E402
+from tools.mock_openai_server import MockSettings, start_server # noqa: E402
+
+
+def _provider_error(e):
+    """Maps an error response of the mock server to the provider error the real providers raise."""
+    retry_after = parse_retry_after(e.headers)
+    if e.code == 429:
+        return RateLimitError(f"mock: {e.code}", status_code=e.code, retry_after=retry_after)
+    if e.code >= 500:
+        return TransientProviderError(f"mock: {e.code}", status_code=e.code, retry_after=retry_after)
+    return ProviderError(f"mock: {e.code}", status_code=e.code)
+
+
+def _completion_request(base_url, model_name, user_prompt, stream=False):
+    body = {"model": model_name, "messages": [{"role": "user", "content": user_prompt}], "stream": stream}
+    return urllib.request.Request(
+        f"{base_url}/chat/completions", data=json.dumps(body).encode("utf-8"), headers={"Content-Type": "application/json"}
+    )
+
+
+def post_completion(base_url, model_name="mock-model", user_prompt="Hallo"):
+    """Sends one chat completion to the mock server; maps error responses to provider errors like the real providers."""
+    try:
+        with urllib.request.urlopen(_completion_request(base_url, model_name, user_prompt), timeout=10) as response:
+            return json.load(response)["choices"][0]["message"]["content"]
+    except urllib.error.HTTPError as e:
+        raise _provider_error(e) from e
+
+
+def stream_completion(base_url, model_name="mock-model", user_prompt="Hallo"):
+    """Streamed counterpart of post_completion; yields the content deltas of the server-sent events."""
+    try:
+        response = urllib.request.urlopen(_completion_request(base_url, model_name, user_prompt, stream=True), timeout=10)
+    except urllib.error.HTTPError as e:
+        raise _provider_error(e) from e
+    with response:
+        for line in response:
+            line = line.decode("utf-8").strip()
+            if not line.startswith("data: ") or line == "data: [DONE]":
+                continue
+            choices = json.loads(line[len("data: "):])["choices"]
+            if choices and choices[0]["delta"].get("content"):
+                yield choices[0]["delta"]["content"]
+
+
+@pytest.fixture
+def mock_server():
+    """Factory starting mock servers (keyword arguments of MockSettings, no latency by default); returns (server, base_url)."""
+    servers = []
+
+    def start(**settings):
+        server, base_url = start_server(settings=MockSettings(**{"latency": 0.0, "jitter": 0.0, "seed": 1, **settings}))
+        servers.append(server)
+        return server, base_url
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,35 @@
+from PIL import Image
+
+from core import config
+from core.image_pipeline import prepare_image_for_api
+
+
+def _document_image():
+    img = Image.new("RGB", (1800, 2400), "white")
+    for x in range(0, 1800, 7):
+        img.putpixel((x, x), (0, 0, 0))
+    return img
+
+
+def test_caller_image_is_not_resized(monkeypatch):
+    monkeypatch.setattr(config, "IMAGE_CACHE_DIR", None)
+    monkeypatch.setattr(config, "IMAGE_CROP_WHITESPACE", False)
+    img = Image.new("RGB", (1800, 2400), (200, 40, 40)) # Colored, so no grayscale copy is made either
+
+    prepared = prepare_image_for_api(img)
+
+    assert img.size == (1800, 2400)
+    assert prepared["detail"] == "low"
+    assert prepared is prepare_image_for_api(img) # Cached by content
+    assert prepare_image_for_api(prepared) is prepared # Already prepared: passed through
+
+
+def test_changed_settings_miss_the_cache(monkeypatch):
+    monkeypatch.setattr(config, "IMAGE_CACHE_DIR", None)
+    img = _document_image()
+    first = prepare_image_for_api(img)
+
+    monkeypatch.setattr(config, "IMAGE_JPEG_QUALITY", config.IMAGE_JPEG_QUALITY - 20)
+    monkeypatch.setattr(config, "IMAGE_JPEG_QUALITY_TEXT", config.IMAGE_JPEG_QUALITY_TEXT - 20)
+
+    assert prepare_image_for_api(img) is not first
@@ -0,0 +1,24 @@
+import json
+
+import pytest
+
+from core.json_repair import loads_tolerant
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('Here are [3] items: [{"text":"x"}]', [{"text": "x"}]),
+    ('Sure {note}: [{"a":1}]', [{"a": 1}]),
+    ('{"items":[{"a":1}]}', {"items": [{"a": 1}]}),
+    ('x [1,2] y', [1, 2]), # No objects anywhere: the first array that parses
+])
+def test_skips_brackets_in_leading_prose(text, expected):
+    assert loads_tolerant(text) == (expected, True)
+
+
+def test_truncated_keeps_complete_elements():
+    assert loads_tolerant('Hier [Hinweis] ```json\n[{"a":1},{"b":') == ([{"a": 1}], False)
+
+
+def test_no_json_raises():
+    with pytest.raises(json.JSONDecodeError):
+        loads_tolerant("Keine Daten [Hinweis]")
@@ -0,0 +1,79 @@
+import asyncio
+
+import pytest
+
+from core import config, llm_service
+from core.providers import openai_provider
+from core.providers.errors import RateLimitError
+from core.router import Route, Router
+from core.scheduler import CircuitBreaker, RequestScheduler
+
+
+@pytest.fixture
+def openai_mock(mock_server, monkeypatch):
+    """A mock server that OPENAI_BASE_URL points at; returns (server, base_url)."""
+    server, base_url = mock_server()
+    monkeypatch.setenv("OPENAI_BASE_URL", base_url)
+    monkeypatch.setattr(config, "OPENAI_BASE_URL", base_url)
+    monkeypatch.setattr(config, "HTTP2_ENABLED", False)
+    monkeypatch.setattr(openai_provider, "_async_clients", {})
+    return server, base_url
+
+
+REQUEST = dict(api_key="key", model_name="mock-model", system_prompt="s", user_prompt="u")
+
+
+def test_generate_via_llm_async_against_the_mock_server(openai_mock, monkeypatch):
+    server, _ = openai_mock
+    router = Router([Route(**route) for route in config.LLM_ROUTES if route["name"] == "openai"])
+    scheduler = RequestScheduler(
+        requests_per_minute=6000, tokens_per_minute=10 ** 9, max_retries=0, base_delay=0.01, max_delay=0.02,
+        breaker=CircuitBreaker(100, 30.0)
+    )
+    monkeypatch.setattr(llm_service, "get_router", lambda: router)
+    monkeypatch.setattr(llm_service, "get_response_cache", lambda: None)
+    monkeypatch.setattr(llm_service, "get_scheduler", lambda: scheduler)
+
+    async def run():
+        responses = await asyncio.gather(*[llm_service.generate_via_llm_async("openai", **REQUEST) for _ in range(3)])
+        await openai_provider.close_async_clients()
+        return responses
+
+    responses = asyncio.run(run())
+
+    assert all(response.startswith("Typ\tSC") for response in responses)
+    assert server.settings.stats["completions"] == 3
+    assert scheduler.stats["requests"] == 3
+
+
+def test_async_client_is_reused_per_key_base_url_and_loop(openai_mock):
+    _, base_url = openai_mock
+
+    async def clients():
+        first = openai_provider.get_async_openai_client("key", base_url)
+        assert openai_provider.get_async_openai_client("key", base_url) is first
+        assert openai_provider.get_async_openai_client("other-key", base_url) is not first
+        assert openai_provider.get_async_openai_client("key", base_url + "/") is not first
+        await openai_provider.close_async_clients()
+        return first
+
+    # A new event loop gets its own client: httpx pools cannot be shared across loops
+    assert asyncio.run(clients()) is not asyncio.run(clients())
+
+
+def test_rate_limit_response_maps_to_rate_limit_error(openai_mock):
+    server, _ = openai_mock
+    server.settings.rate_limit_rate = 1.0
+    server.settings.retry_after = 0.25
+
+    async def run():
+        try:
+            return await openai_provider.get_openai_response_async(**REQUEST)
+        finally:
+            await openai_provider.close_async_clients()
+
+    with pytest.raises(RateLimitError) as excinfo:
+        asyncio.run(run())
+    assert excinfo.value.status_code == 429
+    assert excinfo.value.retry_after == pytest.approx(0.25)
+    assert excinfo.value.retryable
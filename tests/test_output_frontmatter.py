@@ -0,0 +1,33 @@
+from core.output_frontmatter import IncrementalJSONArrayParser, process_response
+from tools.mock_openai_server import build_content
+
+
+def test_inline_fib_json_object_response_is_unwrapped():
+    # inline_fib is requested with response_format json_object, which wraps the items: {"items": [...]}
+    response = build_content({"response_format": {"type": "json_object"}}, questions=2)
+    warnings = []
+
+    output = process_response("inline_fib", response, warnings)
+
+    ic_output, fib_output = output.split("\n---\n")
+    assert ic_output.count("Type\tInlinechoice") == 2
+    assert fib_output.count("Type\tFIB") == 2
+    assert warnings == []
+
+
+def test_inline_fib_truncated_json_object_keeps_complete_items():
+    response = build_content({"response_format": {"type": "json_object"}}, questions=2)
+    warnings = []
+
+    output = process_response("inline_fib", response[:-40], warnings)
+
+    assert output.count("Type\tFIB") == 1
+    assert any("truncated" in warning for warning in warnings)
+
+
+def test_incremental_parser_skips_arrays_without_elements():
+    parser = IncrementalJSONArrayParser()
+    text = 'Hier [Hinweis] die Liste: [{"text":"x"},{"text":"y"}]'
+    items = [item for char in text for item in parser.feed(char)]
+    assert items == [{"text": "x"}, {"text": "y"}]
+    assert parser.finished
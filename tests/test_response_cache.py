@@ -0,0 +1,21 @@
+import os
+
+from core import config, response_cache
+
+
+def test_cache_path_does_not_depend_on_the_working_directory():
+    if "OLAT_RESPONSE_CACHE_PATH" not in os.environ:
+        assert os.path.isabs(config.RESPONSE_CACHE_PATH)
+        assert os.path.dirname(os.path.dirname(config.RESPONSE_CACHE_PATH)) == config.APP_DIR
+
+
+def test_failed_open_is_remembered(monkeypatch, tmp_path, caplog):
+    blocker = tmp_path / "not-a-directory"
+    blocker.write_text("")
+    monkeypatch.setattr(config, "RESPONSE_CACHE_PATH", str(blocker / "cache.sqlite3"))
+    monkeypatch.setattr(response_cache, "_cache", None)
+    monkeypatch.setattr(response_cache, "_cache_failed", False)
+
+    assert response_cache.get_response_cache() is None
+    assert response_cache.get_response_cache() is None
+    assert len([record for record in caplog.records if "Response cache disabled" in record.message]) == 1
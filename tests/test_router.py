@@ -0,0 +1,143 @@
+import asyncio
+
+import pytest
+
+from core import config, llm_service
+from core.providers.errors import CircuitOpenError, RouteUnavailableError, TransientProviderError
+from core.providers.registry import Provider, register_provider
+from core.response_cache import ResponseCache, make_cache_key
+from core.router import Route, Router
+from core.scheduler import CircuitBreaker, RequestScheduler
+
+from conftest import post_completion, stream_completion
+
+
+def _mock_generate(api_key, model_name, system_prompt, user_prompt, images_base64_list=None, settings=None, base_url=None):
+    return post_completion(base_url, model_name, user_prompt)
+
+
+async def _mock_generate_async(api_key, model_name, system_prompt, user_prompt, images_base64_list=None, settings=None, base_url=None):
+    return await asyncio.to_thread(post_completion, base_url, model_name, user_prompt)
+
+
+def _mock_stream(api_key, model_name, system_prompt, user_prompt, images_base64_list=None, settings=None, base_url=None):
+    return stream_completion(base_url, model_name, user_prompt)
+
+
+@pytest.fixture(autouse=True)
+def mock_provider(monkeypatch):
+    register_provider("mock_http", lambda: Provider("mock_http", _mock_generate, _mock_generate_async, _mock_stream))
+    monkeypatch.setattr(config, "ROUTER_FAILURE_THRESHOLD", 3)
+    monkeypatch.setattr(config, "ROUTER_RESET_SECONDS", 0.2)
+
+
+def _scheduler(failure_threshold):
+    return RequestScheduler(
+        requests_per_minute=6000, tokens_per_minute=10 ** 9, max_retries=5, base_delay=0.01, max_delay=0.02,
+        breaker=CircuitBreaker(failure_threshold, 30.0)
+    )
+
+
+REQUEST = dict(api_key="key", model_name="mock-model", system_prompt="s", user_prompt="u")
+
+
+def test_open_route_is_retried_and_counts_as_failure(mock_server):
+    _, base_url = mock_server(server_error_rate=1.0)
+    router = Router([Route("openai", "mock_http", base_url=base_url)])
+    scheduler = _scheduler(failure_threshold=100)
+
+    with pytest.raises((TransientProviderError, RouteUnavailableError)) as excinfo:
+        scheduler.call(lambda: router.generate("openai", **REQUEST))
+
+    # All RETRY_MAX_ATTEMPTS retries are used although the route breaker opened after 3 failures
+    assert scheduler.stats["requests"] == 6
+    assert scheduler.stats["retries"] == 5
+    assert scheduler.stats["failures"] == 6
+    assert excinfo.value.retryable
+    assert router.routes[0].breaker.state in ("open", "half-open")
+
+
+def test_open_route_opens_scheduler_breaker(mock_server):
+    _, base_url = mock_server(server_error_rate=1.0)
+    router = Router([Route("openai", "mock_http", base_url=base_url)])
+    scheduler = _scheduler(failure_threshold=5)
+
+    with pytest.raises(CircuitOpenError) as excinfo:
+        scheduler.call(lambda: router.generate("openai", **REQUEST))
+
+    # The fifth failure (route skipped or route probe failed) opens the scheduler's own breaker
+    assert not isinstance(excinfo.value, RouteUnavailableError)
+    assert scheduler.breaker.state == "open"
+    assert scheduler.stats["failures"] == 5
+    assert scheduler.stats["rejected"] == 1
+
+
+def test_route_unavailable_waits_out_cooldown():
+    route = Route("openai", "mock_http", base_url="http://127.0.0.1:9/v1")
+    for _ in range(config.ROUTER_FAILURE_THRESHOLD):
+        route.breaker.record_failure()
+    router = Router([route])
+
+    with pytest.raises(RouteUnavailableError) as excinfo:
+        router.generate("openai", **REQUEST)
+    assert excinfo.value.retryable
+    assert 0 < excinfo.value.retry_after <= config.ROUTER_RESET_SECONDS
+
+
+def test_failover_answer_is_cached_under_the_answering_route(mock_server, monkeypatch, tmp_path):
+    _, failing_url = mock_server(server_error_rate=1.0)
+    _, healthy_url = mock_server()
+    router = Router([
+        Route("openai", "mock_http", base_url=failing_url),
+        Route("local", "mock_http", base_url=healthy_url, model="local-model"),
+    ], hedging=False)
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"), ttl_seconds=3600, max_bytes=10 ** 6)
+    scheduler = RequestScheduler(
+        requests_per_minute=6000, tokens_per_minute=10 ** 9, max_retries=0, base_delay=0.01, max_delay=0.02,
+        breaker=CircuitBreaker(100, 30.0)
+    )
+    monkeypatch.setattr(llm_service, "get_router", lambda: router)
+    monkeypatch.setattr(llm_service, "get_response_cache", lambda: cache)
+    monkeypatch.setattr(llm_service, "get_scheduler", lambda: scheduler)
+
+    response = llm_service.generate_via_llm("openai", **REQUEST)
+
+    assert router.stats["failovers"] == 1
+    assert cache.get(make_cache_key("openai", "mock-model", "s", "u")) is None
+    assert cache.get(make_cache_key("local", "local-model", "s", "u")) == response
+    # The next request for the primary route is not served the fallback's answer
+    assert llm_service.generate_via_llm("openai", **REQUEST) == response
+    assert router.stats["requests"] == 2
+
+
+def test_hedge_wins_and_the_slower_attempt_is_cancelled(mock_server, monkeypatch):
+    monkeypatch.setattr(config, "ROUTER_HEDGE_DEFAULT_DELAY", 0.05)
+    _, slow_url = mock_server(latency=1.0)
+    _, fast_url = mock_server()
+    router = Router([Route("openai", "mock_http", base_url=slow_url), Route("local", "mock_http", base_url=fast_url)])
+
+    response, route = asyncio.run(router.generate_async("openai", **REQUEST))
+
+    assert response and route.name == "local"
+    slow, fast = router.routes
+    assert router.stats["hedged"] == 1
+    assert fast.stats["hedges"] == fast.stats["hedge_wins"] == 1
+    assert slow.stats["cancelled"] == 1
+    assert slow.stats["failures"] == 0 # A cancelled loser is not a failure of its route
+    assert slow.breaker.state == "closed" and not slow.breaker.probe_in_flight
+
+
+def test_stream_fails_over_before_the_first_chunk(mock_server):
+    failing_server, failing_url = mock_server(server_error_rate=1.0)
+    _, healthy_url = mock_server()
+    router = Router([Route("openai", "mock_http", base_url=failing_url), Route("local", "mock_http", base_url=healthy_url)])
+
+    first_delta, stream, route = router.open_stream("openai", **REQUEST)
+    response = first_delta + "".join(stream)
+
+    assert route.name == "local"
+    assert response.startswith("Typ\tSC")
+    assert router.stats["failovers"] == 1
+    assert router.routes[0].stats["failures"] == 1
+    assert router.routes[1].stats["successes"] == 1
+    assert failing_server.settings.stats["server_errors"] == 1
@@ -0,0 +1,164 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from core.providers.errors import CircuitOpenError, RateLimitError, TransientProviderError
+from core.scheduler import CircuitBreaker, RequestScheduler
+
+from conftest import post_completion
+
+
+def _scheduler(max_retries=5, base_delay=0.01, max_delay=0.05, failure_threshold=100, reset_seconds=30.0, requests_per_minute=6000):
+    return RequestScheduler(
+        requests_per_minute=requests_per_minute, tokens_per_minute=10 ** 9, max_retries=max_retries,
+        base_delay=base_delay, max_delay=max_delay, breaker=CircuitBreaker(failure_threshold, reset_seconds)
+    )
+
+
+def test_retry_after_pauses_the_queue(mock_server):
+    server, base_url = mock_server(rate_limit_rate=1.0, retry_after=0.3)
+    scheduler = _scheduler(max_retries=1)
+    started = time.monotonic()
+
+    with pytest.raises(RateLimitError) as excinfo:
+        scheduler.call(lambda: post_completion(base_url))
+
+    assert excinfo.value.retry_after == pytest.approx(0.3)
+    # The 429's Retry-After pauses every queued request, and the retry waited for it
+    assert scheduler.paused_until >= started + 0.3
+    assert time.monotonic() - started >= 0.3
+    assert scheduler.stats["rate_limited"] == 2
+    assert server.settings.stats["rate_limited"] == 2
+    # Busy is not broken: rate limits leave the circuit closed
+    assert scheduler.breaker.state == "closed"
+
+
+def test_backoff_is_exponential_with_full_jitter():
+    scheduler = _scheduler(base_delay=1.0, max_delay=8.0)
+    for attempt in range(6):
+        delays = [scheduler._backoff(attempt) for _ in range(200)]
+        cap = min(8.0, 2 ** attempt)
+        assert all(0 <= delay <= cap for delay in delays)
+        assert max(delays) > cap / 2 # Spread over the whole range, not a fixed delay
+        assert min(delays) < cap / 2
+
+
+def test_retries_stop_at_the_cap(mock_server):
+    server, base_url = mock_server(server_error_rate=1.0)
+    scheduler = _scheduler(max_retries=3)
+
+    with pytest.raises(TransientProviderError):
+        scheduler.call(lambda: post_completion(base_url))
+
+    assert scheduler.stats["requests"] == 4
+    assert scheduler.stats["retries"] == 3
+    assert scheduler.stats["failures"] == 4
+    assert server.settings.stats["server_errors"] == 4
+
+
+def test_transient_failure_is_retried_until_success(mock_server):
+    server, base_url = mock_server(server_error_rate=0.5, seed=3)
+    scheduler = _scheduler()
+
+    for _ in range(10):
+        assert scheduler.call(lambda: post_completion(base_url))
+    assert scheduler.stats["retries"] == server.settings.stats["server_errors"] > 0
+
+
+def test_breaker_opens_and_lets_one_probe_through(mock_server):
+    server, base_url = mock_server(server_error_rate=1.0)
+    scheduler = _scheduler(max_retries=10, failure_threshold=3, reset_seconds=0.2)
+
+    with pytest.raises(CircuitOpenError):
+        scheduler.call(lambda: post_completion(base_url))
+    assert scheduler.breaker.state == "open"
+    assert scheduler.stats["failures"] == 3
+    assert scheduler.stats["rejected"] == 1
+    assert server.settings.stats["requests"] == 3 # Failing fast: nothing sent while open
+
+    time.sleep(0.25)
+    assert scheduler.breaker.state == "half-open"
+    scheduler.breaker.before_request() # The probe is admitted ...
+    with pytest.raises(CircuitOpenError):
+        scheduler.breaker.before_request() # ... and nothing else while it is in flight
+    scheduler.breaker.record_failure()
+    assert scheduler.breaker.state == "open" # A failed probe restarts the cooldown
+
+    time.sleep(0.25)
+    server.settings.server_error_rate = 0.0
+    assert scheduler.call(lambda: post_completion(base_url))
+    assert scheduler.breaker.state == "closed"
+
+
+def test_queue_admits_by_priority_then_fifo():
+    scheduler = _scheduler(requests_per_minute=60) # One request per second once the burst is used
+    scheduler.request_bucket.tokens = 0.0
+    admitted = []
+
+    def acquire(name, priority):
+        scheduler.acquire(0, priority)
+        admitted.append(name)
+
+    threads = []
+    for name, priority in [("batch-1", 10), ("batch-2", 10), ("interactive", 0)]:
+        threads.append(threading.Thread(target=acquire, args=(name, priority)))
+        threads[-1].start()
+        time.sleep(0.05) # Enqueued in this order
+    assert [ticket[0] for ticket in sorted(scheduler._waiters)] == [0, 10, 10]
+
+    scheduler.request_bucket.tokens = 3.0 # Release them all
+    for thread in threads:
+        thread.join(timeout=5)
+    assert admitted == ["interactive", "batch-1", "batch-2"]
+
+
+def _half_open_scheduler():
+    scheduler = _scheduler(failure_threshold=1, reset_seconds=0.05)
+    scheduler.breaker.record_failure()
+    time.sleep(0.06)
+    assert scheduler.breaker.state == "half-open"
+    return scheduler
+
+
+def test_interrupted_probe_frees_the_probe_slot():
+    scheduler = _half_open_scheduler()
+
+    def interrupted():
+        raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        scheduler.call(interrupted)
+    assert not scheduler.breaker.probe_in_flight
+    assert scheduler.call(lambda: "ok") == "ok" # The next request may probe
+    assert scheduler.breaker.state == "closed"
+
+
+def test_cancelled_probe_frees_the_probe_slot():
+    scheduler = _half_open_scheduler()
+
+    async def run():
+        task = asyncio.ensure_future(scheduler.call_async(lambda: asyncio.sleep(10)))
+        await asyncio.sleep(0.05)
+        assert scheduler.breaker.probe_in_flight
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+        async def succeed():
+            return "ok"
+        return await scheduler.call_async(succeed)
+
+    assert asyncio.run(run()) == "ok"
+    assert scheduler.breaker.state == "closed"
+
+
+def test_stats_are_counted_from_many_threads():
+    scheduler = _scheduler()
+    threads = [threading.Thread(target=lambda: [scheduler.call(lambda: None) for _ in range(200)]) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert scheduler.stats["requests"] == 1600
@@ -0,0 +1 @@
+# Development tools: mock OpenAI server and load test
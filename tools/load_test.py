@@ -0,0 +1,195 @@
+"""
+Offline load test of the generation pipeline against the mock OpenAI server.
+
+Sends --requests generations (rotating through the question types) with --concurrency
+workers through llm_service (scheduler, retries, tracing) and output post-processing, then
+reports latency percentiles, throughput, errors, token usage and scheduler counters.
+
+    python tools/load_test.py --requests 200 --concurrency 12 --rate-limit-rate 0.05
+    python tools/load_test.py --base-url http://127.0.0.1:8765/v1 --stream
+    python tools/load_test.py --slow-rate 0.05 --local-route # Hedging onto a second mock server
+    python tools/load_test.py --cascade --model gpt-4.1 --invalid-rate 0.2 # Small model first, 20% escalated
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from core import config # noqa: E402
+from tools.mock_openai_server import MockSettings, start_server # noqa: E402
+
+SAMPLE_DOCUMENT = (
+    "Die Zelle ist die kleinste Einheit des Lebens. Sie wird von einer Membran umgeben, "
+    "die den Stoffaustausch mit der Umgebung regelt. "
+) * 40
+# The mock answers OLAT requests with single-choice questions, which only these types accept
+CASCADE_MOCK_TYPES = ["single_choice", "truefalse", "inline_fib"]
+
+
+def _percentile(values, share):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(share * (len(ordered) - 1))))]
+
+
+def run_request(index, args):
+    from core.cascade import RESTART, generate_with_cascade, stream_with_cascade
+    from core.llm_service import build_llm_settings, generate_via_llm, stream_via_llm
+    from core.output_frontmatter import process_response
+    from core.prompt_builder import build_user_prompt
+
+    msg_types = CASCADE_MOCK_TYPES if args.cascade else config.MESSAGE_TYPES
+    msg_type = msg_types[index % len(msg_types)]
+    user_prompt = build_user_prompt(f"Create {msg_type} questions in the OLAT format.", SAMPLE_DOCUMENT, "", "German")
+    request = dict(
+        provider="openai",
+        api_key=args.api_key,
+        model_name=args.model,
+        system_prompt=config.SYSTEM_PROMPT_EDUCATOR,
+        user_prompt=f"{user_prompt}\n\nRequest {index}", # Unique tail: no response-cache hits, shared prompt-cache prefix
+        settings=build_llm_settings(msg_type),
+        use_cache=False
+    )
+    start = time.perf_counter()
+    first_delta_at = None
+    if args.stream:
+        deltas = []
+        for delta in stream_with_cascade(msg_type, **request) if args.cascade else stream_via_llm(**request):
+            if delta is RESTART:
+                deltas.clear()
+                continue
+            if first_delta_at is None:
+                first_delta_at = time.perf_counter() - start
+            deltas.append(delta)
+        response = "".join(deltas)
+    elif args.cascade:
+        response = generate_with_cascade(msg_type, **request)
+    else:
+        response = generate_via_llm(**request)
+    process_response(msg_type, response)
+    return time.perf_counter() - start, first_delta_at
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the generation pipeline against a mock OpenAI server.")
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=config.MAX_CONCURRENT_REQUESTS)
+    parser.add_argument("--stream", action="store_true", help="Use streamed completions.")
+    parser.add_argument("--base-url", help="Use an already running server instead of starting the mock in-process.")
+    parser.add_argument("--model", default="mock-model")
+    parser.add_argument("--api-key", default="mock-key")
+    parser.add_argument("--latency", type=float, default=0.2, help="Mock latency in seconds.")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Share of 429 responses from the mock.")
+    parser.add_argument("--server-error-rate", type=float, default=0.0, help="Share of 5xx responses from the mock.")
+    parser.add_argument("--retry-after", type=float, default=0.5, help="Retry-After seconds of mock 429 responses.")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="Share of mock completions answered after --slow-latency.")
+    parser.add_argument("--slow-latency", type=float, default=5.0, help="Seconds before a slow mock completion is answered.")
+    parser.add_argument("--local-route", action="store_true",
+                        help="Start a second mock server as the 'local' route (hedge and failover target).")
+    parser.add_argument("--no-hedge", action="store_true", help="Disable hedged requests.")
+    parser.add_argument("--cascade", action="store_true",
+                        help=f"Generate on {config.CASCADE_MODEL_NAME} first and on --model only if validation fails.")
+    parser.add_argument("--invalid-rate", type=float, default=0.0,
+                        help="Share of mock completions that fail validation (with --cascade: only the small model's).")
+    parser.add_argument("--trace-jsonl", help="Also write every span to this JSONL file.")
+    parser.add_argument("-o", "--output", help="Write the summary as JSON to this file.")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    server = None
+    base_url = args.base_url
+    if not base_url:
+        server, base_url = start_server(settings=MockSettings(
+            latency=args.latency,
+            rate_limit_rate=args.rate_limit_rate,
+            server_error_rate=args.server_error_rate,
+            retry_after=args.retry_after,
+            slow_rate=args.slow_rate,
+            slow_latency=args.slow_latency,
+            invalid_rate=args.invalid_rate,
+            invalid_model=config.CASCADE_MODEL_NAME if args.cascade else None,
+            seed=1
+        ))
+    config.OPENAI_BASE_URL = base_url
+    local_server = None
+    if args.local_route:
+        local_server, local_base_url = start_server(settings=MockSettings(latency=args.latency, seed=2))
+        config.LLM_ROUTES = config.LLM_ROUTES[:1] + [
+            {"name": "local", "provider": "openai_compatible", "base_url": local_base_url, "api_key": "local", "model": None},
+        ]
+    config.ROUTER_HEDGING_ENABLED = not args.no_hedge
+    config.RESPONSE_CACHE_ENABLED = False # Measure the provider path, not the cache
+    if args.trace_jsonl:
+        config.TRACE_JSONL_PATH = args.trace_jsonl
+
+    from core import tracing
+    from core.cascade import get_cascade_stats
+    from core.llm_service import get_router_stats, get_scheduler_stats
+
+    latencies, first_deltas, errors = [], [], []
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        futures = [executor.submit(run_request, index, args) for index in range(args.requests)]
+        for future in as_completed(futures):
+            try:
+                latency, first_delta = future.result()
+                latencies.append(latency)
+                if first_delta is not None:
+                    first_deltas.append(first_delta)
+            except Exception as e:
+                errors.append(f"{type(e).__name__}: {e}")
+    elapsed = time.perf_counter() - started
+
+    token_totals = {}
+    for (metric, labels), value in tracing.metrics.snapshot()[0].items():
+        if metric == "olat_llm_tokens_total":
+            kind = dict(labels)["kind"]
+            token_totals[kind] = token_totals.get(kind, 0) + value
+
+    summary = {
+        "base_url": base_url,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "stream": args.stream,
+        "succeeded": len(latencies),
+        "failed": len(errors),
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 3) if elapsed else None,
+        "latency_seconds": {
+            "mean": round(statistics.mean(latencies), 4) if latencies else None,
+            "p50": _percentile(latencies, 0.50),
+            "p95": _percentile(latencies, 0.95),
+            "p99": _percentile(latencies, 0.99),
+        },
+        "time_to_first_delta_p50": _percentile(first_deltas, 0.50),
+        "tokens": token_totals,
+        "prompt_cache_share": round(token_totals.get("cached", 0) / token_totals["prompt"], 3) if token_totals.get("prompt") else None,
+        "scheduler": get_scheduler_stats(),
+        "router": get_router_stats(),
+        "cascade": get_cascade_stats() if args.cascade else None,
+        "mock_server": server.settings.stats if server else None,
+        "local_mock_server": local_server.settings.stats if local_server else None,
+        "errors": sorted(set(errors))[:10],
+    }
+    print(json.dumps(summary, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+    for running in (server, local_server):
+        if running:
+            running.shutdown()
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
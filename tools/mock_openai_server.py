@@ -0,0 +1,319 @@
+"""
+Local stand-in for the OpenAI chat completions API, for offline development and load tests.
+
+Answers POST /v1/chat/completions (plain and streamed, with usage) and GET /v1/models
+with canned OLAT questions, after a configurable latency. Rate limits (429 with
+Retry-After), server errors (500/503) and slow answers (tail latency) can be injected at
+given rates. Prompt caching
+is simulated like the real API: prompt prefixes of at least 1024 tokens seen before are
+reported as cached_tokens, in 128-token steps.
+
+    python tools/mock_openai_server.py --port 8765 --latency 0.5 --rate-limit-rate 0.05
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 streamlit run app.py
+
+A second instance can stand in for a self-hosted model (the "local" route, core/router.py):
+
+    python tools/mock_openai_server.py --port 8766
+    OLAT_LOCAL_LLM_BASE_URL=http://127.0.0.1:8766/v1 streamlit run app.py
+"""
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SAMPLE_OLAT_QUESTION = (
+    "Typ\tSC\n"
+    "Title\tGrundbegriffe\n"
+    "Question\tWelche Aussage zum Thema ist korrekt?\n"
+    "Points\t1\n"
+    "1\tDie zutreffende Aussage\n"
+    "0\tEine unzutreffende Aussage\n"
+    "0\tEine weitere unzutreffende Aussage\n"
+    "0\tNoch eine unzutreffende Aussage\n"
+)
+
+SAMPLE_FIB_ITEM = {
+    "text": "Die Zelle ist die kleinste Einheit des Lebens und wird von einer Membran umgeben.",
+    "blanks": ["Zelle", "Membran"],
+    "wrong_substitutes": ["Organ", "Wand"],
+}
+
+
+PREFIX_CACHE_MIN_TOKENS = 1024
+PREFIX_CACHE_STEP = 128
+
+
+class MockSettings:
+    def __init__(self, latency=0.2, jitter=0.1, stream_chunk_delay=0.01, rate_limit_rate=0.0, server_error_rate=0.0,
+                 retry_after=1.0, questions=3, prefix_cache=True, seed=None, slow_rate=0.0, slow_latency=5.0,
+                 invalid_rate=0.0, invalid_model=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.slow_rate = slow_rate # Share of completions answered after slow_latency instead (tail latency)
+        self.slow_latency = slow_latency
+        self.stream_chunk_delay = stream_chunk_delay
+        self.rate_limit_rate = rate_limit_rate
+        self.server_error_rate = server_error_rate
+        self.retry_after = retry_after
+        self.questions = questions
+        self.invalid_rate = invalid_rate # Share of completions with a single question, which fails validation
+        self.invalid_model = invalid_model # Only completions for this model are made invalid; None = all
+        self.prefix_cache = prefix_cache
+        self.seen_prefixes = set()
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "rate_limited": 0, "server_errors": 0, "completions": 0, "slow": 0, "invalid": 0, "cached_tokens": 0}
+
+    def count(self, key, amount=1):
+        with self.lock:
+            self.stats[key] += amount
+
+    def draw(self):
+        with self.lock:
+            return self.random.random()
+
+
+def _estimate_tokens(text):
+    return max(1, len(text) // 4)
+
+
+def _prompt_blocks(messages):
+    """The prompt as (block, tokens) pairs in request order: text in 128-token blocks, one block per image."""
+    for message in messages:
+        yield message.get("role", ""), 0
+        content = message.get("content")
+        parts = [{"type": "text", "text": content}] if isinstance(content, str) else content or []
+        for part in parts:
+            if part.get("type") == "text":
+                text = part.get("text", "")
+                for start in range(0, len(text), PREFIX_CACHE_STEP * 4):
+                    block = text[start:start + PREFIX_CACHE_STEP * 4]
+                    yield block, _estimate_tokens(block)
+            elif part.get("type") == "image_url":
+                image_url = part.get("image_url", {})
+                yield image_url.get("url", ""), 85 if image_url.get("detail", "auto") == "low" else 765
+
+
+def _prompt_tokens(messages):
+    return sum(tokens for _, tokens in _prompt_blocks(messages))
+
+
+def _cached_prompt_tokens(settings, messages):
+    """Tokens of the longest prompt prefix (>= PREFIX_CACHE_MIN_TOKENS) already seen by the server."""
+    prefix_hash = hashlib.sha256()
+    tokens = cached = 0
+    prefixes = []
+    for block, block_tokens in _prompt_blocks(messages):
+        prefix_hash.update(block.encode("utf-8"))
+        tokens += block_tokens
+        prefixes.append((prefix_hash.hexdigest(), tokens))
+    with settings.lock:
+        for digest, prefix_tokens in prefixes:
+            if prefix_tokens >= PREFIX_CACHE_MIN_TOKENS and digest in settings.seen_prefixes:
+                cached = prefix_tokens
+        settings.seen_prefixes.update(digest for digest, _ in prefixes)
+    return cached
+
+
+def build_content(body, questions):
+    """Canned answer in the shape the request asks for (OLAT text, JSON object or json_schema)."""
+    response_format = (body.get("response_format") or {}).get("type")
+    if response_format == "json_schema":
+        schema = body["response_format"]["json_schema"]["schema"]
+        content = {}
+        for field, field_schema in schema.get("properties", {}).items():
+            if field_schema.get("type") == "array":
+                content[field] = [SAMPLE_FIB_ITEM] * questions
+            else:
+                content[field] = "\n".join([SAMPLE_OLAT_QUESTION] * questions)
+        return json.dumps(content, ensure_ascii=False)
+    if response_format == "json_object":
+        return json.dumps({"items": [SAMPLE_FIB_ITEM] * questions}, ensure_ascii=False)
+    return "\n".join([SAMPLE_OLAT_QUESTION] * questions)
+
+
+def make_handler(settings):
+    class MockOpenAIHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1" # Keep-alive, like the real API
+
+        def log_message(self, format, *args):
+            pass # Keep load-test output readable
+
+        def _send_json(self, status, payload, headers=None):
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path.rstrip("/").endswith("/models"):
+                self._send_json(200, {"object": "list", "data": [{"id": "mock-model", "object": "model", "owned_by": "mock"}]})
+            else:
+                self._send_json(404, {"error": {"message": "Not found", "type": "invalid_request_error"}})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            try:
+                body = json.loads(self.rfile.read(length) or b"{}")
+            except json.JSONDecodeError:
+                self._send_json(400, {"error": {"message": "Invalid JSON body", "type": "invalid_request_error"}})
+                return
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self._send_json(404, {"error": {"message": "Not found", "type": "invalid_request_error"}})
+                return
+
+            settings.count("requests")
+            draw = settings.draw()
+            if draw < settings.rate_limit_rate:
+                settings.count("rate_limited")
+                self._send_json(
+                    429,
+                    {"error": {"message": "Rate limit reached (mock)", "type": "requests", "code": "rate_limit_exceeded"}},
+                    headers={"retry-after": str(settings.retry_after)}
+                )
+                return
+            if draw < settings.rate_limit_rate + settings.server_error_rate:
+                settings.count("server_errors")
+                status = settings.random.choice([500, 503])
+                self._send_json(status, {"error": {"message": "Internal server error (mock)", "type": "server_error"}})
+                return
+
+            latency = settings.latency
+            if settings.slow_rate and settings.draw() < settings.slow_rate:
+                settings.count("slow")
+                latency = settings.slow_latency
+            time.sleep(max(0.0, latency + settings.random.uniform(-settings.jitter, settings.jitter)))
+            questions = settings.questions
+            if settings.invalid_rate and settings.invalid_model in (None, body.get("model")) and settings.draw() < settings.invalid_rate:
+                settings.count("invalid")
+                questions = 1
+            content = build_content(body, questions)
+            messages = body.get("messages", [])
+            cached_tokens = _cached_prompt_tokens(settings, messages) if settings.prefix_cache else 0
+            settings.count("cached_tokens", cached_tokens)
+            usage = {
+                "prompt_tokens": _prompt_tokens(messages),
+                "completion_tokens": _estimate_tokens(content),
+                "prompt_tokens_details": {"cached_tokens": cached_tokens},
+            }
+            usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+            completion_id = f"chatcmpl-mock-{uuid.uuid4().hex[:12]}"
+            model = body.get("model", "mock-model")
+            settings.count("completions")
+
+            if body.get("stream"):
+                self._stream(completion_id, model, content, usage, (body.get("stream_options") or {}).get("include_usage"))
+                return
+            self._send_json(200, {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": usage,
+            })
+
+        def _stream(self, completion_id, model, content, usage, include_usage):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+
+            def send_event(payload):
+                data = f"data: {payload}\n\n".encode("utf-8")
+                self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+
+            def chunk(delta, finish_reason=None, chunk_usage=None):
+                return json.dumps({
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [] if chunk_usage else [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+                    "usage": chunk_usage,
+                })
+
+            send_event(chunk({"role": "assistant", "content": ""}))
+            for start in range(0, len(content), 40):
+                send_event(chunk({"content": content[start:start + 40]}))
+                time.sleep(settings.stream_chunk_delay)
+            send_event(chunk({}, finish_reason="stop"))
+            if include_usage:
+                send_event(chunk(None, chunk_usage=usage))
+            send_event("[DONE]")
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+
+    return MockOpenAIHandler
+
+
+def start_server(host="127.0.0.1", port=0, settings=None):
+    """Starts the mock server in a daemon thread; returns (server, base_url). Port 0 picks a free port."""
+    settings = settings or MockSettings()
+    server = ThreadingHTTPServer((host, port), make_handler(settings))
+    server.daemon_threads = True
+    server.settings = settings
+    threading.Thread(target=server.serve_forever, name="mock-openai-server", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/v1"
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Local mock of the OpenAI chat completions API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds before a completion is answered.")
+    parser.add_argument("--jitter", type=float, default=0.1, help="Random +/- seconds added to the latency.")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="Share of completions answered after --slow-latency.")
+    parser.add_argument("--slow-latency", type=float, default=5.0, help="Seconds before a slow completion is answered.")
+    parser.add_argument("--stream-chunk-delay", type=float, default=0.01, help="Seconds between streamed chunks.")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Share of requests answered with 429.")
+    parser.add_argument("--server-error-rate", type=float, default=0.0, help="Share of requests answered with 500/503.")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds sent with 429 responses.")
+    parser.add_argument("--questions", type=int, default=3, help="Questions per canned answer.")
+    parser.add_argument("--invalid-rate", type=float, default=0.0, help="Share of completions with a single question (fails validation).")
+    parser.add_argument("--invalid-model", help="Only make completions for this model invalid (default: any model).")
+    parser.add_argument("--no-prefix-cache", action="store_true", help="Never report cached prompt tokens.")
+    parser.add_argument("--seed", type=int, help="Random seed for reproducible error injection.")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    settings = MockSettings(
+        latency=args.latency,
+        jitter=args.jitter,
+        slow_rate=args.slow_rate,
+        slow_latency=args.slow_latency,
+        stream_chunk_delay=args.stream_chunk_delay,
+        rate_limit_rate=args.rate_limit_rate,
+        server_error_rate=args.server_error_rate,
+        retry_after=args.retry_after,
+        questions=args.questions,
+        invalid_rate=args.invalid_rate,
+        invalid_model=args.invalid_model,
+        prefix_cache=not args.no_prefix_cache,
+        seed=args.seed
+    )
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(settings))
+    server.daemon_threads = True
+    print(f"Mock OpenAI API listening on http://{args.host}:{server.server_address[1]}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(json.dumps(settings.stats))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,114 +1,586 @@
 import streamlit as st
-from PIL import Image
+import base64
+import json
 import logging
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-from core import config
-from core.file_processor import (
-    extract_text_from_docx, 
-    process_uploaded_pdf,
-    process_image_for_api
+# File processing (Pillow, PyPDF2, python-docx, pdf2image) and the provider SDK are imported
+# on first use, so the first page renders without them; see benchmarks/startup_time.py
+from core import config, tracing
+from core.prompt_builder import read_prompt_from_md, build_user_prompt, build_combined_user_prompt, get_prompt_registry
+from core.output_frontmatter import (
+    process_response,
+    split_combined_response,
+    merge_chunk_responses,
+    replace_german_sharp_s,
+    convert_json_to_text_format,
+    IncrementalJSONArrayParser
+)
+from core.chunker import split_text_into_chunks
+from core.exporter import ExportWriter, EXPORT_FILE_SUFFIXES, EXPORT_MIME_TYPES
+from core.result_store import get_result_store, content_key, result_fingerprint
+from core.cascade import generate_with_cascade_async, stream_with_cascade, get_cascade_stats, RESTART
+from core.llm_service import (
+    generate_via_llm_async,
+    stream_via_llm,
+    run_async,
+    get_cache_stats,
+    build_llm_settings,
+    build_combined_llm_settings
 )
-from core.prompt_builder import read_prompt_from_md
-from core.output_formatter import transform_inline_fib_output, replace_german_sharp_s
-from core.llm_service import generate_via_llm
 from .info_sections import display_all_info_sections, apply_custom_css
 
+COMBINED_REQUEST = "combined" # Request key used when all selected types share one request
+_provider_prewarm_started = False
+
 
-def generate_questions_ui(user_input, learning_goals, selected_types, image_pil_object, selected_language, openai_api_key):
+def _prewarm_provider():
     """
-    Handles the UI logic for generating questions and displaying results.
-    'image_pil_object' should be a PIL Image object or None.
+    Imports the provider SDK (openai, httpx) on a background thread once per process, after
+    the first page has been rendered, so neither the cold start nor the first generation waits for it.
     """
-    all_responses = ""
-    generated_content_summary = {} # To display summary like "✔ Single Choice"
+    global _provider_prewarm_started
+    if _provider_prewarm_started:
+        return
+    _provider_prewarm_started = True
 
-    # Prepare image if present
-    base64_image_str = None
-    if image_pil_object:
+    def prewarm():
         try:
-            base64_image_str = process_image_for_api(image_pil_object)
+            from core.providers import openai_provider # noqa: F401
         except Exception as e:
-            st.error(f"Error processing image: {e}")
-            return # Stop generation if image processing fails
+            logging.warning(f"Could not preload the OpenAI provider: {e}")
 
-    images_base64_list = [base64_image_str] if base64_image_str else None
+    threading.Thread(target=prewarm, name="provider-prewarm", daemon=True).start()
 
-    with st.spinner("Generating questions... This may take a moment."):
-        for msg_type in selected_types:
-            st.write(f"Generating for type: {msg_type}...")
-            prompt_template_content = read_prompt_from_md(msg_type)
-            if not prompt_template_content:
-                st.error(f"Could not load prompt template for {msg_type}. Skipping.")
-                continue
 
-            # The user_prompt for the LLM includes the template, user's text, and learning goals
-            full_user_prompt = (
-                f"MAIN INSTRUCTIONS:\n{prompt_template_content}\n\n"
-                f"User Input: {user_input}\n\n"
-                f"Learning Goals: {learning_goals}\n\n"
-                f"Output Language: {selected_language}" # Explicitly pass selected language
-            )
-            
-            llm_settings = {
-                "temperature": config.DEFAULT_TEMPERATURE,
-                "max_tokens": config.DEFAULT_MAX_TOKENS,
-            }
-            # If the prompt type is expected to be JSON (e.g. inline_fib), set response_format
-            if msg_type == "inline_fib":
-                 llm_settings["response_format"] = {"type": "json_object"}
+async def _generate_with_usage(request_kwargs, cascade_type=None):
+    # Collected inside the task, since the shared event loop does not see the worker's context
+    with tracing.collect_usage() as usage:
+        if cascade_type:
+            response = await generate_with_cascade_async(cascade_type, **request_kwargs)
+        else:
+            response = await generate_via_llm_async(**request_kwargs)
+    return response, usage
 
 
-            try:
-                response = generate_via_llm(
-                    provider="openai",
-                    api_key=openai_api_key,
-                    model_name=config.DEFAULT_MODEL_NAME,
-                    system_prompt=config.SYSTEM_PROMPT_EDUCATOR, # Using the global system prompt
-                    user_prompt=full_user_prompt,
-                    images_base64_list=images_base64_list,
-                    settings=llm_settings
+def _run_request_worker(request_key, request_kwargs, events, stream, cascade_type=None):
+    """
+    Worker executed in the thread pool: performs a single LLM request and reports
+    (request_key, "delta" | "restart" | "usage" | "done" | "error", payload) events for it to the 'events' queue.
+    Must not call any Streamlit functions, those are only valid on the script thread.
+    Non-streaming calls run on the shared event loop, so all workers reuse the pooled async client.
+    With a 'cascade_type' (the request's question type), the request goes through the model cascade;
+    "restart" reports that the streamed output so far was rejected and the large model starts over.
+    """
+    try:
+        if stream:
+            deltas = []
+            with tracing.collect_usage() as usage:
+                stream_deltas = stream_with_cascade(cascade_type, **request_kwargs) if cascade_type else stream_via_llm(**request_kwargs)
+                for delta in stream_deltas:
+                    if delta is RESTART:
+                        deltas.clear()
+                        events.put((request_key, "restart", None))
+                        continue
+                    deltas.append(delta)
+                    events.put((request_key, "delta", delta))
+            response = "".join(deltas)
+        else:
+            response, usage = run_async(_generate_with_usage(request_kwargs, cascade_type))
+        events.put((request_key, "usage", usage))
+        events.put((request_key, "done", response))
+    except Exception as e:
+        events.put((request_key, "error", e))
+
+
+class _LiveTypeView:
+    """
+    Live preview of a streaming question type. Raw text is shown as it arrives; for inline_fib
+    every complete JSON element is converted to Inlinechoice/FIB blocks before the stream ends.
+    """
+    RENDER_INTERVAL = 0.25 # Seconds between re-renders, keeps large outputs cheap to display
+
+    def __init__(self, msg_type, label):
+        self.msg_type = msg_type
+        self.reset()
+        with st.expander(f"{label} (live)", expanded=False):
+            self.placeholder = st.empty()
+
+    def reset(self):
+        """Discards the output so far, e.g. when the model cascade escalates to the large model."""
+        self.text = ""
+        self.fib_blocks = []
+        self.ic_blocks = []
+        self.parser = IncrementalJSONArrayParser() if self.msg_type == "inline_fib" else None
+        self.last_render = 0.0
+
+    def add(self, delta):
+        self.text += delta
+        if self.parser:
+            items = self.parser.feed(delta)
+            if items:
+                # Skipped items are reported once the final response is processed
+                fib_output, ic_output = convert_json_to_text_format(items, warnings=[])
+                self.fib_blocks.append(fib_output)
+                self.ic_blocks.append(ic_output)
+        if time.monotonic() - self.last_render >= self.RENDER_INTERVAL:
+            self.render()
+
+    def render(self):
+        self.last_render = time.monotonic()
+        if self.parser:
+            ic_output = "\n\n".join(self.ic_blocks)
+            fib_output = "\n\n".join(self.fib_blocks)
+            self.placeholder.text(replace_german_sharp_s(f"{ic_output}\n---\n{fib_output}") if self.ic_blocks else "...")
+        else:
+            self.placeholder.text(self.text)
+
+    def finish(self, processed_response):
+        self.placeholder.text(processed_response)
+
+
+def generate_questions_ui(user_input, learning_goals, selected_types, image_pil_object, selected_language, openai_api_key, max_concurrency=None, use_cache=True, stream=False, combined=False, result_scope=None, cascade=False):
+    """
+    Handles the UI logic for generating questions and displaying results.
+    'image_pil_object' should be a PIL Image object, a prepared image (PDF page),
+    a list of those (text PDF with scanned pages) or None.
+    All selected question types are requested concurrently (bounded by 'max_concurrency',
+    defaulting to config.MAX_CONCURRENT_REQUESTS); results are reported as they finish,
+    while the download keeps the order of 'selected_types'.
+    Texts longer than config.CHUNK_MAX_INPUT_TOKENS are split into chunks that are generated
+    in parallel; the questions of all chunks are deduplicated and merged per type.
+    With 'use_cache' False, cached responses are ignored and regenerated.
+    With 'stream' True, every type's output is rendered live while it is generated.
+    With 'combined' True, the document is sent once and all types are generated in a single
+    request with a JSON schema output, which is then split into the per-type outputs.
+    With a 'result_scope' (file key, page), processed responses are kept in the session's
+    result store; types whose inputs did not change since are shown from there, not requested.
+    With 'cascade' True, each type is generated on config.CASCADE_MODEL_NAME first and only
+    generated again on the default model if its output fails validation (not in combined mode).
+    """
+    processed_responses = {} # msg_type -> processed response, for the live views
+    generated_content_summary = {} # To display summary like "✔ Single Choice"
+
+    # Prepare image(s) if present
+    images = image_pil_object if isinstance(image_pil_object, list) else [image_pil_object] if image_pil_object else []
+    try:
+        if images:
+            from core.image_pipeline import prepare_image_for_api
+        images_base64_list = [prepare_image_for_api(image) for image in images] or None
+    except Exception as e:
+        st.error(f"Error processing image: {e}")
+        return # Stop generation if image processing fails
+
+    # Long documents are split into chunks that are generated separately and merged per type
+    chunks = split_text_into_chunks(user_input, config.CHUNK_MAX_INPUT_TOKENS) or [user_input]
+    if len(chunks) > 1:
+        st.info(f"Der Text ist lang und wird in {len(chunks)} Teilen verarbeitet; die Fragen werden anschliessend zusammengeführt.")
+
+    # Build all requests up front on the script thread (prompt loading uses Streamlit caching)
+    templates = {}
+    for msg_type in selected_types:
+        prompt_template_content = read_prompt_from_md(msg_type)
+        if not prompt_template_content:
+            st.error(f"Could not load prompt template for {msg_type}. Skipping.")
+            continue
+        templates[msg_type] = prompt_template_content
+
+    # Only types whose inputs changed since the last run of this scope are requested again
+    store = get_result_store() if result_scope else None
+    fingerprints = {
+        msg_type: _type_fingerprint(msg_type, prompt_template_content, user_input, learning_goals, selected_language, images_base64_list, cascade)
+        for msg_type, prompt_template_content in templates.items()
+    } if store else {}
+    unchanged_responses = {}
+    if store and use_cache:
+        for msg_type in templates:
+            stored_response = store.get_response(*result_scope, msg_type, fingerprints[msg_type])
+            if stored_response is not None:
+                unchanged_responses[msg_type] = stored_response
+        templates = {msg_type: content for msg_type, content in templates.items() if msg_type not in unchanged_responses}
+
+    request_defaults = dict(
+        provider="openai",
+        api_key=openai_api_key,
+        model_name=config.DEFAULT_MODEL_NAME,
+        system_prompt=config.SYSTEM_PROMPT_EDUCATOR, # Using the global system prompt
+        images_base64_list=images_base64_list,
+        use_cache=use_cache
+    )
+    # Requests are keyed by (msg_type or COMBINED_REQUEST, chunk index)
+    pending_requests = {}
+    for chunk_index, chunk in enumerate(chunks):
+        if combined and len(templates) > 1:
+            pending_requests[(COMBINED_REQUEST, chunk_index)] = dict(
+                user_prompt=build_combined_user_prompt(templates, chunk, learning_goals, selected_language),
+                settings=build_combined_llm_settings(list(templates)),
+                **request_defaults
+            )
+        else:
+            for msg_type, prompt_template_content in templates.items():
+                # The user_prompt starts with the shared document and ends with the type's template,
+                # so all types of this chunk share one cacheable prefix
+                pending_requests[(msg_type, chunk_index)] = dict(
+                    user_prompt=build_user_prompt(prompt_template_content, chunk, learning_goals, selected_language),
+                    settings=build_llm_settings(msg_type),
+                    **request_defaults
                 )
 
-                if response:
-                    processed_response = ""
-                    if msg_type == "inline_fib":
-                        # transform_inline_fib_output handles JSON parsing and formatting
-                        processed_response = transform_inline_fib_output(response)
-                        # The raw JSON response might also be useful for debugging
-                        # st.text(f"Raw JSON response for {msg_type}:")
-                        # st.code(response, language='json')
+    if not pending_requests and not unchanged_responses:
+        return
+
+    export_writer = ExportWriter() # Processed responses are spooled here as they finish, exported in selected order
+    type_order = {msg_type: idx for idx, msg_type in enumerate(selected_types)}
+
+    max_workers = max(1, min(max_concurrency or config.MAX_CONCURRENT_REQUESTS, len(pending_requests) or 1))
+    chunk_responses = {msg_type: {} for msg_type in templates} # msg_type -> {chunk index: raw response or None}
+
+    def finish_type(msg_type):
+        """Merges the chunk responses of a type once all of them arrived, then post-processes them."""
+        summary_title = msg_type.replace('_', ' ').title()
+        responses = [chunk_responses[msg_type][idx] for idx in range(len(chunks)) if chunk_responses[msg_type][idx]]
+        if not responses:
+            st.error(f"Failed to generate a response for {msg_type}.")
+            generated_content_summary[summary_title] = False # Mark as failed
+        else:
+            conversion_warnings = []
+            response = merge_chunk_responses(msg_type, responses, conversion_warnings) if len(responses) > 1 else responses[0]
+            processed_response = process_response(msg_type, response, conversion_warnings)
+            for warning in conversion_warnings:
+                st.warning(f"{msg_type}: {warning}")
+            export_writer.add(msg_type, processed_response, sort_key=(type_order[msg_type],))
+            if store:
+                store.set_response(*result_scope, msg_type, fingerprints[msg_type], processed_response)
+            if stream and len(chunks) == 1:
+                processed_responses[msg_type] = processed_response # Shown in the live view
+            generated_content_summary[summary_title] = True # Mark as successful
+        # Stream the summary line for this type as soon as it is done
+        st.write(f"{'✔' if generated_content_summary[summary_title] else '❌'} {summary_title}")
+
+    st.subheader("Generation Summary:")
+    for msg_type in selected_types:
+        if msg_type in unchanged_responses:
+            export_writer.add(msg_type, unchanged_responses[msg_type], sort_key=(type_order[msg_type],))
+            st.write(f"✔ {msg_type.replace('_', ' ').title()} (unverändert, aus dieser Sitzung)")
+
+    token_usage = {"prompt": 0, "completion": 0, "cached": 0} # Summed over all requests of this run
+    with st.spinner(f"Generating {len(pending_requests)} request(s)... This may take a moment."):
+        events = queue.Queue()
+        live_views = {}
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm-request") as executor:
+            for request_key, request_kwargs in pending_requests.items():
+                if stream:
+                    request_type, chunk_index = request_key
+                    label = request_type.replace('_', ' ').title()
+                    if len(chunks) > 1:
+                        label += f" – Teil {chunk_index + 1}/{len(chunks)}"
+                    live_views[request_key] = _LiveTypeView(request_type, label)
+                cascade_type = request_key[0] if cascade and request_key[0] != COMBINED_REQUEST else None
+                executor.submit(_run_request_worker, request_key, request_kwargs, events, stream, cascade_type)
+
+            # Rendering and post-processing happen here on the script thread, in completion order
+            remaining = len(pending_requests)
+            while remaining:
+                request_key, kind, payload = events.get()
+                if kind == "delta":
+                    live_views[request_key].add(payload)
+                    continue
+                if kind == "restart":
+                    live_views[request_key].reset()
+                    continue
+                if kind == "usage":
+                    for usage_kind, count in payload.items():
+                        token_usage[usage_kind] += count
+                    continue
+
+                remaining -= 1
+                request_type, chunk_index = request_key
+                # A combined request covers every selected type
+                result_types = list(templates) if request_type == COMBINED_REQUEST else [request_type]
+                responses = {}
+                try:
+                    if kind == "error":
+                        raise payload
+                    if request_type == COMBINED_REQUEST:
+                        responses = split_combined_response(payload, result_types) if payload else {}
                     else:
-                        # For other types, apply general cleaning
-                        processed_response = replace_german_sharp_s(response)
-                    
-                    generated_content_summary[f"{msg_type.replace('_', ' ').title()}"] = True # Mark as successful
-                    all_responses += f"--- {msg_type.upper()} ---\n{processed_response}\n\n"
-                else:
-                    st.error(f"Failed to generate a response for {msg_type}.")
-                    generated_content_summary[f"{msg_type.replace('_', ' ').title()}"] = False # Mark as failed
-            
-            except ConnectionError as e: # Specific error from llm_service for provider issues
-                st.error(f"API Error for {msg_type}: {e}")
-                generated_content_summary[f"{msg_type.replace('_', ' ').title()}"] = False
-            except ValueError as e: # For unsupported provider or other llm_service errors
-                st.error(f"Configuration Error for {msg_type}: {e}")
-                generated_content_summary[f"{msg_type.replace('_', ' ').title()}"] = False
+                        responses = {request_type: payload} if payload else {}
+                except ConnectionError as e: # Specific error from llm_service for provider issues
+                    st.error(f"API Error for {request_type}: {e}")
+                except ValueError as e: # For unsupported provider or other llm_service errors
+                    st.error(f"Configuration Error for {request_type}: {e}")
+                except Exception as e:
+                    st.error(f"An unexpected error occurred while generating for {request_type}: {str(e)}")
+                    logging.exception(f"Error during question generation for {request_type}", exc_info=e)
+
+                for result_type in result_types:
+                    chunk_responses[result_type][chunk_index] = responses.get(result_type)
+                    if len(chunk_responses[result_type]) == len(chunks):
+                        try:
+                            finish_type(result_type)
+                        except Exception as e:
+                            st.error(f"An unexpected error occurred while processing {result_type}: {str(e)}")
+                            logging.exception(f"Error during post-processing for {result_type}", exc_info=e)
+                            generated_content_summary[result_type.replace('_', ' ').title()] = False
+                        if len(chunks) == 1 and request_type == result_type and request_key in live_views and result_type in processed_responses:
+                            live_views[request_key].finish(processed_responses[result_type])
+
+    _show_run_stats(token_usage, cascade)
+    # The exports list the types in the order they were selected, not in completion order
+    with export_writer:
+        _show_downloads(export_writer)
+
+
+def _type_fingerprint(msg_type, prompt_template_content, user_input, learning_goals, language, images_base64_list, cascade=False):
+    """Result-store fingerprint of everything a type's output depends on; images by content only."""
+    return result_fingerprint(
+        msg_type=msg_type,
+        template=prompt_template_content,
+        user_input=user_input,
+        learning_goals=learning_goals,
+        language=language,
+        images=[content_key(json.dumps(image, sort_keys=True)) for image in images_base64_list or []],
+        # A cascaded output may come from either model
+        model=f"{config.CASCADE_MODEL_NAME}>{config.DEFAULT_MODEL_NAME}" if cascade else config.DEFAULT_MODEL_NAME
+    )
+
+
+def _page_groups(prepared_images, first_page, pages_per_request, user_input):
+    """
+    Splits page images into groups of 'pages_per_request' consecutive pages:
+    first page of the group -> (last page, the group's images, the group's user input).
+    """
+    groups = {}
+    for start in range(0, len(prepared_images), max(1, pages_per_request)):
+        group_images = prepared_images[start:start + max(1, pages_per_request)]
+        group_first, group_last = first_page + start, first_page + start + len(group_images) - 1
+        page_input = user_input
+        if group_last > group_first:
+            page_input = f"{user_input}\n\n" if user_input else ""
+            page_input += f"The attached images are pages {group_first} to {group_last} of the document, in this order. Cover all of them."
+        groups[group_first] = (group_last, group_images, page_input)
+    return groups
+
+
+def _show_stored_results(result_scopes, selected_types, learning_goals, language, cascade, key):
+    """
+    Re-shows the results stored for 'result_scopes' and 'selected_types' on reruns without a
+    generate click, e.g. after a download or any other widget change. Each scope is a
+    (file key, page, user input, images) tuple; only results generated from the current inputs
+    (same fingerprint as a generate click would compute) are shown.
+    """
+    store = get_result_store()
+    type_order = {msg_type: idx for idx, msg_type in enumerate(selected_types)}
+    templates = {msg_type: read_prompt_from_md(msg_type) for msg_type in selected_types}
+    with ExportWriter() as export_writer:
+        for file_key, page, user_input, images in result_scopes:
+            try:
+                if images:
+                    from core.image_pipeline import prepare_image_for_api
+                images_base64_list = [prepare_image_for_api(image) for image in images or []] or None
             except Exception as e:
-                st.error(f"An unexpected error occurred while generating for {msg_type}: {str(e)}")
-                logging.exception(f"Error during question generation for {msg_type}")
-                generated_content_summary[f"{msg_type.replace('_', ' ').title()}"] = False
-    
+                logging.warning(f"Could not prepare images to look up stored results: {e}")
+                continue
+            for msg_type in selected_types:
+                if not templates[msg_type]:
+                    continue
+                fingerprint = _type_fingerprint(msg_type, templates[msg_type], user_input, learning_goals, language, images_base64_list, cascade)
+                stored_response = store.get_response(file_key, page, msg_type, fingerprint)
+                if stored_response is None:
+                    continue
+                heading = f"{msg_type.upper()} (Seite {page})" if isinstance(page, int) and len(result_scopes) > 1 else None
+                export_writer.add(msg_type, stored_response, sort_key=(page if isinstance(page, int) else 0, type_order[msg_type]), heading=heading)
+        if not len(export_writer):
+            return
+        st.caption("Zuletzt generierte Fragen dieser Sitzung:")
+        _show_downloads(export_writer, key=key)
+
+
+def _show_run_stats(token_usage, cascade=False):
+    """Response-cache counters, the token usage of the run that just finished and the model cascade's totals."""
+    cache_stats = get_cache_stats()
+    if cache_stats:
+        st.caption(f"Antwort-Cache: {cache_stats['hits']} Treffer / {cache_stats['misses']} Fehlzugriffe")
+    if token_usage["prompt"]:
+        # Prompt tokens the provider served from its prompt cache (shared document/image prefix)
+        st.caption(
+            f"Tokens: {token_usage['prompt']} Eingabe, davon {token_usage['cached']} aus dem Prompt-Cache "
+            f"({token_usage['cached'] / token_usage['prompt']:.0%}), {token_usage['completion']} Ausgabe"
+        )
+    cascade_stats = get_cascade_stats() if cascade else None
+    if cascade_stats and cascade_stats["accepted"] + cascade_stats["escalated"]:
+        # Process-wide totals, not only this run's
+        saved_seconds = f", ca. {cascade_stats['saved_seconds']:.0f} s" if cascade_stats["saved_seconds"] is not None else ""
+        st.caption(
+            f"Modell-Kaskade: {cascade_stats['accepted']} Antworten von {config.CASCADE_MODEL_NAME} übernommen, "
+            f"{cascade_stats['escalated']} an {config.DEFAULT_MODEL_NAME} weitergegeben; "
+            f"geschätzte Ersparnis {cascade_stats['saved_usd']:.4f} USD{saved_seconds}"
+        )
+
+
+def _show_downloads(export_writer, key=None):
+    """
+    One download button per export format; the writer lists its sections in sort_key order.
+    'key' is needed when several download rows are shown in one run.
+    """
+    if not len(export_writer):
+        return
+    export_labels = {
+        "txt": "Download All Generated Content",
+        "zip": "Download ZIP (eine Datei pro Fragetyp)",
+        "qti": "Download QTI 2.1",
+    }
+    for export_format, column in zip(config.EXPORT_FORMATS, st.columns(len(config.EXPORT_FORMATS))):
+        with export_writer.to_file(export_format) as export_file:
+            column.download_button(
+                label=export_labels[export_format],
+                data=export_file.read(),
+                file_name=f"all_generated_responses{EXPORT_FILE_SUFFIXES[export_format]}",
+                mime=EXPORT_MIME_TYPES[export_format],
+                key=f"{key}_{export_format}" if key else None
+            )
+
+
+def _page_label(first_page, last_page):
+    return f"Seite {first_page}" if first_page == last_page else f"Seiten {first_page}–{last_page}"
+
+
+def generate_all_pages_ui(page_images, first_page, user_input, learning_goals, selected_types, selected_language, openai_api_key, pages_per_request=1, max_concurrency=None, use_cache=True, file_key=None, cascade=False):
+    """
+    Bulk action for scanned PDFs: generates 'selected_types' for every page of 'page_images'
+    (prepared images, the first one being page 'first_page') in one go.
+    All page x type requests share one worker pool (bounded by 'max_concurrency', defaulting to
+    config.MAX_CONCURRENT_REQUESTS) and the scheduler's limits. With 'pages_per_request' > 1,
+    that many consecutive pages are sent as images of a single request, so the system prompt
+    and instructions are paid once per group instead of once per page.
+    Progress is shown per page; all results are merged into one export, ordered by page and type.
+    With a 'file_key', results are kept in the session's result store per (first) page and type,
+    and unchanged page x type combinations are taken from there instead of being requested.
+    With 'cascade' True, every request goes through the model cascade (see generate_questions_ui).
+    """
+    templates = {}
+    for msg_type in selected_types:
+        prompt_template_content = read_prompt_from_md(msg_type)
+        if not prompt_template_content:
+            st.error(f"Could not load prompt template for {msg_type}. Skipping.")
+            continue
+        templates[msg_type] = prompt_template_content
+    if not templates or not page_images:
+        return
+
+    from core.image_pipeline import prepare_image_for_api
+    try:
+        prepared_images = [prepare_image_for_api(image) for image in page_images]
+    except Exception as e:
+        st.error(f"Error processing image: {e}")
+        return
+
+    groups = _page_groups(prepared_images, first_page, pages_per_request, user_input) # first page -> (last page, images, input)
+
+    request_defaults = dict(
+        provider="openai",
+        api_key=openai_api_key,
+        model_name=config.DEFAULT_MODEL_NAME,
+        system_prompt=config.SYSTEM_PROMPT_EDUCATOR,
+        use_cache=use_cache
+    )
+    store = get_result_store() if file_key else None
+    # Requests are keyed by (first page of the group, msg_type)
+    pending_requests = {}
+    fingerprints = {}
+    unchanged_responses = {}
+    for group_first, (group_last, group_images, page_input) in groups.items():
+        for msg_type, prompt_template_content in templates.items():
+            if store:
+                fingerprints[(group_first, msg_type)] = _type_fingerprint(msg_type, prompt_template_content, page_input, learning_goals, selected_language, group_images, cascade)
+                stored_response = store.get_response(file_key, group_first, msg_type, fingerprints[(group_first, msg_type)]) if use_cache else None
+                if stored_response is not None:
+                    unchanged_responses[(group_first, msg_type)] = stored_response
+                    continue
+            pending_requests[(group_first, msg_type)] = dict(
+                user_prompt=build_user_prompt(prompt_template_content, page_input, learning_goals, selected_language),
+                images_base64_list=group_images,
+                settings=build_llm_settings(msg_type),
+                **request_defaults
+            )
+
+    export_writer = ExportWriter()
+    type_order = {msg_type: idx for idx, msg_type in enumerate(selected_types)}
+    max_workers = max(1, min(max_concurrency or config.MAX_CONCURRENT_REQUESTS, len(pending_requests) or 1))
+    token_usage = {"prompt": 0, "completion": 0, "cached": 0}
+    page_results = {group_first: {} for group_first in groups} # group -> {msg_type: True/False}
+    for (group_first, msg_type), stored_response in unchanged_responses.items():
+        label = _page_label(group_first, groups[group_first][0])
+        export_writer.add(msg_type, stored_response, sort_key=(group_first, type_order[msg_type]), heading=f"{msg_type.upper()} ({label})")
+        page_results[group_first][msg_type] = True
+
     st.subheader("Generation Summary:")
-    for title, success in generated_content_summary.items():
-        st.write(f"{'✔' if success else '❌'} {title}")
-
-    if all_responses:
-        st.download_button(
-            label="Download All Generated Content",
-            data=all_responses.strip(), # Remove trailing newlines
-            file_name="all_generated_responses.txt",
-            mime="text/plain"
+    if unchanged_responses:
+        st.caption(f"{len(unchanged_responses)} Seite/Fragetyp-Kombination(en) unverändert, aus dieser Sitzung übernommen.")
+    progress_bar = st.progress(0.0 if pending_requests else 1.0, text=f"0 von {len(pending_requests)} Anfragen fertig")
+    page_status = {group_first: st.empty() for group_first in groups}
+
+    def show_page_status(group_first):
+        group_last = groups[group_first][0]
+        results = page_results[group_first]
+        marks = " ".join(
+            f"{'✔' if results[msg_type] else '❌'} {msg_type.replace('_', ' ').title()}"
+            for msg_type in templates if msg_type in results
         )
+        state = "fertig" if len(results) == len(templates) else f"{len(results)}/{len(templates)}"
+        page_status[group_first].markdown(f"**{_page_label(group_first, group_last)}** ({state}) {marks}")
+
+    for group_first in groups:
+        show_page_status(group_first)
+
+    events = queue.Queue()
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm-request") as executor:
+        for request_key, request_kwargs in pending_requests.items():
+            executor.submit(_run_request_worker, request_key, request_kwargs, events, False, request_key[1] if cascade else None)
+
+        finished = 0
+        while finished < len(pending_requests):
+            request_key, kind, payload = events.get()
+            if kind == "usage":
+                for usage_kind, count in payload.items():
+                    token_usage[usage_kind] += count
+                continue
+
+            finished += 1
+            group_first, msg_type = request_key
+            label = _page_label(group_first, groups[group_first][0])
+            succeeded = False
+            try:
+                if kind == "error":
+                    raise payload
+                if payload:
+                    heading = f"{msg_type.upper()} ({label})"
+                    conversion_warnings = []
+                    processed_response = process_response(msg_type, payload, conversion_warnings)
+                    for warning in conversion_warnings:
+                        st.warning(f"{msg_type} ({label}): {warning}")
+                    export_writer.add(msg_type, processed_response, sort_key=(group_first, type_order[msg_type]), heading=heading)
+                    if store:
+                        store.set_response(file_key, group_first, msg_type, fingerprints[request_key], processed_response)
+                    succeeded = True
+            except ConnectionError as e:
+                st.error(f"API Error for {msg_type} ({label}): {e}")
+            except ValueError as e:
+                st.error(f"Configuration Error for {msg_type} ({label}): {e}")
+            except Exception as e:
+                st.error(f"An unexpected error occurred while generating {msg_type} ({label}): {str(e)}")
+                logging.exception(f"Error during question generation for {msg_type} ({label})", exc_info=e)
+            page_results[group_first][msg_type] = succeeded
+            show_page_status(group_first)
+            progress_bar.progress(finished / len(pending_requests), text=f"{finished} von {len(pending_requests)} Anfragen fertig")
+
+    _show_run_stats(token_usage, cascade)
+    with export_writer:
+        _show_downloads(export_writer)
+
 
 def run_app():
     st.set_page_config(page_title="OLAT Fragen Generator - Version Lehrmittel", page_icon="📝", layout="centered")
@@ -125,6 +597,12 @@ def run_app():
         st.markdown("Refer to Streamlit documentation for managing secrets: https://docs.streamlit.io/deploy/streamlit-community-cloud/deploy-your-app/secrets-management")
         return # Stop the app if API key is not found
 
+    # All prompt templates are loaded and validated up front; only types with a template can be selected
+    prompt_registry = get_prompt_registry()
+    available_types = prompt_registry.available()
+    if prompt_registry.missing:
+        st.warning(f"Keine Prompt-Vorlage für: {', '.join(prompt_registry.missing)}. Diese Fragetypen sind nicht verfügbar.")
+
     # Settings Section
     st.subheader("Einstellungen")
     col1, col2 = st.columns([1, 2])
@@ -135,14 +613,25 @@ def run_app():
     with col2:
         display_all_info_sections()
 
+    regenerate = st.checkbox("Neu generieren (zwischengespeicherte Antworten ignorieren)", value=False)
+    live_output = st.checkbox("Live-Ausgabe während der Generierung anzeigen", value=True)
+    combined_mode = st.checkbox("Kombinierter Modus: alle Fragetypen in einer Anfrage generieren (günstiger bei langen Texten)", value=False)
+    cascade_mode = st.checkbox(
+        f"Modell-Kaskade: zuerst {config.CASCADE_MODEL_NAME}, {config.DEFAULT_MODEL_NAME} nur für Fragetypen, deren Ausgabe die Prüfung nicht besteht",
+        value=config.CASCADE_ENABLED
+    )
+
     # File uploader
     uploaded_file = st.file_uploader("Upload a PDF, DOCX, or image file", type=["pdf", "docx", "jpg", "jpeg", "png"])
 
     text_content_from_file = ""
     # image_content_from_file is a PIL Image object if an image is uploaded or PDF page is converted
     image_content_from_file = None 
-    # images_from_pdf is a list of PIL Image objects if PDF is multi-page and non-OCR
+    # images_from_pdf is a list of prepared images (image_pipeline) if PDF is multi-page and non-OCR
     images_from_pdf = [] 
+    # attached_pdf_images holds the scanned pages of a mixed PDF, sent along with its text
+    attached_pdf_images = []
+    first_pdf_page = 1
 
     # Clear cache if a new file is uploaded (Streamlit handles this for widgets,
     # but explicit clear for @st.cache_data might be needed if inputs to cached funcs change based on file)
@@ -153,12 +642,33 @@ def run_app():
     #    st.session_state.last_uploaded_filename = uploaded_file.name
 
 
+    # Extraction results and generated questions are kept per file content in the session's
+    # result store, so reruns (any widget interaction) neither re-extract nor lose them
+    store = get_result_store()
+    file_key = None
     if uploaded_file:
         file_type = uploaded_file.type
+        file_key = content_key(uploaded_file.getvalue())
         if file_type == "application/pdf":
+            page_count = store.get("page_count", file_key)
+            if page_count is None:
+                from core.file_processor import get_pdf_page_count
+                page_count = get_pdf_page_count(uploaded_file.getvalue())
+                store.set("page_count", file_key, page_count)
+            last_pdf_page = page_count
+            if page_count > 1:
+                first_pdf_page, last_pdf_page = st.slider("Zu verarbeitender Seitenbereich:", 1, page_count, (1, page_count))
             # process_uploaded_pdf returns (text, images_list)
-            text_content_from_file, images_from_pdf = process_uploaded_pdf(uploaded_file)
-            if text_content_from_file:
+            extracted = store.get("pdf_pages", file_key, page=(first_pdf_page, last_pdf_page))
+            if extracted is None:
+                from core.file_processor import process_uploaded_pdf
+                extracted = list(process_uploaded_pdf(uploaded_file, first_pdf_page, last_pdf_page))
+                store.set("pdf_pages", file_key, extracted, page=(first_pdf_page, last_pdf_page))
+            text_content_from_file, images_from_pdf = extracted
+            if text_content_from_file and images_from_pdf:
+                attached_pdf_images, images_from_pdf = images_from_pdf, []
+                st.success(f"Text aus PDF extrahiert, {len(attached_pdf_images)} gescannte Seite(n) werden als Bilder mitgesendet. Sie können den Text im folgenden Textfeld bearbeiten.")
+            elif text_content_from_file:
                 st.success("Text aus PDF extrahiert. Sie können es nun im folgenden Textfeld bearbeiten. PDFs, die länger als 5 Seiten sind, sollten gekürzt werden.")
             elif images_from_pdf:
                 st.success(f"{len(images_from_pdf)} PDF Seite(n) zu Bildern konvertiert. Sie können nun Fragen zu jeder Seite stellen.")
@@ -166,10 +676,15 @@ def run_app():
                 st.error("Konnte PDF weder als Text noch als Bilder verarbeiten.")
         
         elif file_type == "application/vnd.openxmlformats-officedocument.wordprocessingml.document":
-            text_content_from_file = extract_text_from_docx(uploaded_file)
+            text_content_from_file = store.get("text", file_key)
+            if text_content_from_file is None:
+                from core.file_processor import extract_text_from_docx
+                text_content_from_file = extract_text_from_docx(uploaded_file)
+                store.set("text", file_key, text_content_from_file)
             st.success("Text aus DOCX erfolgreich extrahiert. Sie können ihn im Textbereich unten bearbeiten.")
         
         elif file_type.startswith('image/'):
+            from PIL import Image
             image_content_from_file = Image.open(uploaded_file)
             st.image(image_content_from_file, caption='Hochgeladenes Bild', use_column_width=True)
             st.success("Bild erfolgreich hochgeladen. Sie können nun Fragen zum Bild stellen.")
@@ -178,32 +693,71 @@ def run_app():
 
     # Main interaction area
     if images_from_pdf: # Multi-page PDF processing
-        for idx, page_image_pil in enumerate(images_from_pdf):
-            st.markdown(f"--- Seite {idx + 1} ---")
-            st.image(page_image_pil, caption=f'Seite {idx+1}', use_column_width=True)
+        if len(images_from_pdf) > 1:
+            with st.expander(f"Alle {len(images_from_pdf)} Seiten auf einmal generieren", expanded=False):
+                user_input_all = st.text_area("Anweisungen für alle Seiten (Optional):", key="text_area_all_pages")
+                learning_goals_all = st.text_area("Lernziele für alle Seiten (Optional):", key="learning_goals_all_pages")
+                selected_types_all = st.multiselect("Fragetypen für alle Seiten auswählen:", available_types, key="selected_types_all_pages")
+                pages_per_request = st.number_input(
+                    "Seiten pro Anfrage (mehrere Seiten teilen sich eine Anfrage und deren Prompt):",
+                    min_value=1, max_value=min(config.MAX_PAGES_PER_REQUEST, len(images_from_pdf)), value=1,
+                    key="pages_per_request_all_pages"
+                )
+                generate_all_pages = st.button("Fragen für alle Seiten generieren", key="generate_button_all_pages")
+            # Progress and results are shown below the expander, so they stay visible
+            if generate_all_pages:
+                if selected_types_all:
+                    generate_all_pages_ui(images_from_pdf, first_pdf_page, user_input_all, learning_goals_all, selected_types_all, selected_language, openai_api_key, pages_per_request=int(pages_per_request), use_cache=not regenerate, file_key=file_key, cascade=cascade_mode)
+                else:
+                    st.warning("Bitte wählen Sie mindestens einen Fragetyp für alle Seiten aus.")
+            elif selected_types_all:
+                groups = _page_groups(images_from_pdf, first_pdf_page, int(pages_per_request), user_input_all)
+                _show_stored_results(
+                    [(file_key, group_first, page_input, group_images) for group_first, (_, group_images, page_input) in groups.items()],
+                    selected_types_all, learning_goals_all, selected_language, cascade_mode, key="stored_all_pages"
+                )
+
+        for page_number, page_image in enumerate(images_from_pdf, start=first_pdf_page):
+            st.markdown(f"--- Seite {page_number} ---")
+            st.image(base64.b64decode(page_image["data"]), caption=f'Seite {page_number}', use_column_width=True)
             
-            user_input_page = st.text_area(f"Ihre Frage oder Anweisungen für Seite {idx+1}:", key=f"text_area_page_{idx}")
-            learning_goals_page = st.text_area(f"Lernziele für Seite {idx+1} (Optional):", key=f"learning_goals_page_{idx}")
-            selected_types_page = st.multiselect(f"Fragetypen für Seite {idx+1} auswählen:", config.MESSAGE_TYPES, key=f"selected_types_page_{idx}")
+            user_input_page = st.text_area(f"Ihre Frage oder Anweisungen für Seite {page_number}:", key=f"text_area_page_{page_number}")
+            learning_goals_page = st.text_area(f"Lernziele für Seite {page_number} (Optional):", key=f"learning_goals_page_{page_number}")
+            selected_types_page = st.multiselect(f"Fragetypen für Seite {page_number} auswählen:", available_types, key=f"selected_types_page_{page_number}")
 
-            if st.button(f"Fragen für Seite {idx+1} generieren", key=f"generate_button_page_{idx}"):
-                if (user_input_page or page_image_pil) and selected_types_page:
+            if st.button(f"Fragen für Seite {page_number} generieren", key=f"generate_button_page_{page_number}"):
+                if (user_input_page or page_image) and selected_types_page:
                     with st.container(): # Group output for this page
-                         generate_questions_ui(user_input_page, learning_goals_page, selected_types_page, page_image_pil, selected_language, openai_api_key)
+                         generate_questions_ui(user_input_page, learning_goals_page, selected_types_page, page_image, selected_language, openai_api_key, use_cache=not regenerate, stream=live_output, combined=combined_mode, result_scope=(file_key, page_number), cascade=cascade_mode)
                 elif not selected_types_page:
-                    st.warning(f"Bitte wählen Sie mindestens einen Fragetyp für Seite {idx+1} aus.")
-                else: # No user input and no image (though page_image_pil should always be there)
-                    st.warning(f"Bitte geben Sie Text ein oder stellen Sie sicher, dass das Bild für Seite {idx+1} verarbeitet wurde.")
+                    st.warning(f"Bitte wählen Sie mindestens einen Fragetyp für Seite {page_number} aus.")
+                else: # No user input and no image (though page_image should always be there)
+                    st.warning(f"Bitte geben Sie Text ein oder stellen Sie sicher, dass das Bild für Seite {page_number} verarbeitet wurde.")
+            elif selected_types_page:
+                _show_stored_results(
+                    [(file_key, page_number, user_input_page, [page_image])],
+                    selected_types_page, learning_goals_page, selected_language, cascade_mode, key=f"stored_page_{page_number}"
+                )
     
     else: # Single text input or single image processing
         user_input_main = st.text_area("Geben Sie hier Ihren Text ein oder stellen Sie eine Frage zum Bild:", value=text_content_from_file if text_content_from_file else "")
         learning_goals_main = st.text_area("Lernziele (Optional):")
-        selected_types_main = st.multiselect("Wählen Sie die zu generierenden Fragetypen aus:", config.MESSAGE_TYPES)
+        selected_types_main = st.multiselect("Wählen Sie die zu generierenden Fragetypen aus:", available_types)
+        # Pasted text is scoped by its own content hash, so results of other texts are never shown for it
+        main_scope = (file_key or content_key(user_input_main), None)
+        main_images = [image_content_from_file] if image_content_from_file else attached_pdf_images
 
         if st.button("Fragen generieren"):
             if (user_input_main or image_content_from_file) and selected_types_main:
-                generate_questions_ui(user_input_main, learning_goals_main, selected_types_main, image_content_from_file, selected_language, openai_api_key)
+                generate_questions_ui(user_input_main, learning_goals_main, selected_types_main, image_content_from_file or attached_pdf_images, selected_language, openai_api_key, use_cache=not regenerate, stream=live_output, combined=combined_mode, result_scope=main_scope, cascade=cascade_mode)
             elif not user_input_main and not image_content_from_file:
                 st.warning("Bitte geben Sie Text ein, laden Sie eine Datei hoch oder laden Sie ein Bild hoch.")
             elif not selected_types_main:
-                st.warning("Bitte wählen Sie mindestens einen Fragetyp aus.")
\ No newline at end of file
+                st.warning("Bitte wählen Sie mindestens einen Fragetyp aus.")
+        elif selected_types_main:
+            _show_stored_results(
+                [(*main_scope, user_input_main, main_images)],
+                selected_types_main, learning_goals_main, selected_language, cascade_mode, key="stored_main"
+            )
+
+    _prewarm_provider()